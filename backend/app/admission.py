@@ -0,0 +1,180 @@
+# app/admission.py
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+
+from app.metrics import CallbackMetric, Counter, Histogram, register
+
+# Voies de priorité, de la plus prioritaire à la moins prioritaire
+LANES = ("urgent", "routine", "batch")
+DEFAULT_LANE = "routine"
+
+# Prédictions traitées en même temps (au-delà, elles attendent leur tour dans leur voie)
+ADMISSION_CONCURRENCY = int(os.getenv("ADMISSION_CONCURRENCY", "32"))
+# Requêtes en attente par voie ; au-delà, 429 + Retry-After
+ADMISSION_QUEUE_LIMIT = int(os.getenv("ADMISSION_QUEUE_LIMIT", "64"))
+# Attente maximale (s) avant de renoncer (503 + Retry-After)
+ADMISSION_TIMEOUT = float(os.getenv("ADMISSION_TIMEOUT", "30"))
+# Images d'un même lot /batch en cours d'inférence en même temps (un lot n'occupe qu'une place)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))
+# Utilisateurs autorisés à la voie "urgent" (vide : tout le monde)
+ADMISSION_URGENT_USERS = {
+    name.strip() for name in os.getenv("ADMISSION_URGENT_USERS", "").split(",") if name.strip()
+}
+
+admission_wait_seconds = register(
+    Histogram("pneumonie_admission_wait_seconds", "Attente avant admission d'une prédiction", ("lane",))
+)
+admission_rejected_total = register(
+    Counter("pneumonie_admission_rejected_total", "Prédictions refusées par le contrôle d'admission", ("lane", "reason"))
+)
+
+
+class AdmissionController:
+    """
+    Contrôle d'admission devant le chemin d'inférence.
+
+    Au plus `concurrency` prédictions sont traitées en même temps ; les suivantes
+    attendent dans la file de leur voie. Une place libérée revient d'abord à la
+    voie la plus prioritaire (urgent, puis routine, puis batch). Quand la file
+    d'une voie est pleine, la requête est refusée tout de suite (429 + Retry-After,
+    estimé d'après la durée moyenne de traitement) plutôt que d'allonger l'attente
+    de toutes les autres. Tout se passe dans la boucle asyncio : pas de verrou.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = ADMISSION_CONCURRENCY,
+        queue_limit: int = ADMISSION_QUEUE_LIMIT,
+        timeout: float = ADMISSION_TIMEOUT,
+        lanes: tuple = LANES,
+    ):
+        self.concurrency = max(1, concurrency)
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self.lanes = lanes
+        self.active = 0
+        self._waiters = {lane: deque() for lane in lanes}
+        self.admitted = dict.fromkeys(lanes, 0)
+        self.rejected = dict.fromkeys(lanes, 0)
+        # Durée moyenne (lissée) d'une prédiction admise, pour estimer Retry-After
+        self.service_seconds = 1.0
+
+    def queued(self, lane: str = None) -> int:
+        if lane is not None:
+            return len(self._waiters[lane])
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.service_seconds * (self.queued() + 1) / self.concurrency))
+
+    def _reject(self, lane: str, status_code: int, reason: str, detail: str):
+        self.rejected[lane] += 1
+        admission_rejected_total.inc(lane, reason)
+        raise HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(self.retry_after())})
+
+    def check(self, lane: str):
+        """Refuse tout de suite (429) si la file de `lane` est pleine."""
+        if len(self._waiters[lane]) >= self.queue_limit:
+            self._reject(lane, 429, "queue_full", "Trop de prédictions en attente, réessayez plus tard")
+
+    async def _acquire(self, lane: str, shed: bool):
+        enqueued = time.perf_counter()
+        if self.active < self.concurrency and not self.queued():
+            self.active += 1
+        else:
+            if shed:
+                self.check(lane)
+            future = asyncio.get_running_loop().create_future()
+            self._waiters[lane].append(future)
+            try:
+                await asyncio.wait_for(future, self.timeout if shed else None)
+            except asyncio.TimeoutError:
+                self._discard(lane, future)
+                self._reject(lane, 503, "timeout", "Attente trop longue avant traitement, réessayez")
+            except BaseException:
+                # Client parti : rend la place si elle venait de nous être transmise
+                if future.done() and not future.cancelled():
+                    self._release()
+                else:
+                    self._discard(lane, future)
+                raise
+        self.admitted[lane] += 1
+        admission_wait_seconds.observe(time.perf_counter() - enqueued, lane)
+
+    def _discard(self, lane: str, future: asyncio.Future):
+        try:
+            self._waiters[lane].remove(future)
+        except ValueError:
+            pass
+
+    def _release(self):
+        # La place passe directement au premier en attente de la voie la plus prioritaire
+        for lane in self.lanes:
+            waiters = self._waiters[lane]
+            while waiters:
+                future = waiters.popleft()
+                if not future.done():
+                    future.set_result(None)
+                    return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, lane: str = DEFAULT_LANE, shed: bool = True, measure: bool = True):
+        """
+        Attend une place dans `lane` le temps du bloc. Avec `shed=False` (lot déjà
+        accepté), l'attente n'est ni bornée ni refusée. Avec `measure=False` (un lot
+        entier dans une seule place), la durée du bloc n'entre pas dans la durée
+        moyenne d'une prédiction qui sert à estimer Retry-After.
+        """
+        await self._acquire(lane, shed)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            if measure:
+                self.service_seconds = 0.9 * self.service_seconds + 0.1 * (time.perf_counter() - started)
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "queue_limit": self.queue_limit,
+            "service_seconds": round(self.service_seconds, 3),
+            "lanes": {
+                lane: {
+                    "queued": len(self._waiters[lane]),
+                    "admitted": self.admitted[lane],
+                    "rejected": self.rejected[lane],
+                }
+                for lane in self.lanes
+            },
+        }
+
+
+def resolve_lane(requested: str, username: str) -> str:
+    """Voie d'une requête : `requested` si elle existe et, pour "urgent", si l'utilisateur y a droit."""
+    if requested not in LANES or requested == "batch":
+        raise HTTPException(status_code=422, detail="priority doit valoir 'urgent' ou 'routine'")
+    if requested == "urgent" and ADMISSION_URGENT_USERS and username not in ADMISSION_URGENT_USERS:
+        return DEFAULT_LANE
+    return requested
+
+
+admission = AdmissionController()
+
+register(
+    CallbackMetric(
+        "pneumonie_admission_queued",
+        "Prédictions en attente d'admission par voie",
+        lambda: [((lane,), admission.queued(lane)) for lane in admission.lanes],
+        ("lane",),
+    )
+)
+register(CallbackMetric("pneumonie_admission_active", "Prédictions admises en cours", lambda: admission.active))
@@ -1,48 +1,82 @@
-import os
 import numpy as np
 from PIL import Image
 import torch
-from pytorch_grad_cam import GradCAM
+import torch.nn.functional as F
 from pytorch_grad_cam.utils.image import show_cam_on_image
 
-def generate_gradcam(model, input_tensor, image_pil: Image.Image, class_id: int, save_path: str):
+from app.metrics import timed
+from app.storage import store_heatmap
+
+
+class GradCAMExplainer:
     """
-    Génère une heatmap Grad-CAM pour une image donnée et la sauvegarde.
-
-    Args:
-        model: le modèle PyTorch
-        input_tensor: tenseur d'entrée transformé
-        image_pil: image d'origine (PIL)
-        class_id: classe cible pour Grad-CAM
-        save_path: chemin pour sauvegarder l'image résultante
+    Prédiction et Grad-CAM en une seule passe avant.
+
+    Le backbone convolutif est exécuté une fois sans gradient ; ses activations
+    (sortie de `features[-1]`) sont conservées et seule la tête de classification
+    (ReLU, pooling, classifier) est rejouée avec gradient. La rétropropagation
+    s'arrête donc aux activations, sans retraverser DenseNet.
+
+    Créé une fois par modèle chargé (`registry.cached`), puis réutilisé pour chaque requête.
     """
-    # Mettre sur le bon device
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    model.to(device)
-    input_tensor = input_tensor.to(device)
 
-    # Cibler la dernière couche convolutive (adapter selon le modèle)
-    try:
-        target_layer = model.backbone.features[-1]  # Pour ImprovedDenseNet121
-    except AttributeError:
-        target_layer = model.features[-1]           # Pour DenseNet121 standard
+    def __init__(self, model):
+        self.model = model
+        # ImprovedDenseNet121 encapsule le DenseNet torchvision dans `backbone`
+        backbone = getattr(model, "backbone", model)
+        self.features = backbone.features
+        self.classifier = backbone.classifier
+        self.device = next(model.parameters()).device
+
+    def __call__(self, input_tensor: torch.Tensor, class_ids=None):
+        """
+        Args:
+            input_tensor: lot (N, C, H, W) prétraité
+            class_ids: classes cibles (une par image) ; par défaut la classe prédite
+
+        Returns:
+            (probs, cams) : probabilités (N, num_classes) et heatmaps normalisées (N, H, W)
+        """
+        input_tensor = input_tensor.to(self.device)
+        with torch.no_grad():
+            activations = self.features(input_tensor)
+        activations = activations.detach().requires_grad_(True)
+
+        with torch.enable_grad():
+            # Même tête que torchvision.models.DenseNet.forward
+            out = F.relu(activations)
+            out = torch.flatten(F.adaptive_avg_pool2d(out, (1, 1)), 1)
+            logits = self.classifier(out)
+            if class_ids is None:
+                targets = logits.argmax(dim=1)
+            else:
+                targets = torch.as_tensor(class_ids, device=logits.device).reshape(-1)
+            score = logits.gather(1, targets.view(-1, 1)).sum()
+            (grads,) = torch.autograd.grad(score, activations)
+
+        weights = grads.mean(dim=(2, 3), keepdim=True)
+        cams = F.relu((weights * activations.detach()).sum(dim=1, keepdim=True))
+        cams = F.interpolate(cams, size=input_tensor.shape[-2:], mode="bilinear", align_corners=False)
+        cams = cams.squeeze(1)
+        cams = cams - cams.amin(dim=(1, 2), keepdim=True)
+        cams = cams / (cams.amax(dim=(1, 2), keepdim=True) + 1e-7)
 
-    # Initialiser GradCAM sans paramètre `device`
-    cam = GradCAM(model=model, target_layers=[target_layer])
+        probs = torch.softmax(logits.detach(), dim=1)
+        return probs.cpu(), cams.cpu().numpy()
 
-    # Générer la heatmap (1ère image du batch)
-    grayscale_cam = cam(input_tensor=input_tensor, targets=None)[0]
 
-    # Normaliser l'image d'entrée
-    image_resized = image_pil.resize((256, 256)).convert("RGB")
-    rgb_image = np.array(image_resized).astype(np.float32) / 255.0
+def save_heatmap(image_pil: Image.Image, grayscale_cam: np.ndarray, heatmap_key: str):
+    """Superpose la heatmap à l'image d'origine et l'enregistre dans le stockage sous `heatmap_key`."""
+    with timed("heatmap_overlay"):
+        # Normaliser l'image d'entrée
+        height, width = grayscale_cam.shape
+        image_resized = image_pil if image_pil.size == (width, height) else image_pil.resize((width, height))
+        image_resized = image_resized.convert("RGB")
+        rgb_image = np.array(image_resized).astype(np.float32) / 255.0
 
-    # Générer l’image superposée
-    cam_image = show_cam_on_image(rgb_image, grayscale_cam, use_rgb=True)
+        # Générer l’image superposée
+        cam_image = show_cam_on_image(rgb_image, grayscale_cam, use_rgb=True)
 
-    # Créer le dossier si nécessaire
-    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    # Sauvegarder l’image (WebP/JPEG compressé) et sa miniature
+    store_heatmap(heatmap_key, Image.fromarray(cam_image))
 
-    # Sauvegarder l’image en BGR
-    import cv2
-    cv2.imwrite(save_path, cv2.cvtColor(cam_image, cv2.COLOR_RGB2BGR))
@@ -0,0 +1,119 @@
+# app/api/ai/heatmap_jobs.py
+import asyncio
+import os
+import traceback
+from typing import Optional
+
+from app.auth import crud
+from app.cache import prediction_cache
+from app.database import SessionLocal
+from app.model import registry
+from app.storage import get_storage, heatmap_key
+from app.workers import run_heatmap
+
+# "sync" : heatmap calculée pendant /predict (comportement historique)
+# "deferred" : verdict immédiat, heatmap calculée en tâche de fond
+# "on_demand" : heatmap calculée seulement à la première consultation
+HEATMAP_MODE = os.getenv("HEATMAP_MODE", "sync")
+HEATMAP_JOB_WORKERS = int(os.getenv("HEATMAP_JOB_WORKERS", "1"))
+
+
+def _unfinished_job_ids() -> list[int]:
+    with SessionLocal() as db:
+        return crud.get_unfinished_heatmap_job_ids(db)
+
+
+def _claim_job(analysis_id: int) -> Optional[tuple[int, str, Optional[str]]]:
+    """Passe le job à "running" ; (classe, source, version du modèle), ou None s'il n'y a rien à faire."""
+    with SessionLocal() as db:
+        job = crud.get_heatmap_job(db, analysis_id)
+        if job is None or job.status == "ready":
+            return None
+        crud.update_heatmap_job(db, job, status="running")
+        return job.class_id, job.source_path, crud.get_analysis_model_version(db, analysis_id)
+
+
+def _finish_job(analysis_id: int, **fields):
+    with SessionLocal() as db:
+        job = crud.get_heatmap_job(db, analysis_id)
+        if job is not None:
+            crud.update_heatmap_job(db, job, **fields)
+
+
+class HeatmapQueue:
+    """
+    File de calcul des heatmaps, adossée à la table `heatmap_jobs`.
+
+    Les jobs sont persistés en base : au redémarrage, ceux encore `pending`/`running`
+    sont remis en file (mode "deferred"). Les calculs concurrents d'une même analyse
+    sont dédupliqués.
+    """
+
+    def __init__(self, num_workers: int = HEATMAP_JOB_WORKERS):
+        self.num_workers = max(1, num_workers)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        self._inflight: dict[int, asyncio.Task] = {}
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._consume()) for _ in range(self.num_workers)]
+        if HEATMAP_MODE == "deferred":
+            for analysis_id in await asyncio.to_thread(_unfinished_job_ids):
+                self.enqueue(analysis_id)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, analysis_id: int):
+        self._queue.put_nowait(analysis_id)
+
+    def depth(self) -> int:
+        """Jobs en attente dans la file, plus ceux en cours de calcul."""
+        queued = self._queue.qsize() if self._queue is not None else 0
+        return queued + len(self._inflight)
+
+    async def ensure(self, analysis_id: int):
+        """Lance (ou rejoint) le calcul de la heatmap de `analysis_id` et attend sa fin."""
+        task = self._inflight.get(analysis_id)
+        if task is None:
+            task = asyncio.ensure_future(self._process(analysis_id))
+            self._inflight[analysis_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(analysis_id, None))
+        # shield : le calcul continue même si le client qui l'attend se déconnecte
+        await asyncio.shield(task)
+
+    async def _consume(self):
+        while True:
+            analysis_id = await self._queue.get()
+            try:
+                await self.ensure(analysis_id)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, analysis_id: int):
+        # Accès à la base hors de la boucle asyncio
+        claimed = await asyncio.to_thread(_claim_job, analysis_id)
+        if claimed is None:
+            return
+        class_id, source_path, model_version = claimed
+        try:
+            image_bytes = await asyncio.to_thread(get_storage().get, source_path)
+            # Modèle de l'analyse s'il est encore enregistré, sinon le modèle actif
+            model = registry.find_version(model_version) or registry.active()
+            # Même clé que /predict : les prochains envois de la même radio la réutiliseront
+            key = heatmap_key(prediction_cache.key(image_bytes), prediction_cache.version(model))
+            if not await asyncio.to_thread(get_storage().exists, key):
+                await run_heatmap(image_bytes, class_id, key, model)
+        except Exception as e:
+            await asyncio.to_thread(_finish_job, analysis_id, status="failed", error=str(e))
+            raise
+        await asyncio.to_thread(_finish_job, analysis_id, status="ready", heatmap_file=key)
+
+
+heatmap_queue = HeatmapQueue()
@@ -0,0 +1,247 @@
+# app/api/ai/pipeline.py
+import hashlib
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from PIL import Image
+from torchvision.transforms import functional as TF
+
+from app.dicom import decode_pixels, is_dicom
+from app.storage import store_source_thumbnail
+from app.metrics import timed
+from app.model import ModelVersion, registry
+from app.backends import INFERENCE_BACKEND, load_backend
+from app.api.ai.generate_gradcam import GradCAMExplainer, save_heatmap
+
+# Taille d'entrée du modèle (largeur, hauteur) et normalisation ImageNet
+INPUT_SIZE = (256, 256)
+MEAN = torch.tensor([0.485, 0.456, 0.406]).view(3, 1, 1)
+STD = torch.tensor([0.229, 0.224, 0.225]).view(3, 1, 1)
+GRAYSCALE_MODES = ("1", "L", "LA", "I", "I;16", "I;16B", "I;16L", "F")
+
+# Second passage pour les cas limites : vues augmentées (TTA) et/ou ensemble de versions du registre,
+# déclenché seulement si la confiance du premier passage est inférieure à TTA_THRESHOLD
+TTA_ENABLED = os.getenv("TTA_ENABLED", "0") == "1"
+TTA_THRESHOLD = float(os.getenv("TTA_THRESHOLD", "0.7"))
+TTA_VIEWS = [view for view in os.getenv("TTA_VIEWS", "identity,hflip,crop90,crop80").split(",") if view]
+TTA_ENSEMBLE = [name for name in os.getenv("TTA_ENSEMBLE", "").split(",") if name]
+
+# Threads de décodage : PIL relâche le GIL pendant le décodage et le redimensionnement
+DECODE_THREADS = int(os.getenv("DECODE_THREADS", str(min(4, os.cpu_count() or 1))))
+_decode_pool = ThreadPoolExecutor(max_workers=DECODE_THREADS, thread_name_prefix="decode")
+
+
+def get_backend(version: ModelVersion = None):
+    """Backend de prédiction (INFERENCE_BACKEND) de `version` ; Grad-CAM reste sur le modèle eager fp32."""
+    version = version or registry.active()
+    return registry.cached(version, "backend", lambda model: load_backend(INFERENCE_BACKEND, model, version.path))
+
+
+def explainer_for(version: ModelVersion = None) -> GradCAMExplainer:
+    """Explainer Grad-CAM de `version`, gardé en mémoire tant que son modèle l'est."""
+    return registry.cached(version, "explainer", GradCAMExplainer)
+
+
+def warmup(version: ModelVersion = None) -> float:
+    """Charge modèle, backend et explainer Grad-CAM ; renvoie la durée en secondes."""
+    start = time.perf_counter()
+    version = version or registry.active()
+    get_backend(version)
+    explainer_for(version)
+    return time.perf_counter() - start
+
+
+def classify(probs: list[float]) -> dict:
+    """Traduit les probabilités d'une image en verdict, probabilité (%) et niveau de confiance."""
+    confidence = max(probs)
+    class_id = probs.index(confidence)
+    prediction_class = "PNEUMONIA" if class_id == 1 else "NORMAL"
+    return {
+        "class_id": class_id,
+        "verdict": "positive" if prediction_class == "PNEUMONIA" else "negative",
+        "probability": round(confidence * 100, 2),
+        "confidence": "high" if confidence > 0.7 else "medium" if confidence > 0.4 else "low",
+    }
+
+
+def resize_image(image: Image.Image) -> Image.Image:
+    """Ramène l'image à INPUT_SIZE, en niveaux de gris ("L") ou en RGB selon la source."""
+    if image.mode not in ("L", "RGB"):
+        image = image.convert("L" if image.mode in GRAYSCALE_MODES else "RGB")
+    if image.size != INPUT_SIZE:
+        image = image.resize(INPUT_SIZE, Image.BILINEAR)
+    return image
+
+
+def to_input_tensor(image: Image.Image) -> torch.Tensor:
+    """Tenseur normalisé (3, H, W) ; une image en niveaux de gris n'est étendue à 3 canaux qu'ici."""
+    tensor = TF.pil_to_tensor(image).float().div_(255)
+    return (tensor - MEAN) / STD
+
+
+def preprocess(image: Image.Image) -> torch.Tensor:
+    """Redimensionne et normalise une image PIL déjà décodée."""
+    return to_input_tensor(resize_image(image))
+
+
+def load_dicom(image_bytes: bytes, source_thumbnail: bool = False) -> tuple[Image.Image, torch.Tensor]:
+    """
+    Décode la première image d'un fichier DICOM : les pixels fenêtrés (float, sans
+    passage par 8 bits) vont directement dans le tenseur d'entrée ; l'image 8 bits
+    ne sert que de fond à la heatmap. Avec `source_thumbnail`, la miniature de la
+    source est écrite au passage, à partir des mêmes pixels (proportions d'origine).
+    """
+    with timed("decode"):
+        pixels = decode_pixels(image_bytes, INPUT_SIZE)
+    if source_thumbnail:
+        store_source_thumbnail(image_bytes, Image.fromarray((pixels * 255).round().astype("uint8"), "L"))
+    with timed("preprocess"):
+        tensor = torch.from_numpy(pixels).unsqueeze(0)
+        if tensor.shape[-2:] != (INPUT_SIZE[1], INPUT_SIZE[0]):
+            tensor = TF.resize(tensor, [INPUT_SIZE[1], INPUT_SIZE[0]], antialias=True).clamp_(0, 1)
+        image = Image.fromarray(tensor[0].mul(255).round().byte().numpy(), "L")
+        return image, (tensor - MEAN) / STD
+
+
+def load_image(image_bytes: bytes, source_thumbnail: bool = False) -> tuple[Image.Image, torch.Tensor]:
+    """
+    Décode une image directement à une résolution proche de l'entrée du modèle.
+
+    Pour un JPEG, le mode draft demande au décodeur une réduction DCT (1/2, 1/4, 1/8)
+    sans jamais produire la pleine résolution. L'image redimensionnée est produite
+    une seule fois : elle sert au tenseur d'entrée et au fond de la heatmap.
+
+    `source_thumbnail` : voir `load_dicom` (sans effet pour les autres formats,
+    dont la miniature est faite par `store_source`).
+
+    Returns:
+        (image redimensionnée, tenseur d'entrée normalisé)
+    """
+    if is_dicom(image_bytes):
+        return load_dicom(image_bytes, source_thumbnail)
+    with timed("decode"):
+        image = Image.open(io.BytesIO(image_bytes))
+        if image.format == "JPEG":
+            image.draft("L" if image.mode == "L" else "RGB", INPUT_SIZE)
+        image.load()
+    with timed("preprocess"):
+        resized = resize_image(image)
+        return resized, to_input_tensor(resized)
+
+
+def augment_views(tensor: torch.Tensor, views: list[str] = TTA_VIEWS) -> torch.Tensor:
+    """
+    Vues augmentées (V, 3, H, W) d'un tenseur d'entrée normalisé :
+        identity   image telle quelle
+        hflip      miroir horizontal
+        cropNN     recadrage central à NN % puis retour à INPUT_SIZE (zoom)
+    """
+    height, width = tensor.shape[-2:]
+    augmented = []
+    for view in views:
+        if view == "identity":
+            augmented.append(tensor)
+        elif view == "hflip":
+            augmented.append(torch.flip(tensor, dims=[-1]))
+        elif view.startswith("crop") and view[4:].isdigit():
+            scale = int(view[4:]) / 100
+            crop_h, crop_w = round(height * scale), round(width * scale)
+            top, left = (height - crop_h) // 2, (width - crop_w) // 2
+            augmented.append(TF.resized_crop(tensor, top, left, crop_h, crop_w, [height, width], antialias=True))
+        else:
+            raise ValueError(f"Vue TTA inconnue: {view} (choix: identity, hflip, cropNN)")
+    return torch.stack(augmented)
+
+
+def tta_versions(model: ModelVersion) -> tuple[ModelVersion, ...]:
+    """Modèles du second passage : celui de la requête, puis les versions TTA_ENSEMBLE disponibles."""
+    versions = [model]
+    for name in TTA_ENSEMBLE:
+        try:
+            version = registry.resolve(name)
+        except KeyError:
+            continue
+        if version not in versions:
+            versions.append(version)
+    return tuple(versions)
+
+
+def tta_variant(model: ModelVersion) -> str:
+    """Suffixe de version du cache de prédictions : les probabilités dépendent aussi du second passage."""
+    if not TTA_ENABLED:
+        return ""
+    versions = ",".join(version.version for version in tta_versions(model))
+    config = f"{TTA_THRESHOLD}:{','.join(TTA_VIEWS)}:{versions}"
+    return f"-tta{hashlib.sha256(config.encode()).hexdigest()[:8]}"
+
+
+def _load_source(image_bytes: bytes) -> tuple[Image.Image, torch.Tensor]:
+    return load_image(image_bytes, source_thumbnail=True)
+
+
+def decode_batch(images: list[bytes]) -> list[tuple[Image.Image, torch.Tensor]]:
+    """Décode et prétraite un lot d'images en parallèle (miniatures des sources DICOM comprises)."""
+    if len(images) == 1:
+        return [_load_source(images[0])]
+    return list(_decode_pool.map(_load_source, images))
+
+
+def predict_images(images: list[bytes], version: ModelVersion = None) -> list[list[float]]:
+    """Décode, prétraite et classe un lot d'images ; renvoie les probabilités par image."""
+    batch = torch.stack([tensor for _, tensor in decode_batch(images)])
+    backend = get_backend(version)
+    with timed("forward"):
+        probs = torch.softmax(backend(batch).float(), dim=1)
+    return probs.tolist()
+
+
+def predict_and_explain_images(
+    images: list[bytes], heatmap_keys: list[str], version: ModelVersion = None
+) -> list[list[float]]:
+    """
+    Classe un lot d'images et écrit leurs heatmaps.
+
+    Avec le backend eager, verdict et Grad-CAM sortent d'une seule passe avant.
+    Avec un autre backend, le verdict vient du backend, comme pour
+    `predict_images`, et Grad-CAM (modèle eager fp32) cible la classe qu'il a prédite.
+    """
+    decoded = decode_batch(images)
+    batch = torch.stack([tensor for _, tensor in decoded])
+    explainer = explainer_for(version)
+    if INFERENCE_BACKEND == "eager":
+        with timed("gradcam"):
+            probs, cams = explainer(batch)
+    else:
+        backend = get_backend(version)
+        with timed("forward"):
+            probs = torch.softmax(backend(batch).float(), dim=1)
+        with timed("gradcam"):
+            _, cams = explainer(batch, probs.argmax(dim=1).tolist())
+    for (image, _), cam, heatmap_key in zip(decoded, cams, heatmap_keys):
+        save_heatmap(image, cam, heatmap_key)
+    return probs.tolist()
+
+
+def render_heatmap(image_bytes: bytes, class_id: int, heatmap_key: str, version: ModelVersion = None):
+    """Décode l'image et enregistre sa heatmap Grad-CAM sous `heatmap_key`."""
+    image, tensor = _load_source(image_bytes)
+    explainer = explainer_for(version)
+    with timed("gradcam"):
+        _, cams = explainer(tensor.unsqueeze(0), [class_id])
+    save_heatmap(image, cams[0], heatmap_key)
+
+
+def predict_tta_images(images: list[bytes], versions: tuple[ModelVersion, ...]) -> list[list[float]]:
+    """
+    Probabilités moyennées sur les vues TTA_VIEWS de chaque image et sur les
+    modèles `versions` : toutes les vues du lot forment un seul tenseur, et
+    chaque modèle fait une seule passe avant.
+    """
+    views = torch.cat([augment_views(tensor, TTA_VIEWS) for _, tensor in decode_batch(images)])
+    with timed("tta_forward"):
+        probs = torch.stack([torch.softmax(get_backend(version)(views).float(), dim=1) for version in versions])
+    probs = probs.view(len(versions), len(images), len(TTA_VIEWS), -1).mean(dim=(0, 2))
+    return probs.tolist()
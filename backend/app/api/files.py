@@ -0,0 +1,72 @@
+# app/api/files.py
+import asyncio
+import hashlib
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth import crud
+from app.auth.security import Principal, get_current_principal
+from app.database import get_async_db
+from app.storage import (
+    IMMUTABLE_CACHE_CONTROL,
+    content_type,
+    get_storage,
+    is_valid_key,
+    key_digest,
+    source_key_candidates,
+)
+
+router = APIRouter(tags=["files"])
+
+# 🌐 URL publique à exposer au frontend
+base_url = "http://127.0.0.1:8000"
+
+
+def file_url(key: str) -> str:
+    return f"{base_url}/files/{key}"
+
+
+def etag(key: str) -> str:
+    # Clé adressée par le contenu : l'objet ne change jamais, la clé suffit comme validateur
+    return f'"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+
+
+async def storage_response(key: str, request: Request) -> Response:
+    """Sert un objet du stockage avec des en-têtes de cache immuables (304 si déjà en cache)."""
+    headers = {"ETag": etag(key), "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if_none_match = [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]
+    if headers["ETag"] in if_none_match or "*" in if_none_match:
+        return Response(status_code=304, headers=headers)
+    storage = get_storage()
+    path = storage.local_path(key)
+    if path is not None:
+        if not os.path.exists(path):
+            raise HTTPException(status_code=404, detail="Fichier introuvable")
+        return FileResponse(path, media_type=content_type(key), headers=headers)
+    try:
+        data = await asyncio.to_thread(storage.get, key)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Fichier introuvable")
+    return Response(content=data, media_type=content_type(key), headers=headers)
+
+
+@router.get("/{key:path}")
+async def get_file(
+    key: str,
+    request: Request,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Sert une radio, une heatmap ou une miniature à un utilisateur qui a analysé la
+    radio d'origine (404 sinon, comme pour un objet absent).
+    """
+    if not is_valid_key(key):
+        raise HTTPException(status_code=404, detail="Fichier introuvable")
+    candidates = source_key_candidates(key_digest(key))
+    if not await db.run_sync(crud.owns_source, current_user.id, candidates):
+        raise HTTPException(status_code=404, detail="Fichier introuvable")
+    return await storage_response(key, request)
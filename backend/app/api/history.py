@@ -1,45 +1,256 @@
 # app/api/history.py
-from fastapi import APIRouter, Depends
+import asyncio
+import base64
+import importlib.util
+import json
+from datetime import date, datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.auth.routes import get_current_user
-from app.auth.models import User
+from app.auth.security import Principal, get_current_principal, get_current_user
 from app.database import get_db
 from app.auth import crud
+from app.api.files import file_url
+from app.storage import thumbnail_key
+from app.events import EVENTS_HEARTBEAT_SECONDS, history_events
+from app.export import EXPORT_FORMATS, export_stream
+from app.stats import compute_stats, stats_cache
 
 from app.auth.schemas import AnalysisHistoryOut
 
 router = APIRouter(tags=["history"])
 
+base_url = "http://localhost:8000/uploads/"
+MAX_PAGE_SIZE = 500
+# Version du contenu des réponses de /history, incluse dans l'ETag : à changer quand il évolue
+HISTORY_FORMAT_VERSION = "2"
+
+
+def encode_cursor(timestamp: datetime, analysis_id: int) -> str:
+    raw = f"{timestamp.isoformat()}|{analysis_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, analysis_id = raw.split("|")
+        return datetime.fromisoformat(timestamp), int(analysis_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+
+
+def history_validators(user_id: int, latest) -> dict:
+    """
+    ETag, Last-Modified et curseur de synchronisation de l'historique, dérivés de la
+    dernière analyse de l'utilisateur : ils ne changent que si une analyse est ajoutée.
+    """
+    if latest is None:
+        return {"ETag": f'W/"h{HISTORY_FORMAT_VERSION}-{user_id}-0"', "Cache-Control": "private, no-cache"}
+    return {
+        "ETag": f'W/"h{HISTORY_FORMAT_VERSION}-{user_id}-{latest.id}-{latest.timestamp.timestamp():.6f}"',
+        "Last-Modified": format_datetime(latest.timestamp.replace(tzinfo=timezone.utc), usegmt=True),
+        "Cache-Control": "private, no-cache",
+        "X-Sync-Cursor": encode_cursor(latest.timestamp, latest.id),
+    }
+
+
+def not_modified(request: Request, headers: dict, latest) -> bool:
+    """If-None-Match (prioritaire) puis If-Modified-Since, comparés à la dernière analyse."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return headers["ETag"].removeprefix("W/") in tags or "*" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and latest is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        # Last-Modified est à la seconde près
+        return latest.timestamp.replace(tzinfo=timezone.utc, microsecond=0) <= since
+    return False
+
+
+def history_item(row) -> dict:
+    return {
+        "id": row.id,
+        "file_name": row.file_name,
+        "verdict": row.verdict,
+        "probability": row.probability,
+        "confidence": row.confidence,
+        "timestamp": row.timestamp,
+        "patient": {
+            "id": row.patient_id,
+            "nom": row.nom,
+            "prenom": row.prenom,
+            "age": row.age,
+            "sexe": row.sexe,
+        },
+        "imageUrl": file_url(row.source_key) if row.source_key else f"{base_url}{row.file_name}",
+        "thumbnailUrl": file_url(thumbnail_key(row.source_key)) if row.source_key else None,
+        "model_version": row.model_version,
+    }
+
+
 @router.get("/", response_model=list[AnalysisHistoryOut])
 def list_history(
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    since: Optional[str] = Query(None, description="curseur X-Sync-Cursor déjà reçu"),
+    verdict: Optional[str] = None,
+    confidence: Optional[str] = None,
+    min_probability: Optional[float] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    patient: Optional[str] = Query(None, description="préfixe du nom ou du prénom"),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db),
 ):
-    analyses = crud.get_user_history(db, current_user)
-    base_url = "http://localhost:8000/uploads/"
-
-    result = []
-    for a in analyses:
-        patient_dict = {
-            "id": a.patient.id,
-            "nom": a.patient.nom,
-            "prenom": a.patient.prenom,
-            "age": a.patient.age,
-            "sexe": a.patient.sexe,
-        }
-        result.append(
-            AnalysisHistoryOut(
-                id=a.id,
-                file_name=a.file_name,
-                verdict=a.verdict,
-                probability=a.probability,
-                confidence=a.confidence,
-                timestamp=a.timestamp,
-                patient=patient_dict,  # <-- passe un dict ici
-                imageUrl=f"{base_url}{a.file_name}"
-            )
+    """
+    Historique des analyses, du plus récent au plus ancien.
+
+    Avec `limit`, la réponse est une page : le curseur de la page suivante est
+    renvoyé dans l'en-tête `X-Next-Cursor` (absent sur la dernière page) et se
+    repasse tel quel dans `cursor`. Sans `limit`, tout l'historique filtré est renvoyé.
+
+    Chaque réponse porte un ETag et un Last-Modified : une requête conditionnelle
+    reçoit 304 tant qu'aucune analyse n'a été ajoutée. `X-Sync-Cursor` repassé dans
+    `since` ne renvoie que les analyses plus récentes, de la plus ancienne à la plus
+    récente (au plus `limit` ou MAX_PAGE_SIZE ; recommencer avec le nouveau
+    `X-Sync-Cursor` tant que la page est pleine).
+    """
+    latest = crud.latest_analysis(db, current_user)
+    headers = history_validators(current_user.id, latest)
+    if not_modified(request, headers, latest):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+    if since:
+        rows = crud.query_user_history(
+            db,
+            current_user,
+            limit=limit or MAX_PAGE_SIZE,
+            since=decode_cursor(since),
+            verdict=verdict,
+            confidence=confidence,
+            min_probability=min_probability,
+            date_from=date_from,
+            date_to=date_to,
+            patient_prefix=patient,
+        )
+        response.headers["X-Sync-Cursor"] = encode_cursor(rows[-1].timestamp, rows[-1].id) if rows else since
+        return [history_item(row) for row in rows]
+
+    rows = crud.query_user_history(
+        db,
+        current_user,
+        limit=limit + 1 if limit else None,
+        after=decode_cursor(cursor) if cursor else None,
+        verdict=verdict,
+        confidence=confidence,
+        min_probability=min_probability,
+        date_from=date_from,
+        date_to=date_to,
+        patient_prefix=patient,
+    )
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].timestamp, rows[-1].id)
+    return [history_item(row) for row in rows]
+
+
+@router.get("/events")
+async def history_event_stream(request: Request, current_user: Principal = Depends(get_current_principal)):
+    """
+    Server-Sent Events : `event: analyses` avec les identifiants des analyses que
+    l'utilisateur vient d'enregistrer ; le client récupère ensuite le delta avec
+    `GET /history?since=<X-Sync-Cursor>`.
+    """
+    queue = history_events.subscribe(current_user.id)
+
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            history_events.unsubscribe(current_user.id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/export")
+def export_history(
+    format: str = Query("csv", description="csv, ndjson ou parquet"),
+    gzip: bool = False,
+    verdict: Optional[str] = None,
+    confidence: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    current_user: Principal = Depends(get_current_principal),
+):
+    """
+    Exporte tout l'historique filtré en flux (CSV, NDJSON ou Parquet, gzip en option),
+    du plus récent au plus ancien, à mémoire constante quel que soit le nombre de lignes.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=422, detail=f"format doit valoir {', '.join(EXPORT_FORMATS)}")
+    if format == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        raise HTTPException(status_code=501, detail="L'export parquet nécessite le paquet pyarrow")
+
+    def build_query(db):
+        return crud.user_history_query(
+            db,
+            current_user,
+            verdict=verdict,
+            confidence=confidence,
+            date_from=date_from,
+            date_to=date_to,
         )
-    return result
+
+    filename = f"analyses-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_stream(build_query, format, compress=gzip),
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/stats", response_model=dict)
+def history_stats(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db),
+):
+    """
+    Statistiques de l'historique (totaux, verdicts, niveaux de confiance, séries
+    journalières et hebdomadaires, tranches d'âge, sexe), calculées sur la table
+    de rollup tenue à jour à chaque analyse. `date_to` est exclu.
+    """
+    key = (current_user.id, date_from, date_to)
+    stats = stats_cache.get(key)
+    if stats is None:
+        stats = compute_stats(db, current_user.id, date_from, date_to)
+        stats_cache.put(key, stats)
+    return stats
 
 
 @router.post("/", response_model=dict)
@@ -48,7 +259,7 @@ def add_history(
     verdict: str,
     probability: float,
     confidence: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     history = crud.add_analysis(
@@ -57,4 +268,4 @@ def add_history(
     return {
         "message": "Saved successfully",
         "history_id": history.id,
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,102 @@
+# app/api/metrics.py
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from app import metrics, workers
+from app.api.ai.heatmap_jobs import heatmap_queue
+from app.auth.hashing import hashing_pool
+from app.auth.security import Principal, get_current_user
+from app.cache import prediction_cache
+from app.inference import engine, explain_engine, tta_engine
+from app.model import registry
+
+router = APIRouter(tags=["metrics"])
+
+# Files d'attente et état du modèle, lus au moment de l'export
+metrics.register(
+    metrics.CallbackMetric(
+        "pneumonie_queue_depth",
+        "Éléments en attente par file",
+        lambda: [
+            (("predict",), engine.queue_depth()),
+            (("explain",), explain_engine.queue_depth()),
+            (("tta",), tta_engine.queue_depth()),
+            (("heatmap_jobs",), heatmap_queue.depth()),
+            (("password_hashing",), hashing_pool.pending),
+        ],
+        ("queue",),
+    )
+)
+metrics.register(
+    metrics.CallbackMetric(
+        "pneumonie_model_ready", "1 si le modèle est chargé dans les processus de calcul", lambda: int(workers.is_ready())
+    )
+)
+metrics.register(
+    metrics.CallbackMetric(
+        "pneumonie_model_info",
+        "Modèle actif (nom et empreinte des poids)",
+        lambda: [((registry.active().name, registry.active().version), 1)],
+        ("name", "version"),
+    )
+)
+metrics.register(
+    metrics.CallbackMetric(
+        "pneumonie_model_load_seconds",
+        "Durée de chargement du modèle par processus",
+        lambda: [((str(pid),), seconds) for pid, seconds in workers.ready_workers.items()],
+        ("pid",),
+    )
+)
+metrics.register(
+    metrics.CallbackMetric(
+        "pneumonie_prediction_cache_lookups_total",
+        "Consultations du cache de prédictions par résultat",
+        lambda: [((result,), prediction_cache.stats()[result]) for result in ("hits", "disk_hits", "misses")],
+        ("result",),
+        type="counter",
+    )
+)
+metrics.register(
+    metrics.CallbackMetric(
+        "pneumonie_prediction_cache_entries",
+        "Entrées du cache de prédictions en mémoire",
+        lambda: prediction_cache.stats()["entries"],
+    )
+)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def export_metrics():
+    """Métriques au format texte Prometheus (à scraper sur le réseau interne)."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def require_profiler():
+    if not metrics.PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@router.get("/metrics/profiler", dependencies=[Depends(require_profiler)])
+def profiler_status(current_user: Principal = Depends(get_current_user)):
+    return metrics.profiler.status()
+
+
+@router.post("/metrics/profiler/start", dependencies=[Depends(require_profiler)])
+def start_profiler(
+    interval_ms: float = Query(10.0, ge=1.0, le=1000.0),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Démarre l'échantillonnage des piles de tous les threads du processus API."""
+    metrics.profiler.start(interval_ms)
+    return metrics.profiler.status()
+
+
+@router.post("/metrics/profiler/stop", response_class=PlainTextResponse, dependencies=[Depends(require_profiler)])
+def stop_profiler(
+    limit: int = Query(None, ge=1),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Arrête le profileur et renvoie les piles au format « collapsed » (flamegraph.pl, speedscope)."""
+    metrics.profiler.stop()
+    return PlainTextResponse(metrics.profiler.collapsed(limit))
@@ -0,0 +1,83 @@
+# app/api/models.py
+import asyncio
+import os
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from app import workers
+from app.auth.schemas import ModelRegister, ShadowConfig
+from app.auth.security import Principal, get_current_user
+from app.model import DEFAULT_MODEL_NAME, load_model, registry, weights_version
+from app.shadow import shadow_evaluator
+
+router = APIRouter(prefix="/models", tags=["models"])
+
+# Utilisateurs autorisés à changer de modèle (noms séparés par des virgules)
+MODEL_ADMINS = {name.strip() for name in os.getenv("MODEL_ADMINS", "").split(",") if name.strip()}
+
+
+def require_model_admin(current_user: Principal = Depends(get_current_user)) -> Principal:
+    if current_user.username not in MODEL_ADMINS:
+        raise HTTPException(status_code=403, detail="Réservé aux administrateurs des modèles")
+    return current_user
+
+
+def resolve(name: str):
+    try:
+        return registry.resolve(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Modèle inconnu ou poids introuvables: {name}")
+
+
+@router.get("")
+def list_models(current_user: Principal = Depends(get_current_user)):
+    return {**registry.status(), "shadow_evaluation": shadow_evaluator.status()}
+
+
+@router.post("")
+async def register_model(model: ModelRegister, admin: Principal = Depends(require_model_admin)):
+    """Enregistre des poids sous `name` (sans les activer) après avoir vérifié qu'ils se chargent."""
+    if model.name == DEFAULT_MODEL_NAME:
+        raise HTTPException(status_code=400, detail=f"'{DEFAULT_MODEL_NAME}' est fixé par MODEL_PATH")
+    if not os.path.isfile(model.path):
+        raise HTTPException(status_code=400, detail=f"Fichier de poids introuvable: {model.path}")
+    try:
+        await asyncio.to_thread(load_model, model.path)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Poids invalides: {e}")
+    await asyncio.to_thread(registry.update, models={model.name: model.path})
+    return {"name": model.name, "path": model.path, "version": weights_version(model.path)}
+
+
+@router.post("/reload")
+def reload_models(admin: Principal = Depends(require_model_admin)):
+    """Relit tout de suite le registre et les fichiers de poids."""
+    registry.refresh(force=True)
+    return registry.status()
+
+
+@router.post("/{name}/activate")
+async def activate_model(name: str, admin: Principal = Depends(require_model_admin)):
+    """
+    Précharge `name` dans les processus de calcul puis en fait le modèle actif.
+    Les requêtes déjà en cours terminent avec l'ancien modèle.
+    """
+    version = resolve(name)
+    load_seconds = await asyncio.to_thread(workers.preload, version)
+    await asyncio.to_thread(registry.update, active=name)
+    return {
+        "active": name,
+        "version": version.version,
+        "load_seconds": {str(pid): round(t, 3) for pid, t in load_seconds.items()},
+    }
+
+
+@router.put("/shadow")
+async def configure_shadow(config: ShadowConfig, admin: Principal = Depends(require_model_admin)):
+    """Évalue `name` en shadow sur une fraction `rate` des prédictions (`name` nul : désactivé)."""
+    if not 0.0 <= config.rate <= 1.0:
+        raise HTTPException(status_code=422, detail="rate doit être compris entre 0 et 1")
+    if config.name is not None:
+        await asyncio.to_thread(workers.preload, resolve(config.name))
+    await asyncio.to_thread(registry.update, shadow=config.name, shadow_rate=config.rate if config.name else 0.0)
+    return registry.status()
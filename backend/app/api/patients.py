@@ -0,0 +1,41 @@
+# app/api/patients.py
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.orm import Session
+
+from app.api.history import MAX_PAGE_SIZE, decode_cursor, encode_cursor, history_item
+from app.auth import crud
+from app.auth.schemas import AnalysisHistoryOut
+from app.auth.security import Principal, get_current_principal
+from app.database import get_db
+
+router = APIRouter(prefix="/patients", tags=["patients"])
+
+
+@router.get("/{patient_id}/analyses", response_model=list[AnalysisHistoryOut])
+def patient_analyses(
+    patient_id: int,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db),
+):
+    """
+    Chronologie des analyses d'un patient par l'utilisateur, de la plus récente à
+    la plus ancienne ; même pagination que /history (`limit`, `cursor`, `X-Next-Cursor`).
+    """
+    rows = crud.query_user_history(
+        db,
+        current_user,
+        limit=limit + 1 if limit else None,
+        after=decode_cursor(cursor) if cursor else None,
+        patient_id=patient_id,
+    )
+    if not rows and cursor is None and not crud.patient_exists(db, patient_id):
+        raise HTTPException(status_code=404, detail="Patient introuvable")
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].timestamp, rows[-1].id)
+    return [history_item(row) for row in rows]
@@ -1,103 +1,476 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form
-from PIL import Image
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Optional
+import asyncio
 import io
+import json
 import time
-import torch
-from torchvision import transforms
-from app.model import model
-from sqlalchemy.orm import Session
-from app.auth.routes import get_current_user
-from app.auth.models import User
+import traceback
+import zipfile
+from app.inference import engine, explain_engine, tta_engine
+from app.cache import prediction_cache
+from app.workers import run_heatmap
+from app.api.ai.pipeline import TTA_ENABLED, TTA_THRESHOLD, classify, tta_versions
+from app.api.ai.heatmap_jobs import HEATMAP_MODE, heatmap_queue
+from app.api.files import file_url, storage_response
+from app.storage import get_storage, heatmap_key, store_source, thumbnail_key
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.auth.security import Principal, get_current_principal, get_current_user
 from app.auth import crud
 from app.auth.schemas import PatientCreate
-from app.database import get_db
-from app.api.ai.generate_gradcam import generate_gradcam  # <-- importe la fonction Grad-CAM
+from app.database import get_async_db, get_async_sessionmaker
+from app.admission import BATCH_CONCURRENCY, DEFAULT_LANE, admission, resolve_lane
+from app.dicom import DicomRejected, inspect_dicom, is_dicom
+from app.limits import BATCH_MAX_FILES, MAX_BATCH_TOTAL_BYTES, MAX_UPLOAD_BYTES, read_upload
+from app.model import registry
+from app.shadow import shadow_evaluator
+from app.metrics import errors_total, timed
 import os
 
 router = APIRouter()
 
-preprocess = transforms.Compose(
-    [
-        transforms.Resize((256, 256)),
-        transforms.ToTensor(),
-        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
-    ]
-)
+# 🌐 URL publique à exposer au frontend
+base_url = "http://127.0.0.1:8000"  # ou mieux: os.getenv("BASE_URL") ou config
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".dcm")
+PATIENT_FIELDS = ("nom", "prenom", "age", "sexe")
+
+
+async def run_inference(image_bytes: bytes) -> dict:
+    """Prédit une image (cache, puis micro-batchs) ; en mode sync la heatmap est écrite au passage."""
+    # Modèle actif résolu une fois : un changement de modèle n'affecte pas la requête en cours
+    model = registry.active()
+    # ♻️ Même radio déjà analysée avec ce modèle : on réutilise le résultat
+    cache_key = prediction_cache.key(image_bytes)
+    cached = await prediction_cache.get_async(cache_key, model)
+    hkey = heatmap_key(cache_key, prediction_cache.version(model))
+
+    if cached:
+        probs = cached["probs"]
+    elif HEATMAP_MODE == "sync":
+        # 🧠 Verdict et heatmap en une seule passe (clé adressée par le contenu)
+        probs = await explain_engine.submit((model, image_bytes, hkey))
+    else:
+        # Décodage, prétraitement et inférence hors de la boucle, en micro-batchs
+        probs = await engine.submit((model, image_bytes))
+
+    if not cached and TTA_ENABLED and max(probs) < TTA_THRESHOLD:
+        # 🔍 Cas limite : vues augmentées et ensemble, en un seul lot par modèle
+        first_class = classify(probs)["class_id"]
+        with timed("tta"):
+            probs = await tta_engine.submit((tta_versions(model), image_bytes))
+        if HEATMAP_MODE == "sync" and classify(probs)["class_id"] != first_class:
+            # La heatmap du premier passage explique l'autre classe : elle est redessinée
+            await run_heatmap(image_bytes, classify(probs)["class_id"], hkey, model)
+
+    if not cached:
+        await prediction_cache.put_async(cache_key, probs, model=model)
+    shadow_evaluator.maybe_submit(image_bytes, model, probs)
+    return {
+        "probs": probs,
+        "cache_key": cache_key,
+        "heatmap_key": hkey,
+        "model": model,
+        **classify(probs),
+    }
+
+
+async def prepare_heatmap(image_bytes: bytes, source: str, result: dict) -> dict:
+    """
+    Vérifie (ou planifie) la heatmap d'une prédiction et renvoie les champs de son
+    job, enregistré avec l'analyse dans la même transaction.
+    """
+    class_id = result["class_id"]
+    hkey = result["heatmap_key"]
+    ready = await asyncio.to_thread(get_storage().exists, hkey)
+    if not ready and HEATMAP_MODE == "sync":
+        # Verdict en cache mais heatmap absente : on la régénère
+        await run_heatmap(image_bytes, class_id, hkey, result["model"])
+        ready = True
+    if ready:
+        return {"class_id": class_id, "status": "ready", "heatmap_file": hkey}
+
+    # ⏳ Verdict immédiat : la heatmap sera calculée plus tard, à partir de la source stockée
+    return {"class_id": class_id, "status": "pending", "source_path": source}
+
+
+async def dicom_patient_fields(image_bytes: bytes) -> dict:
+    """Vérifie l'en-tête d'un fichier DICOM (sans décoder les pixels) ; {} pour une autre image."""
+    if not is_dicom(image_bytes):
+        return {}
+    try:
+        return await asyncio.to_thread(inspect_dicom, image_bytes)
+    except DicomRejected as e:
+        raise HTTPException(status_code=422, detail=f"Étude DICOM refusée : {e}")
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+
+def merge_patient(header_fields: dict, **form) -> PatientCreate:
+    """Patient de la requête : les champs du formulaire priment sur ceux de l'en-tête DICOM."""
+    values = {**header_fields, **{field: value for field, value in form.items() if value is not None}}
+    missing = [field for field in PATIENT_FIELDS if values.get(field) in (None, "")]
+    if missing:
+        raise HTTPException(status_code=422, detail=f"Champs patient manquants : {', '.join(missing)}")
+    return PatientCreate(**values)
+
+
+def heatmap_fields(job: dict) -> dict:
+    analysis_id = job["analysis_id"]
+    ready = job["status"] == "ready"
+    return {
+        "heatmap_url": file_url(job["heatmap_file"]) if ready else None,
+        "heatmap_thumbnail_url": file_url(thumbnail_key(job["heatmap_file"])) if ready else None,
+        "heatmap_job_id": analysis_id,
+        "heatmap_status": job["status"],
+        "heatmap_status_url": f"{base_url}/predictions/{analysis_id}/heatmap",
+    }
+
+
+def enqueue_pending(jobs: list[dict]):
+    if HEATMAP_MODE == "deferred":
+        for job in jobs:
+            if job["status"] == "pending":
+                heatmap_queue.enqueue(job["analysis_id"])
+
 
 @router.post("/predict")
 async def predict(
     file: UploadFile = File(...),
-    nom: str = Form(...),
-    prenom: str = Form(...),
-    age: int = Form(...),
-    sexe: str = Form(...),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    nom: Optional[str] = Form(None),
+    prenom: Optional[str] = Form(None),
+    age: Optional[int] = Form(None),
+    sexe: Optional[str] = Form(None),
+    priority: str = Form(DEFAULT_LANE),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
 ):
+    """
+    Analyse une radiographie (JPEG, PNG, BMP ou DICOM).
+
+    Pour un fichier DICOM, l'en-tête est vérifié avant l'inférence (modalité,
+    région, incidence : 422 sinon) et les champs patient absents du formulaire
+    sont repris de l'en-tête.
+    """
+    # 🚦 Voie de priorité (urgent / routine) : validée avant tout traitement
+    lane = resolve_lane(priority, current_user.username)
     try:
-        image_bytes = await file.read()
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-
-        input_tensor = preprocess(image).unsqueeze(0)
-
-        with torch.no_grad():
-            output = model(input_tensor)
-
-        probs = torch.softmax(output, dim=1)
-        class_id = torch.argmax(probs, dim=1).item()
-        confidence = probs[0, class_id].item()
-        prediction_class = "PNEUMONIA" if class_id == 1 else "NORMAL"
-        verdict = "positive" if prediction_class == "PNEUMONIA" else "negative"
-        probability = round(confidence * 100, 2)
-        conf_label = "high" if confidence > 0.7 else "medium" if confidence > 0.4 else "low"
-        file_name = file.filename or f"upload_{int(time.time())}.jpg"
-
-        # 📍 Création du patient
-        patient_data = PatientCreate(nom=nom, prenom=prenom, age=age, sexe=sexe)
-        patient = crud.create_patient(db, patient_data)
-
-        # 📍 Ajout de l’analyse
-        history = crud.add_analysis(
-            db,
-            current_user,
-            file_name,
-            verdict,
-            probability,
-            conf_label,
-            patient_id=patient.id,
+        image_bytes = await read_upload(file)
+        file_name = file.filename or f"upload_{int(time.time())}.{'dcm' if is_dicom(image_bytes) else 'jpg'}"
+        # 🩻 DICOM : étude refusée au plus tôt, identité reprise de l'en-tête si besoin
+        patient_data = merge_patient(
+            await dicom_patient_fields(image_bytes), nom=nom, prenom=prenom, age=age, sexe=sexe
         )
+        # Au plus ADMISSION_CONCURRENCY prédictions à la fois ; 429 si la file de la voie est pleine
+        async with admission.slot(lane):
+            with timed("inference"):
+                result = await run_inference(image_bytes)
+            # 🗂️ Radio conservée une seule fois par contenu, avec sa miniature
+            with timed("store_source"):
+                source = await asyncio.to_thread(store_source, image_bytes, result["cache_key"])
 
-        upload_folder = "uploads/heatmaps"
-        os.makedirs(upload_folder, exist_ok=True)
-
-            # 📍 Nom du fichier
-        heatmap_filename = f"heatmap_{history.id}_{int(time.time())}.png"
-        save_path = os.path.join(upload_folder, heatmap_filename)
+            with timed("heatmap"):
+                job = await prepare_heatmap(image_bytes, source, result)
 
-            # 🧠 Génère et sauvegarde la heatmap
-        generate_gradcam(model, input_tensor, image, class_id, save_path)
-
-            # 🌐 URL publique à exposer au frontend
-        base_url = "http://127.0.0.1:8000"  # ou mieux: os.getenv("BASE_URL") ou config
-        heatmap_url = f"{base_url}/uploads/heatmaps/{heatmap_filename}"
+            # 📍 Patient, analyse et job de la heatmap : une seule transaction, sans bloquer la boucle
+            with timed("db"):
+                analysis_id = await db.run_sync(
+                    crud.add_patient_analysis,
+                    current_user.id,
+                    patient_data,
+                    file_name,
+                    result["verdict"],
+                    result["probability"],
+                    result["confidence"],
+                    source,
+                    result["model"].version,
+                    job,
+                )
+        job = {"analysis_id": analysis_id, **job}
+        enqueue_pending([job])
 
         return {
-                "id": history.id,
-                "verdict": verdict,
-                "probability": probability,
-                "confidence": conf_label,
+                "id": analysis_id,
+                "verdict": result["verdict"],
+                "probability": result["probability"],
+                "confidence": result["confidence"],
                 "file_name": file_name,
-                "heatmap_url": heatmap_url,
-                "patientInfo": {
-                    "nom": nom,
-                    "prenom": prenom,
-                    "age": age,
-                    "sexe": sexe,
-                },
+                "model_version": result["model"].version,
+                "imageUrl": file_url(source),
+                "thumbnailUrl": file_url(thumbnail_key(source)),
+                **heatmap_fields(job),
+                "patientInfo": patient_data.dict(),
             }
 
 
+    except HTTPException:
+        raise
     except Exception as e:
-        import traceback
+        errors_total.inc("predict")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Erreur interne: {str(e)}")
+
+
+async def read_batch_images(files: list[UploadFile]) -> list[tuple[str, bytes]]:
+    """
+    Lit les fichiers envoyés ; les archives zip sont dépliées en autant d'images.
+    Au-delà de MAX_BATCH_TOTAL_BYTES d'images lues ou décompressées : 413, avant
+    de décompresser l'image qui ferait dépasser.
+    """
+    images = []
+    total = 0
+
+    def check_total(name: str):
+        if total > MAX_BATCH_TOTAL_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Lot trop volumineux ({name}) : maximum {MAX_BATCH_TOTAL_BYTES} octets d'images",
+            )
+
+    for upload in files:
+        name = upload.filename or f"upload_{len(images)}.jpg"
+        if name.lower().endswith(".zip") or upload.content_type in ("application/zip", "application/x-zip-compressed"):
+            data = await read_upload(upload, MAX_BATCH_TOTAL_BYTES)
+            try:
+                archive = zipfile.ZipFile(io.BytesIO(data))
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"Archive zip invalide: {name}")
+            for member in archive.infolist():
+                if not member.is_dir() and member.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    if member.file_size > MAX_UPLOAD_BYTES:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"Image trop volumineuse dans {name}: {member.filename}",
+                        )
+                    # Taille annoncée par l'archive : la lecture ne la dépasse jamais
+                    total += member.file_size
+                    check_total(name)
+                    images.append((os.path.basename(member.filename), archive.read(member)))
+                    if len(images) > BATCH_MAX_FILES:
+                        break
+        else:
+            images.append((name, await read_upload(upload)))
+            total += len(images[-1][1])
+            check_total(name)
+        if len(images) > BATCH_MAX_FILES:
+            raise HTTPException(status_code=413, detail=f"Maximum {BATCH_MAX_FILES} images par lot")
+    if not images:
+        raise HTTPException(status_code=400, detail="Aucune image dans la requête")
+    return images
+
+
+def inspect_batch_images(images: list[tuple[str, bytes]]) -> tuple[dict[int, dict], dict[int, str]]:
+    """En-têtes DICOM du lot : champs patient par image acceptée, motif de refus par image refusée."""
+    header_fields, rejected = {}, {}
+    for i, (_, data) in enumerate(images):
+        if is_dicom(data):
+            try:
+                header_fields[i] = inspect_dicom(data)
+            except DicomRejected as e:
+                rejected[i] = f"Étude DICOM refusée : {e}"
+    return header_fields, rejected
+
+
+def resolve_patients(
+    file_names: list[str],
+    patients: Optional[str],
+    default: Optional[PatientCreate],
+    header_fields: dict[int, dict] = None,
+    rejected: dict[int, str] = None,
+):
+    """
+    Associe un patient à chaque image.
+
+    `patients` (JSON) est soit une liste alignée sur les images, soit un objet
+    indexé par nom de fichier ; ses champs absents sont repris de l'en-tête DICOM.
+    À défaut, l'identité complète de l'en-tête DICOM, puis les champs
+    nom/prenom/age/sexe communs à toutes les images. Les images refusées n'ont pas
+    de patient.
+    """
+    header_fields = header_fields or {}
+    rejected = rejected or {}
+    mapping = json.loads(patients) if patients else None
+    resolved = []
+    for i, file_name in enumerate(file_names):
+        if i in rejected:
+            resolved.append(None)
+            continue
+        data = None
+        if isinstance(mapping, list) and i < len(mapping):
+            data = mapping[i]
+        elif isinstance(mapping, dict):
+            data = mapping.get(file_name)
+        fields = header_fields.get(i, {})
+        if data:
+            patient = PatientCreate(**{**fields, **data})
+        elif all(field in fields for field in PATIENT_FIELDS):
+            patient = PatientCreate(**fields)
+        else:
+            patient = default
+        if patient is None:
+            raise HTTPException(status_code=422, detail=f"Patient manquant pour {file_name}")
+        resolved.append(patient)
+    return resolved
+
+
+@router.post("/batch")
+async def predict_batch(
+    files: list[UploadFile] = File(...),
+    patients: Optional[str] = Form(None),
+    nom: Optional[str] = Form(None),
+    prenom: Optional[str] = Form(None),
+    age: Optional[int] = Form(None),
+    sexe: Optional[str] = Form(None),
+    format: str = Form("ndjson"),
+    current_user: Principal = Depends(get_current_user),
+):
+    """
+    Analyse un lot d'images (ou d'archives zip) et diffuse les résultats au fil de l'eau.
+
+    Chaque image produit une ligne `{"type": "result", ...}` dès que son verdict est
+    connu ; les analyses sont ensuite enregistrées en une seule transaction et une
+    ligne finale `{"type": "summary", ...}` donne leurs identifiants.
+    Format NDJSON par défaut, ou Server-Sent Events avec `format=sse`. Les fichiers
+    DICOM dont l'en-tête est refusé produisent directement une ligne d'erreur.
+    """
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=422, detail="format doit valoir 'ndjson' ou 'sse'")
+    # Les lots passent après les prédictions unitaires ; 429 si trop de lots attendent déjà
+    admission.check("batch")
+    images = await read_batch_images(files)
+    try:
+        header_fields, rejected = await asyncio.to_thread(inspect_batch_images, images)
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    default = None
+    if None not in (nom, prenom, age, sexe):
+        default = PatientCreate(nom=nom, prenom=prenom, age=age, sexe=sexe)
+    try:
+        batch_patients = resolve_patients([name for name, _ in images], patients, default, header_fields, rejected)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=422, detail=f"Champ patients invalide: {e}")
+
+    def encode(payload: dict) -> str:
+        line = json.dumps(payload, ensure_ascii=False)
+        return f"data: {line}\n\n" if format == "sse" else f"{line}\n"
+
+    # Images du lot en cours d'inférence en même temps
+    in_flight = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def indexed(i: int, data: bytes):
+        if i in rejected:
+            return i, None, rejected[i]
+        try:
+            async with in_flight:
+                result = await run_inference(data)
+                result["source"] = await asyncio.to_thread(store_source, data, result["cache_key"])
+            return i, result, None
+        except Exception as e:
+            errors_total.inc("batch_item")
+            return i, None, str(e)
+
+    async def stream():
+        results = {}
+        # Lot déjà accepté : il attend une seule place d'admission, sans être refusé ; sa
+        # durée n'entre pas dans l'estimation de Retry-After des prédictions unitaires
+        async with admission.slot("batch", shed=False, measure=False):
+            # Les images partent BATCH_CONCURRENCY à la fois : le moteur les regroupe en
+            # lots de tenseurs sans faire attendre les prédictions urgentes derrière tout le lot
+            for next_done in asyncio.as_completed([indexed(i, data) for i, (_, data) in enumerate(images)]):
+                i, result, error = await next_done
+                file_name = images[i][0]
+                if error is not None:
+                    yield encode({"type": "error", "index": i, "file_name": file_name, "detail": error})
+                    continue
+                results[i] = result
+                yield encode(
+                    {
+                        "type": "result",
+                        "index": i,
+                        "file_name": file_name,
+                        "verdict": result["verdict"],
+                        "probability": result["probability"],
+                        "confidence": result["confidence"],
+                    }
+                )
+
+        # 📍 Patients, analyses et jobs des heatmaps du lot : une seule transaction
+        order = sorted(results)
+        jobs = [await prepare_heatmap(images[i][1], results[i]["source"], results[i]) for i in order]
+        async with get_async_sessionmaker()() as db:
+            analysis_ids = await db.run_sync(
+                crud.add_analyses_batch,
+                current_user,
+                [
+                    (
+                        batch_patients[i],
+                        images[i][0],
+                        results[i]["verdict"],
+                        results[i]["probability"],
+                        results[i]["confidence"],
+                        results[i]["source"],
+                        results[i]["model"].version,
+                    )
+                    for i in order
+                ],
+                jobs,
+            )
+        jobs = [{"analysis_id": analysis_id, **job} for analysis_id, job in zip(analysis_ids, jobs)]
+        enqueue_pending(jobs)
+
+        yield encode(
+            {
+                "type": "summary",
+                "count": len(images),
+                "succeeded": len(order),
+                "failed": len(images) - len(order),
+                "analyses": [
+                    {"index": i, "id": job["analysis_id"], "file_name": images[i][0], **heatmap_fields(job)}
+                    for i, job in zip(order, jobs)
+                ],
+            }
+        )
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(stream(), media_type=media_type)
+
+
+@router.get("/admission/stats")
+def admission_stats(current_user: Principal = Depends(get_current_principal)):
+    return admission.stats()
+
+
+@router.get("/cache/stats")
+def cache_stats(current_user: Principal = Depends(get_current_principal)):
+    return prediction_cache.stats()
+
+
+@router.get("/{analysis_id}/heatmap")
+async def get_heatmap(
+    analysis_id: int,
+    request: Request,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Sert la heatmap si elle est prête, sinon renvoie son statut (202)."""
+    if await db.run_sync(crud.get_analysis, current_user, analysis_id) is None:
+        raise HTTPException(status_code=404, detail="Analyse introuvable")
+    job = await db.run_sync(crud.get_heatmap_job, analysis_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Aucune heatmap pour cette analyse")
+
+    if HEATMAP_MODE == "on_demand" and job.status in ("pending", "running"):
+        # 🧠 Première consultation : on calcule maintenant
+        try:
+            await heatmap_queue.ensure(analysis_id)
+        except Exception:
+            # L'échec est enregistré sur le job (status "failed") et renvoyé ci-dessous
+            errors_total.inc("heatmap")
+            traceback.print_exc()
+        await db.refresh(job)
+
+    if job.status == "ready":
+        return await storage_response(job.heatmap_file, request)
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=f"Échec de la heatmap: {job.error}")
+    return JSONResponse(status_code=202, content={"id": analysis_id, "status": job.status})
@@ -1,8 +1,15 @@
 # app/auth/crud.py
-from sqlalchemy.orm import Session, joinedload
-from app.auth.models import User, Patient, AnalysisHistory
-from app.auth.security import get_password_hash, verify_password
+from datetime import datetime
+from sqlalchemy import and_, bindparam, delete, inspect, or_, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from app.auth.models import PATIENT_IDENTITY_INDEX, User, Patient, AnalysisHistory, HeatmapJob
+from app.auth.security import user_cache
 from app.auth.schemas import PatientCreate
+from app.events import history_events
+from app.metrics import timed
+from app.stats import record_analyses, stats_cache
 
 
 def get_user_by_username(db: Session, username: str):
@@ -11,14 +18,14 @@ def get_user_by_username(db: Session, username: str):
 def create_user(
     db: Session,
     username: str,
-    password: str,
+    hashed_password: str,
     first_name: str,
     last_name: str,
     email: str
 ) -> User:
     user = User(
         username=username,
-        hashed_password=get_password_hash(password),
+        hashed_password=hashed_password,
         first_name=first_name,
         last_name=last_name,
         email=email
@@ -28,12 +35,6 @@ def create_user(
     db.refresh(user)
     return user
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = get_user_by_username(db, username)
-    if not user or not verify_password(password, user.hashed_password):
-        return None
-    return user
-
 def update_user_profile(
     db: Session, user: User, first_name: str, last_name: str, email: str
 ) -> User:
@@ -41,29 +42,113 @@ def update_user_profile(
     user.last_name = last_name
     user.email = email
     db.commit()
+    user_cache.invalidate(user.username)
     db.refresh(user)
     return user
 
-def update_user_password(
-    db: Session, user: User, current_password: str, new_password: str
-) -> bool:
-    if not verify_password(current_password, user.hashed_password):
-        return False
-    user.hashed_password = get_password_hash(new_password)
+def set_password_hash(db: Session, user: User, hashed_password: str):
+    """Enregistre un hash déjà calculé (hachage hors requête, voir app.auth.hashing)."""
+    user.hashed_password = hashed_password
     db.commit()
-    return True
+    user_cache.invalidate(user.username)
+
+PATIENT_KEY = ("nom", "prenom", "age", "sexe")
+# Nombre de clés par requête `(nom, prenom, age, sexe) IN (...)`
+PATIENT_LOOKUP_CHUNK = 200
+
+
+def patient_key(patient_data) -> tuple:
+    return tuple(getattr(patient_data, column) for column in PATIENT_KEY)
+
+
+def _find_patient_ids(db: Session, keys: list[tuple]) -> dict[tuple, int]:
+    columns = [getattr(Patient, column) for column in PATIENT_KEY]
+    found = {}
+    for start in range(0, len(keys), PATIENT_LOOKUP_CHUNK):
+        chunk = keys[start : start + PATIENT_LOOKUP_CHUNK]
+        for row in db.query(Patient.id, *columns).filter(tuple_(*columns).in_(chunk)):
+            found[tuple(row[1:])] = row.id
+    return found
+
+
+def get_or_create_patients(db: Session, patients: list[PatientCreate]) -> dict[tuple, int]:
+    """
+    Identifiants des patients `(nom, prenom, age, sexe)`, créés s'ils n'existent pas,
+    sans commit (dans la transaction de l'appelant). L'index unique des patients
+    rend l'insertion sûre face à une requête concurrente pour le même patient.
+    """
+    by_key = {patient_key(p): p for p in patients}
+    ids = _find_patient_ids(db, list(by_key))
+    missing = [key for key in by_key if key not in ids]
+    if not missing:
+        return ids
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite_insert if dialect == "sqlite" else pg_insert
+        db.execute(
+            insert(Patient.__table__).on_conflict_do_nothing(index_elements=list(PATIENT_KEY)),
+            [by_key[key].dict() for key in missing],
+        )
+        ids.update(_find_patient_ids(db, missing))
+    else:
+        rows = {key: Patient(**by_key[key].dict()) for key in missing}
+        db.add_all(rows.values())
+        db.flush()
+        ids.update({key: row.id for key, row in rows.items()})
+    return ids
+
 
 def create_patient(db: Session, patient_data: PatientCreate) -> Patient:
-    patient = Patient(
-        nom=patient_data.nom,
-        prenom=patient_data.prenom,
-        age=patient_data.age,
-        sexe=patient_data.sexe
-    )
-    db.add(patient)
+    patient_id = get_or_create_patients(db, [patient_data])[patient_key(patient_data)]
+    db.commit()
+    return db.get(Patient, patient_id)
+
+
+def merge_duplicate_patients(db: Session, chunk_size: int = 1000) -> int:
+    """
+    Migration : fusionne les patients identiques `(nom, prenom, age, sexe)` sur le
+    plus ancien et y rattache leurs analyses, avant la création de l'index unique.
+    Ne fait rien si l'index existe déjà ; renvoie le nombre de patients supprimés.
+    """
+    index_names = {index["name"] for index in inspect(db.get_bind()).get_indexes(Patient.__tablename__)}
+    if PATIENT_IDENTITY_INDEX in index_names:
+        return 0
+
+    columns = [getattr(Patient, column) for column in PATIENT_KEY]
+    canonical, merges = {}, []
+    rows = db.query(Patient.id, *columns).order_by(Patient.id).yield_per(chunk_size)
+    for row in rows:
+        key = tuple(row[1:])
+        if None in key:
+            # NULL n'entre pas en conflit dans un index unique : rien à fusionner
+            continue
+        if key in canonical:
+            merges.append({"duplicate_id": row.id, "canonical_id": canonical[key]})
+        else:
+            canonical[key] = row.id
+
+    for start in range(0, len(merges), chunk_size):
+        chunk = merges[start : start + chunk_size]
+        db.execute(
+            update(AnalysisHistory.__table__)
+            .where(AnalysisHistory.__table__.c.patient_id == bindparam("duplicate_id"))
+            .values(patient_id=bindparam("canonical_id")),
+            chunk,
+        )
+        db.execute(delete(Patient.__table__).where(Patient.id.in_([m["duplicate_id"] for m in chunk])))
     db.commit()
-    db.refresh(patient)
-    return patient
+    if merges:
+        print(f"[INFO] {len(merges)} patients en double fusionnés")
+    return len(merges)
+
+def notify_analyses(user_id: int, analysis_ids: list[int]):
+    """
+    Après le commit d'analyses : invalide les statistiques en cache de l'utilisateur
+    et les signale à ses connexions /history/events.
+    """
+    stats_cache.invalidate(user_id)
+    if analysis_ids:
+        history_events.publish(user_id, {"type": "analyses", "ids": analysis_ids})
 
 def add_analysis(
     db: Session,
@@ -83,15 +168,244 @@ def add_analysis(
         confidence=confidence
     )
     db.add(history)
+    db.flush()
+    patient = db.get(Patient, patient_id) if patient_id is not None else None
+    record_analyses(db, [(history, patient)])
     db.commit()
     db.refresh(history)
+    notify_analyses(current_user.id, [history.id])
     return history
 
-def get_user_history(db: Session, user: User):
+def add_patient_analysis(
+    db: Session,
+    user_id: int,
+    patient_data: PatientCreate,
+    file_name: str,
+    verdict: str,
+    probability: float,
+    confidence: str,
+    source_key: str = None,
+    model_version: str = None,
+    heatmap_job: dict = None,
+) -> int:
+    """
+    Retrouve (ou crée) le patient et enregistre son analyse, et le job de sa heatmap
+    (`heatmap_job` : champs de HeatmapJob hors analysis_id), dans une même transaction
+    (un seul commit, sans refresh) ; renvoie l'identifiant de l'analyse.
+    """
+    patient_id = get_or_create_patients(db, [patient_data])[patient_key(patient_data)]
+    history = AnalysisHistory(
+        user_id=user_id,
+        patient_id=patient_id,
+        file_name=file_name,
+        verdict=verdict,
+        probability=probability,
+        confidence=confidence,
+        source_key=source_key,
+        model_version=model_version,
+    )
+    db.add(history)
+    db.flush()
+    if heatmap_job is not None:
+        db.add(HeatmapJob(analysis_id=history.id, **heatmap_job))
+    record_analyses(db, [(history, patient_data)])
+    analysis_id = history.id
+    with timed("db_commit"):
+        db.commit()
+    notify_analyses(user_id, [analysis_id])
+    return analysis_id
+
+def add_analyses_batch(
+    db: Session,
+    current_user: User,
+    entries: list[tuple[PatientCreate, str, str, float, str, str, str]],
+    heatmap_jobs: list[dict] = None,
+) -> list[int]:
+    """
+    Enregistre un lot d'analyses
+    `(patient, file_name, verdict, probability, confidence, source_key, model_version)`,
+    et les jobs de leurs heatmaps (`heatmap_jobs`, dans l'ordre de `entries`), en une
+    seule transaction ; les patients déjà connus sont réutilisés.
+    Renvoie les identifiants des analyses, dans l'ordre de `entries`.
+    """
+    patient_ids = get_or_create_patients(db, [patient_data for patient_data, *_ in entries])
+
+    histories = [
+        AnalysisHistory(
+            user_id=current_user.id,
+            patient_id=patient_ids[patient_key(p)],
+            file_name=file_name,
+            verdict=verdict,
+            probability=probability,
+            confidence=confidence,
+            source_key=source_key,
+            model_version=model_version,
+        )
+        for p, file_name, verdict, probability, confidence, source_key, model_version in entries
+    ]
+    db.add_all(histories)
+    db.flush()
+    if heatmap_jobs is not None:
+        db.add_all(HeatmapJob(analysis_id=history.id, **job) for history, job in zip(histories, heatmap_jobs))
+    record_analyses(
+        db,
+        [(history, p) for history, (p, *_) in zip(histories, entries)],
+    )
+    # Lus avant le commit, qui expire les objets (évite un SELECT par ligne)
+    ids = [history.id for history in histories]
+    with timed("db_commit"):
+        db.commit()
+    notify_analyses(current_user.id, ids)
+    return ids
+
+def analysed_source_keys(db: Session, user_id: int, source_keys: list[str], model_version: str) -> set[str]:
+    """Parmi `source_keys`, les radios déjà analysées par l'utilisateur avec `model_version`."""
+    found = set()
+    for start in range(0, len(source_keys), PATIENT_LOOKUP_CHUNK):
+        rows = (
+            db.query(AnalysisHistory.source_key)
+            .filter(
+                AnalysisHistory.user_id == user_id,
+                AnalysisHistory.model_version == model_version,
+                AnalysisHistory.source_key.in_(source_keys[start : start + PATIENT_LOOKUP_CHUNK]),
+            )
+            .all()
+        )
+        found.update(row.source_key for row in rows)
+    return found
+
+def owns_source(db: Session, user_id: int, source_keys: list[str]) -> bool:
+    """L'utilisateur a-t-il une analyse de l'une de ces radios ? (droits d'accès à /files)"""
+    return (
+        db.query(AnalysisHistory.id)
+        .filter(AnalysisHistory.user_id == user_id, AnalysisHistory.source_key.in_(source_keys))
+        .first()
+        is not None
+    )
+
+def get_analysis(db: Session, user: User, analysis_id: int):
     return (
         db.query(AnalysisHistory)
-        .options(joinedload(AnalysisHistory.patient))  # <-- important !
-        .filter(AnalysisHistory.user_id == user.id)
-        .order_by(AnalysisHistory.timestamp.desc())
+        .filter(AnalysisHistory.id == analysis_id, AnalysisHistory.user_id == user.id)
+        .first()
+    )
+
+def patient_exists(db: Session, patient_id: int) -> bool:
+    return db.query(Patient.id).filter(Patient.id == patient_id).first() is not None
+
+def get_analysis_model_version(db: Session, analysis_id: int):
+    return db.query(AnalysisHistory.model_version).filter(AnalysisHistory.id == analysis_id).scalar()
+
+def get_heatmap_job(db: Session, analysis_id: int):
+    return db.query(HeatmapJob).filter(HeatmapJob.analysis_id == analysis_id).first()
+
+def update_heatmap_job(db: Session, job: HeatmapJob, **fields) -> HeatmapJob:
+    for key, value in fields.items():
+        setattr(job, key, value)
+    db.commit()
+    return job
+
+def get_unfinished_heatmap_job_ids(db: Session) -> list[int]:
+    rows = (
+        db.query(HeatmapJob.analysis_id)
+        .filter(HeatmapJob.status.in_(["pending", "running"]))
+        .order_by(HeatmapJob.analysis_id)
         .all()
-    )
\ No newline at end of file
+    )
+    return [row.analysis_id for row in rows]
+
+def user_history_query(
+    db: Session,
+    user: User,
+    after: tuple[datetime, int] = None,
+    since: tuple[datetime, int] = None,
+    verdict: str = None,
+    confidence: str = None,
+    min_probability: float = None,
+    date_from: datetime = None,
+    date_to: datetime = None,
+    patient_prefix: str = None,
+    patient_id: int = None,
+):
+    """
+    Requête de l'historique de l'utilisateur, du plus récent au plus ancien.
+
+    Projection en colonnes (pas d'objets ORM) ; `after` = (timestamp, id) de la
+    dernière ligne déjà reçue, pour une pagination par curseur sur l'index
+    (user_id, timestamp, id), ou (patient_id, timestamp, id) pour un seul patient.
+    Avec `since` (synchronisation différentielle), seules les analyses plus récentes
+    sont renvoyées, de la plus ancienne à la plus récente.
+    """
+    query = (
+        db.query(
+            AnalysisHistory.id,
+            AnalysisHistory.file_name,
+            AnalysisHistory.verdict,
+            AnalysisHistory.probability,
+            AnalysisHistory.confidence,
+            AnalysisHistory.timestamp,
+            AnalysisHistory.source_key,
+            AnalysisHistory.model_version,
+            Patient.id.label("patient_id"),
+            Patient.nom,
+            Patient.prenom,
+            Patient.age,
+            Patient.sexe,
+        )
+        .join(Patient, AnalysisHistory.patient_id == Patient.id)
+        .filter(AnalysisHistory.user_id == user.id)
+    )
+    if after is not None:
+        timestamp, analysis_id = after
+        query = query.filter(
+            or_(
+                AnalysisHistory.timestamp < timestamp,
+                and_(AnalysisHistory.timestamp == timestamp, AnalysisHistory.id < analysis_id),
+            )
+        )
+    if since is not None:
+        timestamp, analysis_id = since
+        query = query.filter(
+            or_(
+                AnalysisHistory.timestamp > timestamp,
+                and_(AnalysisHistory.timestamp == timestamp, AnalysisHistory.id > analysis_id),
+            )
+        )
+    if verdict:
+        query = query.filter(AnalysisHistory.verdict == verdict)
+    if confidence:
+        query = query.filter(AnalysisHistory.confidence == confidence)
+    if min_probability is not None:
+        query = query.filter(AnalysisHistory.probability >= min_probability)
+    if date_from is not None:
+        query = query.filter(AnalysisHistory.timestamp >= date_from)
+    if date_to is not None:
+        query = query.filter(AnalysisHistory.timestamp < date_to)
+    if patient_id is not None:
+        query = query.filter(AnalysisHistory.patient_id == patient_id)
+    if patient_prefix:
+        pattern = patient_prefix.replace("\\", "\\\\").replace("%", r"\%").replace("_", r"\_") + "%"
+        query = query.filter(
+            or_(Patient.nom.like(pattern, escape="\\"), Patient.prenom.like(pattern, escape="\\"))
+        )
+    if since is not None:
+        return query.order_by(AnalysisHistory.timestamp.asc(), AnalysisHistory.id.asc())
+    return query.order_by(AnalysisHistory.timestamp.desc(), AnalysisHistory.id.desc())
+
+
+def latest_analysis(db: Session, user: User):
+    """(id, timestamp) de la dernière analyse de l'utilisateur, lue sur l'index (user_id, timestamp, id)."""
+    return (
+        db.query(AnalysisHistory.id, AnalysisHistory.timestamp)
+        .filter(AnalysisHistory.user_id == user.id)
+        .order_by(AnalysisHistory.timestamp.desc(), AnalysisHistory.id.desc())
+        .first()
+    )
+
+
+def query_user_history(db: Session, user: User, limit: int = None, **filters):
+    """Lignes de `user_history_query` (mêmes filtres), au plus `limit`."""
+    query = user_history_query(db, user, **filters)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
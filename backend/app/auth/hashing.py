@@ -0,0 +1,119 @@
+# app/auth/hashing.py
+import asyncio
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException
+
+from app.auth.security import BCRYPT_ROUNDS, get_password_hash, verify_and_update_password
+
+# Threads dédiés à bcrypt (le calcul libère le GIL) et nombre maximal de demandes en attente
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "32"))
+HASH_RETRY_AFTER = int(os.getenv("HASH_RETRY_AFTER", "1"))
+
+
+class HashingPool:
+    """
+    Exécute bcrypt hors de la boucle et du pool de threads partagé de l'API.
+
+    Au plus `workers` hachages tournent en parallèle ; au-delà de `max_pending`
+    demandes en cours ou en attente, la requête est refusée (503 + Retry-After)
+    plutôt que de laisser une vague de connexions retarder les prédictions.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_QUEUE_LIMIT):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        # (attente, calcul) en secondes des derniers hachages
+        self._timings = deque(maxlen=1024)
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+
+    async def _run(self, fn, *args):
+        executor = self._executor
+        if executor is None:
+            raise RuntimeError("HashingPool non démarré")
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Trop de demandes d'authentification en cours, réessayez",
+                    headers={"Retry-After": str(HASH_RETRY_AFTER)},
+                )
+            self.pending += 1
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    self.completed += 1
+                    self._timings.append((started - submitted, finished - started))
+
+        def release(future):
+            # Aussi pour un hachage annulé avant d'avoir tourné (shutdown)
+            with self._lock:
+                self.pending -= 1
+
+        try:
+            future = executor.submit(timed)
+        except RuntimeError:
+            release(None)
+            raise
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+        return await self._run(verify_and_update_password, password, hashed_password)
+
+    def stats(self) -> dict:
+        with self._lock:
+            timings = list(self._timings)
+            stats = {
+                "rounds": BCRYPT_ROUNDS,
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+        for index, name in ((0, "wait_ms"), (1, "hash_ms")):
+            values = sorted(t[index] * 1000 for t in timings)
+            stats[name] = (
+                {
+                    "p50": round(statistics.median(values), 2),
+                    "p95": round(values[int(0.95 * (len(values) - 1))], 2),
+                    "max": round(values[-1], 2),
+                }
+                if values
+                else None
+            )
+        return stats
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+hashing_pool = HashingPool()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Date, Float, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 from datetime import datetime
@@ -19,6 +19,9 @@ class User(Base):
         cascade="all, delete-orphan"
     )
 
+# Un patient par identité (nom, prenom, age, sexe) : voir crud.get_or_create_patients
+PATIENT_IDENTITY_INDEX = "uq_patients_identity"
+
 class Patient(Base):
     __tablename__ = "patients"
     id = Column(Integer, primary_key=True, index=True)
@@ -28,6 +31,10 @@ class Patient(Base):
     sexe = Column(String)
     analyses = relationship("AnalysisHistory", back_populates="patient")
 
+    __table_args__ = (
+        Index(PATIENT_IDENTITY_INDEX, "nom", "prenom", "age", "sexe", unique=True),
+    )
+
 
 class AnalysisHistory(Base):
     __tablename__ = "analysis_history"
@@ -40,6 +47,46 @@ class AnalysisHistory(Base):
     probability = Column(Integer, nullable=False)
     confidence = Column(String, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow)
+    # Clé de la radiographie dans le stockage (app.storage), adressée par son contenu
+    source_key = Column(String, nullable=True)
+    # Empreinte des poids du modèle qui a produit le verdict (app.model.ModelVersion.version)
+    model_version = Column(String, nullable=True)
 
     user = relationship("User", back_populates="analysis_history")
     patient = relationship("Patient", back_populates="analyses")
+
+    __table_args__ = (
+        # Pagination par curseur de l'historique : (user_id, timestamp, id)
+        Index("ix_analysis_history_user_timestamp_id", "user_id", "timestamp", "id"),
+        # Chronologie d'un patient (/patients/{id}/analyses)
+        Index("ix_analysis_history_patient_timestamp_id", "patient_id", "timestamp", "id"),
+        # Radios déjà enregistrées (reprise de app.score, droits d'accès à /files)
+        Index("ix_analysis_history_source_key", "source_key"),
+    )
+
+
+class HeatmapJob(Base):
+    __tablename__ = "heatmap_jobs"
+
+    # Un job par analyse : son identifiant est celui de l'analyse
+    analysis_id = Column(Integer, ForeignKey("analysis_history.id"), primary_key=True)
+    status = Column(String, nullable=False, default="pending", index=True)  # pending/running/ready/failed
+    class_id = Column(Integer, nullable=False)
+    source_path = Column(String, nullable=True)
+    heatmap_file = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class AnalysisStatsRollup(Base):
+    __tablename__ = "analysis_stats_rollup"
+
+    # Compteurs agrégés par utilisateur, jour et catégorie, tenus à jour à chaque analyse
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    verdict = Column(String, primary_key=True)
+    confidence = Column(String, primary_key=True)
+    age_bucket = Column(String, primary_key=True)
+    sexe = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    probability_sum = Column(Float, nullable=False, default=0.0)
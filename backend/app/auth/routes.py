@@ -1,76 +1,61 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from jose import JWTError, jwt
 
 from app.auth.schemas import UserCreate, Token, UserUpdate, PasswordChange, UserLogin
 from app.auth import crud
-from app.auth.security import create_access_token, SECRET_KEY, ALGORITHM
+from app.auth.hashing import hashing_pool
+from app.auth.security import Principal, create_access_token, get_current_user
 from app.auth.models import User
-from app.database import get_db
+from app.database import get_db, get_async_db
 
 router = APIRouter(prefix="/auth")
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
-
-def get_current_user(
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme),
-) -> User:
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials",
-            )
-    except JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-        )
-    user = crud.get_user_by_username(db, username=username)
-    if user is None:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user
-
+# Les hachages bcrypt passent par hashing_pool : ni la boucle ni le pool de
+# threads partagé de l'API ne sont occupés par le calcul
 @router.post("/register", response_model=Token)
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     print(f"Data reçue dans /register : {user.dict()}")
-    if crud.get_user_by_username(db, user.username):
+    if await db.run_sync(crud.get_user_by_username, user.username):
         raise HTTPException(status_code=400, detail="User already exists")
 
-    new_user = crud.create_user(
-        db,
+    hashed_password = await hashing_pool.hash(user.password)
+    new_user = await db.run_sync(
+        crud.create_user,
         username=user.username,
-        password=user.password,
+        hashed_password=hashed_password,
         first_name=user.first_name,
         last_name=user.last_name,
         email=user.email
     )
-    access_token = create_access_token({"sub": new_user.username})
+    access_token = create_access_token({"sub": new_user.username, "uid": new_user.id})
     return Token(
         access_token=access_token,
         token_type="bearer"
     )
 
 @router.post("/login", response_model=Token)
-def login(user: UserLogin, db: Session = Depends(get_db)):
-    auth_user = crud.authenticate_user(db, user.username, user.password)
+async def login(user: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    auth_user = await db.run_sync(crud.get_user_by_username, user.username)
     if not auth_user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    access_token = create_access_token({"sub": auth_user.username})
+    valid, new_hash = await hashing_pool.verify_and_update(user.password, auth_user.hashed_password)
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # Coût bcrypt modifié depuis le dernier hachage : on enregistre le nouveau hash
+        await db.run_sync(crud.set_password_hash, auth_user, new_hash)
+    access_token = create_access_token({"sub": auth_user.username, "uid": auth_user.id})
     return Token(access_token=access_token, token_type="bearer")
 
 @router.put("/update-profile")
 def update_profile(
     data: UserUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     updated_user = crud.update_user_profile(
-        db, current_user, data.first_name, data.last_name, data.email
+        db, db.get(User, current_user.id), data.first_name, data.last_name, data.email
     )
     return {
         "message": "Profile updated successfully",
@@ -82,23 +67,28 @@ def update_profile(
     }
 
 @router.put("/change-password")
-def change_password(
+async def change_password(
     data: PasswordChange,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    success = crud.update_user_password(
-        db, current_user, data.current_password, data.new_password
-    )
-    if not success:
+    user = await db.get(User, current_user.id)
+    valid, _ = await hashing_pool.verify_and_update(data.current_password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=400,
             detail="Current password is incorrect"
         )
+    hashed_password = await hashing_pool.hash(data.new_password)
+    await db.run_sync(crud.set_password_hash, user, hashed_password)
     return {"message": "Password updated successfully"}
 
+@router.get("/hashing/stats")
+def hashing_stats(current_user: Principal = Depends(get_current_user)):
+    return hashing_pool.stats()
+
 @router.get("/me")
-def get_me(current_user: User = Depends(get_current_user)):
+def get_me(current_user: Principal = Depends(get_current_user)):
     return {
         "email": current_user.email,
         "first_name": current_user.first_name,
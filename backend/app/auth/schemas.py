@@ -1,5 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
+from typing import Optional
 
 class PatientCreate(BaseModel):
     nom: str
@@ -37,6 +38,14 @@ class PasswordChange(BaseModel):
     current_password: str
     new_password: str
 
+class ModelRegister(BaseModel):
+    name: str
+    path: str
+
+class ShadowConfig(BaseModel):
+    name: Optional[str] = None  # None : désactive le shadow
+    rate: float = 0.1
+
 class AnalysisHistoryOut(BaseModel):
     id: int
     file_name: str
@@ -46,6 +55,8 @@ class AnalysisHistoryOut(BaseModel):
     timestamp: datetime
     patient: PatientOut
     imageUrl: str  # <- Nouveau
+    thumbnailUrl: Optional[str] = None
+    model_version: Optional[str] = None
 
     class Config:
         orm_mode = True
\ No newline at end of file
@@ -1,3 +1,9 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
@@ -8,15 +14,81 @@ from app.database import get_db
 from app.auth.models import User
 
 # Configuration
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Facteur de coût bcrypt : un hash d'un autre coût est recalculé à la connexion suivante
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
 
 SECRET_KEY = "CHANGE_ME"  # Remplace par une clé secrète complexe en production
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
+# Cache des utilisateurs authentifiés : durée de vie (s) et nombre d'entrées
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "1024"))
+# Routes en lecture seule : identité tirée du seul jeton, sans accès à la base
+AUTH_CLAIMS_ONLY = os.getenv("AUTH_CLAIMS_ONLY", "0") == "1"
+
 # OAuth2 token URL
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+
+@dataclass(frozen=True)
+class Principal:
+    """Utilisateur authentifié, détaché de toute session (mis en cache entre les requêtes)."""
+
+    id: int
+    username: str
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    email: Optional[str] = None
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(user.id, user.username, user.first_name, user.last_name, user.email)
+
+
+class UserCache:
+    """LRU borné à expiration, indexé par le sujet (`sub`) du jeton."""
+
+    def __init__(self, max_entries: int = AUTH_CACHE_SIZE, ttl: float = AUTH_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[float, Principal]] = OrderedDict()
+
+    def get(self, username: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[username]
+                return None
+            self._entries.move_to_end(username)
+            return entry[1]
+
+    def put(self, principal: Principal):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[principal.username] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(principal.username)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username: str):
+        with self._lock:
+            self._entries.pop(username, None)
+
+
+user_cache = UserCache()
+
 # Hashage
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
@@ -24,6 +96,10 @@ def get_password_hash(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    """Vérifie le mot de passe ; renvoie aussi un nouveau hash si le coût configuré a changé."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
 # Création du token
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
@@ -31,24 +107,48 @@ def create_access_token(data: dict) -> str:
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-# Récupération de l'utilisateur connecté
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db),
-) -> User:
-    credentials_exception = HTTPException(
+def credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Impossible de valider les informations d'authentification",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decode_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
-        raise credentials_exception
-    return user
+        raise credentials_exception()
+    if payload.get("sub") is None:
+        raise credentials_exception()
+    return payload
+
+# Récupération de l'utilisateur connecté
+def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db),
+) -> Principal:
+    """Utilisateur du jeton ; la base n'est interrogée qu'en cas d'absence du cache."""
+    username = decode_token(token)["sub"]
+    principal = user_cache.get(username)
+    if principal is None:
+        user = db.query(User).filter(User.username == username).first()
+        if user is None:
+            raise credentials_exception()
+        principal = Principal.from_user(user)
+        user_cache.put(principal)
+    return principal
+
+def get_current_principal(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db),
+) -> Principal:
+    """
+    Variante des routes en lecture seule : avec AUTH_CLAIMS_ONLY=1, l'identité
+    (`sub`, `uid`) est lue dans le jeton signé, sans cache ni base. Les jetons
+    émis avant l'ajout de `uid` repassent par get_current_user.
+    """
+    payload = decode_token(token)
+    if AUTH_CLAIMS_ONLY and payload.get("uid") is not None:
+        return Principal(payload["uid"], payload["sub"])
+    return get_current_user(token, db)
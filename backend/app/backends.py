@@ -0,0 +1,256 @@
+# app/backends.py
+"""
+Backends d'inférence CPU pour ImprovedDenseNet121.
+
+Le backend est choisi par la variable d'environnement INFERENCE_BACKEND :
+    eager         modèle PyTorch fp32 (défaut)
+    torchscript   graphe TorchScript figé (torch.jit.freeze)
+    int8_dynamic  quantification dynamique int8 des couches linéaires
+    int8_static   quantification statique int8 (FX), calibrée sur des radios
+    bf16          channels_last + autocast bfloat16
+    onnx          ONNX Runtime (CPUExecutionProvider)
+
+Les backends torchscript, int8_static et onnx lisent un artefact produit hors ligne :
+
+    python -m app.backends export --backend all --calibration-dir chemin/vers/radios
+    python -m app.backends check --images chemin/vers/radios
+
+`check` compare chaque backend aux verdicts fp32 (accord, écart de probabilité) et
+mesure son accélération. Grad-CAM utilise toujours le modèle eager fp32.
+"""
+import argparse
+import copy
+import os
+import time
+
+import torch
+import torch.nn as nn
+
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "eager")
+BACKENDS = ["eager", "torchscript", "int8_dynamic", "int8_static", "bf16", "onnx"]
+INPUT_SHAPE = (1, 3, 256, 256)
+
+
+def artifact_path(name: str, weights_path: str = None) -> str:
+    """Chemin de l'artefact d'un backend, dérivé du fichier de poids (MODEL_PATH par défaut)."""
+    from app.model import model_path
+
+    weights_path = weights_path or model_path
+    folder = os.getenv("INFERENCE_ARTIFACTS_DIR", os.path.dirname(weights_path))
+    stem = os.path.splitext(os.path.basename(weights_path))[0]
+    suffix = {"torchscript": ".torchscript.pt", "int8_static": ".int8.pt", "onnx": ".onnx"}[name]
+    return os.path.join(folder, stem + suffix)
+
+
+def _set_quantized_engine():
+    engines = torch.backends.quantized.supported_engines
+    torch.backends.quantized.engine = "x86" if "x86" in engines else "fbgemm"
+
+
+class EagerBackend:
+    def __init__(self, model: nn.Module):
+        self.model = model
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            return self.model(batch)
+
+
+class TorchScriptBackend:
+    def __init__(self, path: str):
+        self.module = torch.jit.load(path, map_location="cpu").eval()
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            return self.module(batch)
+
+
+class Int8DynamicBackend(EagerBackend):
+    def __init__(self, model: nn.Module):
+        _set_quantized_engine()
+        super().__init__(
+            torch.ao.quantization.quantize_dynamic(copy.deepcopy(model), {nn.Linear}, dtype=torch.qint8)
+        )
+
+
+class Int8StaticBackend(TorchScriptBackend):
+    def __init__(self, path: str):
+        _set_quantized_engine()
+        super().__init__(path)
+
+
+class Bf16Backend:
+    def __init__(self, model: nn.Module):
+        self.model = copy.deepcopy(model).to(memory_format=torch.channels_last)
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        batch = batch.contiguous(memory_format=torch.channels_last)
+        with torch.no_grad(), torch.autocast("cpu", dtype=torch.bfloat16):
+            return self.model(batch).float()
+
+
+class OnnxBackend:
+    def __init__(self, path: str):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise RuntimeError("Le backend onnx nécessite le paquet onnxruntime") from e
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = torch.get_num_threads()
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        (logits,) = self.session.run(None, {self.input_name: batch.numpy()})
+        return torch.from_numpy(logits)
+
+
+def load_backend(name: str, model: nn.Module, weights_path: str = None):
+    """Construit le backend `name` ; renvoie un appelable `lot -> logits`."""
+    if name == "eager":
+        return EagerBackend(model)
+    if name == "torchscript":
+        return TorchScriptBackend(artifact_path(name, weights_path))
+    if name == "int8_dynamic":
+        return Int8DynamicBackend(model)
+    if name == "int8_static":
+        return Int8StaticBackend(artifact_path(name, weights_path))
+    if name == "bf16":
+        return Bf16Backend(model)
+    if name == "onnx":
+        return OnnxBackend(artifact_path(name, weights_path))
+    raise ValueError(f"Backend d'inférence inconnu: {name} (choix: {', '.join(BACKENDS)})")
+
+
+# ---------------------------------------------------------------------------
+# Export hors ligne
+# ---------------------------------------------------------------------------
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def iter_image_batches(folder: str, batch_size: int = 16, limit: int = None):
+    """Parcourt `folder` et produit des lots de tenseurs prétraités."""
+    from app.api.ai.pipeline import load_image
+
+    paths = sorted(
+        os.path.join(root, f)
+        for root, _, files in os.walk(folder)
+        for f in files
+        if f.lower().endswith(IMAGE_EXTENSIONS)
+    )[:limit]
+    for i in range(0, len(paths), batch_size):
+        tensors = []
+        for path in paths[i : i + batch_size]:
+            with open(path, "rb") as f:
+                tensors.append(load_image(f.read())[1])
+        yield torch.stack(tensors)
+
+
+def export_torchscript(model: nn.Module, path: str):
+    example = torch.randn(INPUT_SHAPE)
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(model.eval(), example))
+    torch.jit.save(traced, path)
+
+
+def export_int8_static(model: nn.Module, path: str, calibration_dir: str, limit: int = 256):
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    _set_quantized_engine()
+    example = torch.randn(INPUT_SHAPE)
+    qconfig_mapping = get_default_qconfig_mapping(torch.backends.quantized.engine)
+    prepared = prepare_fx(copy.deepcopy(model).eval(), qconfig_mapping, example_inputs=(example,))
+    with torch.no_grad():
+        for batch in iter_image_batches(calibration_dir, limit=limit):
+            prepared(batch)
+        quantized = convert_fx(prepared)
+        traced = torch.jit.freeze(torch.jit.trace(quantized, example))
+    torch.jit.save(traced, path)
+
+
+def export_onnx(model: nn.Module, path: str):
+    torch.onnx.export(
+        model.eval(),
+        torch.randn(INPUT_SHAPE),
+        path,
+        input_names=["input"],
+        output_names=["logits"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=17,
+    )
+
+
+def export(names: list[str], model: nn.Module, calibration_dir: str = None):
+    for name in names:
+        if name == "torchscript":
+            export_torchscript(model, artifact_path(name))
+        elif name == "int8_static":
+            if not calibration_dir:
+                print("[WARN] int8_static ignoré : --calibration-dir manquant")
+                continue
+            export_int8_static(model, artifact_path(name), calibration_dir)
+        elif name == "onnx":
+            export_onnx(model, artifact_path(name))
+        else:
+            continue
+        print(f"[INFO] ✅ {name} exporté vers {artifact_path(name)}")
+
+
+def check(names: list[str], model: nn.Module, images_dir: str, limit: int = 256, repeats: int = 3):
+    """Compare chaque backend aux verdicts fp32 et mesure son accélération."""
+    batches = list(iter_image_batches(images_dir, limit=limit))
+    if not batches:
+        raise SystemExit(f"Aucune image trouvée dans {images_dir}")
+
+    def run(backend):
+        probs, best = None, float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            probs = torch.cat([torch.softmax(backend(batch).float(), dim=1) for batch in batches])
+            best = min(best, time.perf_counter() - start)
+        return probs, best
+
+    reference, reference_time = run(EagerBackend(model))
+    n = reference.shape[0]
+    print(f"{'backend':<14}{'accord':>10}{'max |Δp|':>12}{'img/s':>10}{'speedup':>10}")
+    for name in names:
+        try:
+            probs, elapsed = run(load_backend(name, model))
+        except Exception as e:
+            print(f"{name:<14}  indisponible: {e}")
+            continue
+        agreement = (probs.argmax(dim=1) == reference.argmax(dim=1)).float().mean().item()
+        max_diff = (probs - reference).abs().max().item()
+        print(
+            f"{name:<14}{agreement:>9.1%}{max_diff:>12.4f}"
+            f"{n / elapsed:>10.1f}{reference_time / elapsed:>9.2f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_parser = sub.add_parser("export", help="écrit les artefacts des backends")
+    export_parser.add_argument("--backend", default="all")
+    export_parser.add_argument("--calibration-dir")
+    check_parser = sub.add_parser("check", help="accord avec fp32 et accélération")
+    check_parser.add_argument("--backend", default="all")
+    check_parser.add_argument("--images", required=True)
+    check_parser.add_argument("--limit", type=int, default=256)
+    args = parser.parse_args()
+
+    from app.model import load_model, model_path
+
+    # Artefacts des poids MODEL_PATH (pour une autre version du registre : MODEL_PATH=... python -m app.backends)
+    model = load_model(model_path)
+    names = BACKENDS[1:] if args.backend == "all" else args.backend.split(",")
+    if args.command == "export":
+        export(names, model, args.calibration_dir)
+    else:
+        check(names, model, args.images, limit=args.limit)
+
+
+if __name__ == "__main__":
+    main()
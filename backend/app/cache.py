@@ -0,0 +1,161 @@
+# app/cache.py
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from app.api.ai.pipeline import tta_variant
+from app.backends import INFERENCE_BACKEND
+from app.model import ModelRegistry, ModelVersion, registry
+
+# Nombre d'entrées gardées en mémoire (LRU) et dossier du tier disque (optionnel)
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "1024"))
+PREDICTION_CACHE_DIR = os.getenv("PREDICTION_CACHE_DIR")
+
+
+class PredictionCache:
+    """
+    Cache des prédictions adressé par le contenu de l'image.
+
+    Les entrées (`probs`) sont indexées par le SHA-256 des octets
+    de l'image, dans un espace propre à la version du modèle. Cette version est
+    dérivée du fichier de poids (taille, date de modification) et du backend :
+    dès que le modèle actif du registre change, les entrées de l'ancienne version
+    ne sont plus consultées et sortent du LRU au fil des évictions (plusieurs
+    versions peuvent cohabiter : modèle fantôme, retour arrière).
+
+    `get_async` et `put_async` font les lectures et écritures du tier disque hors
+    de la boucle asyncio.
+    """
+
+    def __init__(
+        self,
+        registry: ModelRegistry,
+        max_entries: int = PREDICTION_CACHE_SIZE,
+        cache_dir: str = None,
+        variant=None,
+    ):
+        self.registry = registry
+        # Suffixe d'espace de noms propre à la configuration de prédiction (second passage TTA)
+        self.variant = variant
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        # (version, clé) -> entrée
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(image_bytes: bytes) -> str:
+        return hashlib.sha256(image_bytes).hexdigest()
+
+    def _model_version(self, model: ModelVersion = None) -> str:
+        return f"{(model or self.registry.active()).version}-{INFERENCE_BACKEND}"
+
+    def _namespace(self, model: ModelVersion = None) -> str:
+        model = model or self.registry.active()
+        return self._model_version(model) + (self.variant(model) if self.variant else "")
+
+    def _store(self, version: str, key: str, entry: dict):
+        self._entries[(version, key)] = entry
+        self._entries.move_to_end((version, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_path(self, version: str, key: str) -> str:
+        return os.path.join(self.cache_dir, version, key[:2], f"{key}.json")
+
+    def _read_disk(self, version: str, key: str) -> Optional[dict]:
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(version, key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, version: str, key: str, entry: dict):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(version, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def version(self, model: ModelVersion = None) -> str:
+        """Version du modèle servie (poids et backend), celle du modèle actif par défaut."""
+        return self._model_version(model)
+
+    def _get_memory(self, version: str, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get((version, key))
+            if entry is None:
+                return None
+            self._entries.move_to_end((version, key))
+            self.hits += 1
+            return dict(entry)
+
+    def _found_on_disk(self, version: str, key: str, entry: Optional[dict]) -> Optional[dict]:
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(version, key, entry)
+        return dict(entry)
+
+    def get(self, key: str, model: ModelVersion = None) -> Optional[dict]:
+        version = self._namespace(model)
+        entry = self._get_memory(version, key)
+        if entry is not None:
+            return entry
+        return self._found_on_disk(version, key, self._read_disk(version, key))
+
+    async def get_async(self, key: str, model: ModelVersion = None) -> Optional[dict]:
+        version = self._namespace(model)
+        entry = self._get_memory(version, key)
+        if entry is not None:
+            return entry
+        disk_entry = await asyncio.to_thread(self._read_disk, version, key) if self.cache_dir else None
+        return self._found_on_disk(version, key, disk_entry)
+
+    def _put_memory(self, version: str, key: str, probs: list[float]) -> dict:
+        entry = {"probs": list(probs)}
+        with self._lock:
+            self._store(version, key, entry)
+        return entry
+
+    def put(self, key: str, probs: list[float], model: ModelVersion = None):
+        """Enregistre les probabilités de l'image `key`."""
+        version = self._namespace(model)
+        self._write_disk(version, key, self._put_memory(version, key, probs))
+
+    async def put_async(self, key: str, probs: list[float], model: ModelVersion = None):
+        version = self._namespace(model)
+        entry = self._put_memory(version, key, probs)
+        if self.cache_dir:
+            await asyncio.to_thread(self._write_disk, version, key, entry)
+
+    def stats(self) -> dict:
+        version = self._namespace()
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "model_version": version,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+prediction_cache = PredictionCache(registry, cache_dir=PREDICTION_CACHE_DIR, variant=tta_variant)
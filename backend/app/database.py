@@ -1,13 +1,55 @@
 # app/database.py
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event, inspect
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-DATABASE_URL = "sqlite:///./your_database_name.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./your_database_name.db")
+# Variante asynchrone (routes async) ; par défaut dérivée de DATABASE_URL
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+
+# SQLite : attente (ms) d'un verrou d'écriture avant l'erreur "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# PostgreSQL : pool de connexions
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def engine_options(url: str) -> dict:
+    if is_sqlite(url):
+        return {"connect_args": {"check_same_thread": False}}  # Obligatoire pour SQLite
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},  # Obligatoire pour SQLite
-)
+
+def configure_sqlite(sync_engine):
+    """WAL (lectures concurrentes pendant une écriture), fsync allégé et attente des verrous."""
+
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
+
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+if is_sqlite(DATABASE_URL):
+    configure_sqlite(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -19,3 +61,62 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def async_database_url() -> str:
+    if ASYNC_DATABASE_URL:
+        return ASYNC_DATABASE_URL
+    scheme, rest = DATABASE_URL.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme.split('+')[0], scheme)}://{rest}"
+
+
+_async_sessionmaker = None
+
+
+def get_async_sessionmaker():
+    """Moteur et sessions asynchrones, créés au premier usage (pilote aiosqlite ou asyncpg)."""
+    global _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+        url = async_database_url()
+        async_engine = create_async_engine(url, **engine_options(url))
+        if is_sqlite(url):
+            configure_sqlite(async_engine.sync_engine)
+        _async_sessionmaker = sessionmaker(
+            async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+        )
+    return _async_sessionmaker
+
+
+async def get_async_db():
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+
+def create_missing_indexes(bind=engine):
+    """Crée les index déclarés sur des tables qui existaient déjà (create_all ne les ajoute pas)."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+
+def create_missing_columns(bind=engine):
+    """
+    Ajoute les colonnes déclarées absentes des tables existantes (create_all ne
+    modifie pas une table déjà créée). Seules des colonnes nullables, sans valeur
+    par défaut côté serveur, sont ajoutées ainsi.
+    """
+    inspector = inspect(bind)
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=bind.dialect)
+                connection.exec_driver_sql(
+                    f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+                )
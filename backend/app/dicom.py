@@ -0,0 +1,191 @@
+# app/dicom.py
+"""
+Lecture des fichiers DICOM envoyés aux endpoints de prédiction.
+
+L'en-tête est lu sans les pixels (`stop_before_pixels`) : modalité, région et
+incidence permettent de refuser ce qui n'est pas une radiographie du thorax
+avant toute inférence, et l'identité du patient peut pré-remplir le formulaire.
+Les pixels ne sont décodés que dans les processus de calcul, une seule image
+(frame) par étude, puis réduits et fenêtrés (VOI LUT) en NumPy, en flottants :
+la profondeur d'origine (12-16 bits) est conservée jusqu'au tenseur d'entrée.
+
+Dépendance optionnelle : paquet pydicom (plus pylibjpeg ou gdcm pour les
+syntaxes de transfert compressées).
+"""
+import io
+import os
+from datetime import date, datetime
+from typing import Optional
+
+import numpy as np
+
+
+def _env_set(name: str, default: str) -> set[str]:
+    return {value.strip().upper() for value in os.getenv(name, default).split(",") if value.strip()}
+
+
+# Modalités acceptées (radiographie numérisée ou numérique)
+DICOM_MODALITIES = _env_set("DICOM_MODALITIES", "CR,DX")
+# Régions acceptées quand BodyPartExamined est renseigné (vide : toutes)
+DICOM_BODY_PARTS = _env_set("DICOM_BODY_PARTS", "CHEST,THORAX,LUNG")
+# Incidences acceptées quand ViewPosition est renseigné (vide : toutes)
+DICOM_VIEW_POSITIONS = _env_set("DICOM_VIEW_POSITIONS", "PA,AP")
+# Nom, prénom, âge et sexe repris de l'en-tête quand la requête ne les donne pas
+DICOM_PREFILL_PATIENT = os.getenv("DICOM_PREFILL_PATIENT", "1") == "1"
+
+DICOM_SEXES = {"M": "masculin", "F": "feminin"}
+
+
+class DicomRejected(ValueError):
+    """Fichier DICOM illisible ou étude refusée d'après son en-tête."""
+
+
+def is_dicom(data: bytes) -> bool:
+    # DICOM Part 10 : préambule de 128 octets puis "DICM"
+    return len(data) >= 132 and data[128:132] == b"DICM"
+
+
+def _pydicom():
+    try:
+        import pydicom
+    except ImportError as e:
+        raise RuntimeError("La lecture des fichiers DICOM nécessite le paquet pydicom") from e
+    return pydicom
+
+
+def read_header(data: bytes):
+    """En-tête seul : l'élément PixelData n'est ni lu ni décodé."""
+    pydicom = _pydicom()
+    try:
+        return pydicom.dcmread(io.BytesIO(data), stop_before_pixels=True)
+    except Exception as e:
+        raise DicomRejected(f"en-tête illisible ({e})") from e
+
+
+def check_header(header):
+    """Refuse (DicomRejected) une étude qui n'est pas une radiographie du thorax exploitable."""
+    modality = str(header.get("Modality", "")).upper()
+    if modality not in DICOM_MODALITIES:
+        raise DicomRejected(f"modalité {modality or 'absente'} (attendu : {', '.join(sorted(DICOM_MODALITIES))})")
+    body_part = str(header.get("BodyPartExamined", "")).upper()
+    if body_part and DICOM_BODY_PARTS and body_part not in DICOM_BODY_PARTS:
+        raise DicomRejected(f"région {body_part} (attendu : {', '.join(sorted(DICOM_BODY_PARTS))})")
+    view = str(header.get("ViewPosition", "")).upper()
+    if view and DICOM_VIEW_POSITIONS and view not in DICOM_VIEW_POSITIONS:
+        raise DicomRejected(f"incidence {view} (attendu : {', '.join(sorted(DICOM_VIEW_POSITIONS))})")
+    if not header.get("Rows") or not header.get("Columns"):
+        raise DicomRejected("aucune image dans le fichier")
+
+
+def _parse_date(value) -> Optional[date]:
+    try:
+        return datetime.strptime(str(value), "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def _patient_age(header) -> Optional[int]:
+    # PatientAge ("045Y", "006M"...) sinon date de naissance rapportée à la date de l'étude
+    age = str(header.get("PatientAge", ""))
+    if len(age) == 4 and age[:3].isdigit():
+        return int(age[:3]) if age[3] == "Y" else 0
+    born = _parse_date(header.get("PatientBirthDate", ""))
+    if born is None:
+        return None
+    on = _parse_date(header.get("StudyDate", "")) or date.today()
+    return on.year - born.year - ((on.month, on.day) < (born.month, born.day))
+
+
+def patient_fields(header) -> dict:
+    """Champs patient (nom, prenom, age, sexe) que l'en-tête renseigne ; les autres sont absents."""
+    fields = {}
+    name = header.get("PatientName")
+    if name:
+        if name.family_name:
+            fields["nom"] = name.family_name
+        if name.given_name:
+            fields["prenom"] = name.given_name
+    age = _patient_age(header)
+    if age is not None:
+        fields["age"] = age
+    sexe = DICOM_SEXES.get(str(header.get("PatientSex", "")).upper())
+    if sexe:
+        fields["sexe"] = sexe
+    return fields
+
+
+def inspect_dicom(data: bytes) -> dict:
+    """Vérifie l'en-tête d'un fichier DICOM et renvoie les champs patient à pré-remplir."""
+    header = read_header(data)
+    check_header(header)
+    return patient_fields(header) if DICOM_PREFILL_PATIENT else {}
+
+
+def _first_frame(dataset) -> np.ndarray:
+    frames = int(dataset.get("NumberOfFrames", 1) or 1)
+    if hasattr(dataset, "pixel_array_options"):
+        # pydicom >= 3 : seule la première frame est décodée
+        dataset.pixel_array_options(index=0)
+        return dataset.pixel_array
+    pixels = dataset.pixel_array
+    return pixels[0] if frames > 1 else pixels
+
+
+def _downsample(pixels: np.ndarray, size: tuple[int, int]) -> np.ndarray:
+    """Moyenne par blocs entiers : l'image reste au moins aussi grande que `size` (largeur, hauteur)."""
+    factor = min(pixels.shape[0] // size[1], pixels.shape[1] // size[0])
+    if factor < 2:
+        return pixels
+    height, width = pixels.shape[0] // factor, pixels.shape[1] // factor
+    blocks = pixels[: height * factor, : width * factor].reshape(height, factor, width, factor)
+    return blocks.mean(axis=(1, 3))
+
+
+def _first_value(value) -> float:
+    # WindowCenter / WindowWidth peuvent être multivalués : la première fenêtre est la fenêtre par défaut
+    if isinstance(value, (int, float, str)):
+        return float(value)
+    return float(value[0])
+
+
+def _window(pixels: np.ndarray, dataset) -> np.ndarray:
+    """Fenêtrage VOI (PS3.3 C.11.2.1.2) vers [0, 1] ; à défaut de fenêtre, étirement min-max."""
+    if "WindowCenter" in dataset and "WindowWidth" in dataset:
+        center = _first_value(dataset.WindowCenter)
+        width = max(_first_value(dataset.WindowWidth), 1.0)
+        function = str(dataset.get("VOILUTFunction", "LINEAR")).upper()
+        if function == "SIGMOID":
+            # Exposant borné : pas de dépassement de np.exp loin de la fenêtre
+            return 1.0 / (1.0 + np.exp(np.clip(-4.0 * (pixels - center) / width, -50.0, 50.0)))
+        if function == "LINEAR_EXACT":
+            return np.clip((pixels - center) / width + 0.5, 0.0, 1.0)
+        return np.clip((pixels - (center - 0.5)) / max(width - 1.0, 1.0) + 0.5, 0.0, 1.0)
+    low, high = float(pixels.min()), float(pixels.max())
+    return (pixels - low) / (high - low) if high > low else np.zeros_like(pixels)
+
+
+def decode_pixels(data: bytes, size: tuple[int, int]) -> np.ndarray:
+    """
+    Première image de l'étude en float32 dans [0, 1] (blanc = dense), réduite à
+    une taille proche de `size` (largeur, hauteur) avant le fenêtrage.
+    """
+    pydicom = _pydicom()
+    try:
+        from pydicom.pixels import apply_modality_lut, apply_voi_lut
+    except ImportError:
+        from pydicom.pixel_data_handlers.util import apply_modality_lut, apply_voi_lut
+
+    dataset = pydicom.dcmread(io.BytesIO(data))
+    pixels = _first_frame(dataset)
+    if pixels.ndim == 3:
+        # Image couleur (rare en radiographie) : luminance moyenne
+        pixels = pixels.mean(axis=-1)
+    pixels = apply_modality_lut(pixels, dataset).astype(np.float32, copy=False)
+    if "VOILUTSequence" in dataset and "WindowCenter" not in dataset:
+        # Table VOI explicite (non linéaire) : appliquée sur la pleine résolution
+        pixels = apply_voi_lut(pixels, dataset).astype(np.float32, copy=False)
+    pixels = _window(_downsample(pixels, size), dataset)
+    if str(dataset.get("PhotometricInterpretation", "")).upper() == "MONOCHROME1":
+        # MONOCHROME1 : les valeurs basses sont blanches
+        pixels = 1.0 - pixels
+    return np.ascontiguousarray(pixels, dtype=np.float32)
@@ -0,0 +1,69 @@
+# app/events.py
+import asyncio
+import os
+import threading
+
+from app.metrics import CallbackMetric, register
+
+# Événements gardés par abonné ; au-delà (client trop lent), les plus récents sont perdus
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+# Commentaire SSE envoyé en l'absence d'événement (garde la connexion ouverte derrière les proxys)
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+
+
+def _offer(queue: asyncio.Queue, event: dict):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        pass
+
+
+class HistoryEvents:
+    """
+    Diffusion, aux connexions SSE d'un utilisateur, des analyses qu'il vient
+    d'enregistrer. `publish` peut être appelé depuis n'importe quel thread
+    (commits faits via run_sync ou le pool de threads). La diffusion est locale
+    au processus : avec plusieurs workers uvicorn, chaque client reçoit les
+    événements de son worker et rattrape le reste via `/history?since=`.
+    """
+
+    def __init__(self, queue_size: int = EVENTS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers: dict[int, set] = {}
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id, set())
+            subscribers.discard(next((s for s in subscribers if s[1] is queue), None))
+            if not subscribers:
+                self._subscribers.pop(user_id, None)
+
+    def publish(self, user_id: int, event: dict):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, event)
+            except RuntimeError:
+                # Boucle déjà fermée (arrêt en cours)
+                pass
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+history_events = HistoryEvents()
+
+register(
+    CallbackMetric(
+        "pneumonie_history_event_subscribers", "Connexions SSE /history/events ouvertes", history_events.subscriber_count
+    )
+)
@@ -0,0 +1,149 @@
+# app/export.py
+"""
+Export en flux de l'historique des analyses (CSV, NDJSON, Parquet), éventuellement gzip.
+
+Les lignes sont lues par paquets de EXPORT_CHUNK_ROWS (`yield_per` : curseur
+côté serveur sur PostgreSQL) et sérialisées paquet par paquet : la mémoire
+utilisée ne dépend pas du nombre de lignes exportées.
+"""
+import csv
+import io
+import json
+import os
+import zlib
+
+from app.database import SessionLocal
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+COLUMNS = [
+    "id",
+    "timestamp",
+    "file_name",
+    "verdict",
+    "probability",
+    "confidence",
+    "model_version",
+    "source_key",
+    "patient_id",
+    "nom",
+    "prenom",
+    "age",
+    "sexe",
+]
+
+
+def export_rows(build_query, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """
+    Produit des paquets de lignes (dict) ; `build_query(db)` construit la requête.
+    La session est ouverte ici : elle vit aussi longtemps que le flux.
+    """
+    db = SessionLocal()
+    try:
+        chunk = []
+        for row in build_query(db).yield_per(chunk_rows):
+            record = {column: getattr(row, column) for column in COLUMNS}
+            if record["timestamp"] is not None:
+                record["timestamp"] = record["timestamp"].isoformat()
+            chunk.append(record)
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        db.close()
+
+
+def to_csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS)
+    writer.writeheader()
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def to_ndjson(chunks):
+    for chunk in chunks:
+        yield "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in chunk).encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Fichier en écriture seule dont le contenu est récupéré (puis vidé) après chaque écriture."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data, self._buffer = bytes(self._buffer), bytearray()
+        return data
+
+
+def to_parquet(chunks):
+    """Un row group par paquet ; le pied de page (schéma, index) est écrit à la fin."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [
+            ("id", pa.int64()),
+            ("timestamp", pa.string()),
+            ("file_name", pa.string()),
+            ("verdict", pa.string()),
+            ("probability", pa.float64()),
+            ("confidence", pa.string()),
+            ("model_version", pa.string()),
+            ("source_key", pa.string()),
+            ("patient_id", pa.int64()),
+            ("nom", pa.string()),
+            ("prenom", pa.string()),
+            ("age", pa.int64()),
+            ("sexe", pa.string()),
+        ]
+    )
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def gzipped(stream):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for data in stream:
+        compressed = compressor.compress(data)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_stream(build_query, format: str, compress: bool = False):
+    """Flux d'octets de l'export au format `format` (voir EXPORT_FORMATS)."""
+    serializer = {"csv": to_csv, "ndjson": to_ndjson, "parquet": to_parquet}[format]
+    stream = serializer(export_rows(build_query))
+    return gzipped(stream) if compress else stream
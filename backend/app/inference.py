@@ -0,0 +1,144 @@
+# app/inference.py
+import asyncio
+import os
+import queue
+import threading
+import time
+
+from app import metrics
+from app.api.ai.pipeline import TTA_VIEWS
+from app.workers import INFERENCE_WORKERS, run_explain_batch, run_predict_batch, run_tta_batch
+
+# Taille maximale d'un micro-batch et délai maximal d'attente pour le compléter
+MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "16"))
+MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "10"))
+
+
+def _set_result(future: asyncio.Future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future: asyncio.Future, exc: BaseException):
+    if not future.done():
+        future.set_exception(exc)
+
+
+class InferenceEngine:
+    """
+    Regroupe les requêtes d'inférence en micro-batchs exécutés hors de la boucle asyncio.
+
+    Chaque appel à `submit` dépose une entrée dans la file et attend son propre futur.
+    Un thread de travail vide la file jusqu'à `max_batch_size` entrées, ou jusqu'à
+    expiration de `max_wait_ms` après la première, puis appelle `run_batch` sur le lot.
+    Les étapes mesurées pendant le lot (décodage, passe avant, Grad-CAM) sont
+    renvoyées avec chaque résultat et reprises dans le Server-Timing de la requête.
+
+    Args:
+        run_batch: fonction synchrone `list[entrée] -> list[résultat]` (même ordre)
+        max_batch_size: nombre maximal d'entrées par lot
+        max_wait_ms: attente maximale (ms) pour compléter un lot
+        num_threads: nombre de threads collecteurs (lots exécutés en parallèle)
+        name: nom du moteur dans les métriques
+    """
+
+    def __init__(
+        self,
+        run_batch,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait_ms: float = MAX_WAIT_MS,
+        num_threads: int = 1,
+        name: str = "predict",
+    ):
+        self.run_batch = run_batch
+        self.name = name
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self.num_threads = max(1, num_threads)
+        self._queue: queue.Queue = queue.Queue()
+        self._threads: list[threading.Thread] = []
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.num_threads):
+            thread = threading.Thread(target=self._loop, name=f"inference-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    async def submit(self, item):
+        """Ajoute `item` au prochain lot et attend son résultat."""
+        if not self._threads:
+            raise RuntimeError("InferenceEngine non démarré")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((item, loop, future, time.perf_counter()))
+        result, stages = await future
+        metrics.add_request_stages(stages)
+        return result
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is None:
+                # Arrêt demandé : on traite le lot en cours puis on s'arrête
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            metrics.inference_batch_size.observe(len(batch), self.name)
+            for _, _, _, enqueued in batch:
+                metrics.inference_queue_wait_seconds.observe(started - enqueued, self.name)
+            try:
+                with metrics.collect_stages() as stages:
+                    results = self.run_batch([item for item, _, _, _ in batch])
+            except Exception as exc:
+                metrics.errors_total.inc(f"{self.name}_batch")
+                for _, loop, future, _ in batch:
+                    loop.call_soon_threadsafe(_set_exception, future, exc)
+                continue
+            for (_, loop, future, _), result in zip(batch, results):
+                loop.call_soon_threadsafe(_set_result, future, (result, stages))
+
+
+# Un thread collecteur par processus de calcul pour garder chaque worker occupé
+engine = InferenceEngine(run_predict_batch, num_threads=max(1, INFERENCE_WORKERS), name="predict")
+# Prédictions accompagnées de leur heatmap (une seule passe avant par lot)
+explain_engine = InferenceEngine(run_explain_batch, num_threads=max(1, INFERENCE_WORKERS), name="explain")
+# Second passage (TTA / ensemble) des prédictions peu confiantes
+# (lots plafonnés pour que le nombre de vues reste de l'ordre de MAX_BATCH_SIZE)
+tta_engine = InferenceEngine(
+    run_tta_batch,
+    max_batch_size=max(1, MAX_BATCH_SIZE // max(1, len(TTA_VIEWS))),
+    num_threads=max(1, INFERENCE_WORKERS),
+    name="tta",
+)
@@ -0,0 +1,114 @@
+# app/limits.py
+import os
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+# Taille maximale d'une image
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+# Nombre maximal d'images par appel à /batch (archives zip comprises)
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "500"))
+# Champs patient et enveloppe multipart autour d'un fichier
+FORM_OVERHEAD_BYTES = int(os.getenv("FORM_OVERHEAD_BYTES", str(64 * 1024)))
+# Total des images d'un lot /batch gardées en mémoire (fichiers envoyés et images des zip décompressées)
+MAX_BATCH_TOTAL_BYTES = int(os.getenv("MAX_BATCH_TOTAL_BYTES", str(512 * 1024 * 1024)))
+# Plafonds du corps de requête : une image pour /predict, un lot complet pour /batch
+MAX_PREDICT_BYTES = MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES
+MAX_BATCH_BYTES = MAX_BATCH_TOTAL_BYTES + FORM_OVERHEAD_BYTES
+# Toutes les autres routes (JSON, formulaires de connexion)
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", str(1024 * 1024)))
+ROUTE_LIMITS = {
+    "/predictions/predict": MAX_PREDICT_BYTES,
+    "/predictions/batch": MAX_BATCH_BYTES,
+}
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+async def read_upload(upload: UploadFile, limit: int = MAX_UPLOAD_BYTES) -> bytes:
+    """Lit un fichier envoyé par morceaux et s'arrête dès que `limit` est dépassé."""
+    buffer = bytearray()
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            return bytes(buffer)
+        buffer += chunk
+        if len(buffer) > limit:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Fichier trop volumineux ({upload.filename}) : maximum {limit} octets",
+            )
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class BodySizeLimitMiddleware:
+    """
+    Refuse (413) les requêtes dont le corps dépasse le plafond de leur route
+    (`limits`, sinon `max_bytes`).
+
+    L'en-tête Content-Length est vérifié avant toute lecture (400 s'il n'est pas
+    un entier) ; pour un corps transmis par morceaux, les octets sont comptés au
+    fil de la réception et la lecture s'interrompt dès le dépassement.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_REQUEST_BYTES, limits: dict[str, int] = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.limits = ROUTE_LIMITS if limits is None else limits
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self.limits.get(scope["path"].rstrip("/"), self.max_bytes)
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None:
+            if not content_length.isdigit():
+                response = JSONResponse(status_code=400, content={"detail": "En-tête Content-Length invalide"})
+                await response(scope, receive, send)
+                return
+            if int(content_length) > max_bytes:
+                await self._reject(scope, receive, send, max_bytes)
+                return
+
+        received = 0
+        too_large = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    too_large = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if too_large:
+                # L'application a pu convertir l'interruption en erreur (ex. 400) : on répond 413
+                if not response_started:
+                    response_started = True
+                    await self._reject(scope, receive, send, max_bytes)
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except _BodyTooLarge:
+            if not response_started:
+                await self._reject(scope, receive, send, max_bytes)
+
+    async def _reject(self, scope, receive, send, max_bytes: int):
+        response = JSONResponse(
+            status_code=413,
+            content={"detail": f"Requête trop volumineuse : maximum {max_bytes} octets"},
+        )
+        await response(scope, receive, send)
@@ -1,15 +1,64 @@
+import time
+STARTED_AT = time.perf_counter()
+
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from app.database import Base, engine
 from app.auth.routes import router as auth_router
 from app.api.prediction import router as prediction_router
 from app.api.history import router as history_router
+from app.api.files import router as files_router
+from app.api.patients import router as patients_router
+from app.api.metrics import router as metrics_router
+from app.api.models import router as models_router
+from app.inference import engine as inference_engine, explain_engine, tta_engine
+from app import workers
+from app.model import MODEL_PRELOAD
+from app.api.ai.heatmap_jobs import heatmap_queue
+from app.limits import BodySizeLimitMiddleware
+from app.metrics import MetricsMiddleware
+from app.auth.hashing import hashing_pool
+from app.shadow import shadow_evaluator
 
-# Initialise la base
+# Initialise la base (tables absentes seulement) ; une base existante se met à
+# niveau une fois, application arrêtée : python -m app.migrate
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Pneumonia Backend")
+# Temps de démarrage mesuré depuis l'import de l'application
+startup_timings = {"cold_start_seconds": None}
+
+async def warmup_model():
+    await asyncio.to_thread(workers.warmup)
+    startup_timings["cold_start_seconds"] = round(time.perf_counter() - STARTED_AT, 3)
+    print(f"[INFO] ✅ Prêt en {startup_timings['cold_start_seconds']}s")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Démarre le pool de calcul puis le moteur d'inférence par micro-batchs
+    workers.start_pool()
+    inference_engine.start()
+    explain_engine.start()
+    tta_engine.start()
+    hashing_pool.start()
+    await heatmap_queue.start()
+    # Le modèle se charge en tâche de fond : l'API répond déjà, /ready indique la fin
+    warmup_task = asyncio.create_task(warmup_model()) if MODEL_PRELOAD else None
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+    await shadow_evaluator.stop()
+    await heatmap_queue.stop()
+    tta_engine.stop()
+    explain_engine.stop()
+    inference_engine.stop()
+    workers.shutdown_pool()
+    hashing_pool.shutdown()
+
+app = FastAPI(title="Pneumonia Backend", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -21,8 +70,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Sync-Cursor", "ETag", "Last-Modified", "Server-Timing", "Retry-After"],
 )
 
+# Taille maximale des requêtes (413 avant de lire un corps trop gros)
+app.add_middleware(BodySizeLimitMiddleware)
+
+# Durées par route, requêtes en cours et en-tête Server-Timing (SERVER_TIMING=1)
+app.add_middleware(MetricsMiddleware)
+
 # Servir les images statiquement depuis /uploads
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
@@ -30,7 +86,25 @@ app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 app.include_router(auth_router)
 app.include_router(prediction_router, prefix="/predictions", tags=["predictions"])
 app.include_router(history_router, prefix="/history", tags=["history"])
+app.include_router(patients_router)
+app.include_router(files_router, prefix="/files")
+app.include_router(metrics_router)
+app.include_router(models_router)
 
 @app.get("/")
 def read_root():
-    return {"message": "API OK"}
\ No newline at end of file
+    return {"message": "API OK"}
+
+@app.get("/ready")
+def readiness():
+    # Sans préchargement, le modèle est chargé à la première prédiction
+    ready = workers.is_ready() or not MODEL_PRELOAD
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "model_loaded": workers.is_ready(),
+            "model_load_seconds": {str(pid): round(t, 3) for pid, t in workers.ready_workers.items()},
+            "cold_start_seconds": startup_timings["cold_start_seconds"],
+        },
+    )
\ No newline at end of file
@@ -0,0 +1,358 @@
+# app/metrics.py
+"""
+Mesures de latence par étape et export au format texte Prometheus.
+
+    with timed("decode"):
+        ...
+
+Chaque durée alimente l'histogramme `pneumonie_stage_seconds{stage=...}` et,
+pendant une requête HTTP, la liste servie dans l'en-tête `Server-Timing`
+(SERVER_TIMING=1). Dans les processus de calcul (INFERENCE_WORKERS > 0), les
+mesures sont mises de côté puis renvoyées au processus API avec le résultat ;
+les threads du moteur d'inférence les relèvent par lot (`collect_stages`) et
+chaque requête les reprend à son compte (`add_request_stages`).
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter as Tally
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+# En-tête Server-Timing sur les réponses HTTP
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+# Routes /metrics/profiler/* (profileur par échantillonnage activable à chaud)
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape_label(value) -> str:
+    # Format d'exposition : \\, \" et \n dans les valeurs d'étiquettes
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict[tuple, float] = {}
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+    def collect(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}" for labels, value in values.items()
+        ]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self) -> list[str]:
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        lines = self.header()
+        for labels, (counts, total, count) in series.items():
+            bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+            for bound, bucket_count in zip(bounds, counts + [count]):
+                bucket_labels = _format_labels(self.labelnames, labels, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {bucket_count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """Valeur lue à chaque export : `fn()` renvoie un nombre ou une liste de `(labels, valeur)`."""
+
+    def __init__(self, name: str, help: str, fn: Callable, labelnames: tuple = (), type: str = "gauge"):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+        self.type = type
+
+    def collect(self) -> list[str]:
+        value = self.fn()
+        samples = value if isinstance(value, list) else [((), value)]
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, tuple(labels))} {float(v)}" for labels, v in samples
+        ]
+
+
+_registry: list[_Metric] = []
+
+
+def register(metric: _Metric) -> _Metric:
+    _registry.append(metric)
+    return metric
+
+
+def render() -> str:
+    """Toutes les métriques enregistrées, au format texte Prometheus 0.0.4."""
+    lines = []
+    for metric in _registry:
+        try:
+            lines.extend(metric.collect())
+        except Exception as e:
+            lines.append(f"# {metric.name} indisponible: {e}")
+    return "\n".join(lines) + "\n"
+
+
+stage_seconds = register(
+    Histogram("pneumonie_stage_seconds", "Durée des étapes du pipeline de prédiction", ("stage",))
+)
+http_request_seconds = register(
+    Histogram("pneumonie_http_request_seconds", "Durée des requêtes HTTP", ("method", "route", "status"))
+)
+http_requests_in_flight = register(Gauge("pneumonie_http_requests_in_flight", "Requêtes HTTP en cours"))
+inference_batch_size = register(
+    Histogram(
+        "pneumonie_inference_batch_size", "Taille des micro-batchs exécutés", ("engine",), (1, 2, 4, 8, 16, 32, 64)
+    )
+)
+inference_queue_wait_seconds = register(
+    Histogram("pneumonie_inference_queue_wait_seconds", "Attente dans la file du moteur d'inférence", ("engine",))
+)
+errors_total = register(Counter("pneumonie_errors_total", "Erreurs par opération", ("operation",)))
+
+
+# ---------------------------------------------------------------------------
+# Mesure des étapes
+# ---------------------------------------------------------------------------
+
+_request_timings: ContextVar[Optional[list]] = ContextVar("request_timings", default=None)
+# Processus de calcul : mesures mises de côté pour le processus API
+_buffer: Optional[list] = None
+
+
+def observe_stage(stage: str, seconds: float):
+    if _buffer is not None:
+        _buffer.append((stage, seconds))
+        return
+    stage_seconds.observe(seconds, stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def timed(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def collect_stages():
+    """
+    Relève les étapes mesurées dans le bloc (thread courant, ou rejouées depuis un
+    processus de calcul), en plus de l'histogramme ; pour les threads hors requête.
+    """
+    samples = []
+    token = _request_timings.set(samples)
+    try:
+        yield samples
+    finally:
+        _request_timings.reset(token)
+
+
+def add_request_stages(samples: list[tuple[str, float]]):
+    """Ajoute au Server-Timing de la requête en cours des étapes déjà comptées ailleurs."""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.extend(samples)
+
+
+def buffer_stages():
+    """À appeler dans un processus de calcul : les mesures seront relayées par `drain_stages`."""
+    global _buffer
+    _buffer = []
+
+
+def drain_stages() -> list[tuple[str, float]]:
+    global _buffer
+    if _buffer is None:
+        return []
+    samples, _buffer = _buffer, []
+    return samples
+
+
+def replay_stages(samples: list[tuple[str, float]]):
+    for stage, seconds in samples:
+        observe_stage(stage, seconds)
+
+
+class MetricsMiddleware:
+    """Durée et nombre de requêtes en cours par route ; en-tête Server-Timing si activé."""
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def timing_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings]
+                    entries.append(f"app;dur={(time.perf_counter() - start) * 1000:.1f}")
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", ", ".join(entries).encode())
+                    ]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, timing_send)
+        finally:
+            http_requests_in_flight.dec()
+            _request_timings.reset(token)
+            route = getattr(scope.get("route"), "path", "other")
+            http_request_seconds.observe(time.perf_counter() - start, scope["method"], route, str(status))
+
+
+# ---------------------------------------------------------------------------
+# Profileur par échantillonnage
+# ---------------------------------------------------------------------------
+
+
+class SamplingProfiler:
+    """
+    Relève périodiquement la pile de chaque thread (sys._current_frames) et
+    compte les piles identiques, au format « collapsed » des flamegraphs.
+    Coût nul tant qu'il n'est pas démarré.
+    """
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.stacks: Tally = Tally()
+        self.samples = 0
+        self.interval_ms = None
+        self.started_at = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: float = 10.0):
+        if self.running:
+            return
+        with self._lock:
+            self.stacks = Tally()
+            self.samples = 0
+        self.interval_ms = interval_ms
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval_ms / 1000):
+            if len(names) != threading.active_count():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, frame in frames.items():
+                    if thread_id == own_id:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                        frame = frame.f_back
+                    stack.append(names.get(thread_id, str(thread_id)))
+                    self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def status(self) -> dict:
+        return {
+            "running": self.running,
+            "interval_ms": self.interval_ms,
+            "started_at": self.started_at,
+            "samples": self.samples,
+        }
+
+    def collapsed(self, limit: int = None) -> str:
+        with self._lock:
+            stacks = self.stacks.most_common(limit)
+        return "\n".join(f"{stack} {count}" for stack, count in stacks) + "\n"
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,41 @@
+# app/migrate.py
+"""
+Mise à niveau du schéma d'une base existante, application arrêtée (étape de
+déploiement, une seule fois) :
+
+    python -m app.migrate
+
+Ajoute les colonnes déclarées absentes, fusionne les patients en double puis
+crée les index manquants, dont l'index unique des patients. Sans effet sur une
+base déjà à jour. Le rollup des statistiques se construit à part
+(`python -m app.stats backfill`).
+"""
+import argparse
+
+from sqlalchemy.orm import Session
+
+
+def migrate(bind=None) -> int:
+    """Met le schéma à niveau ; renvoie le nombre de patients en double fusionnés."""
+    from app.auth.crud import merge_duplicate_patients
+    from app.database import Base, create_missing_columns, create_missing_indexes, engine
+
+    bind = bind or engine
+    Base.metadata.create_all(bind=bind)
+    create_missing_columns(bind)
+    # Patients en double fusionnés avant la création de leur index unique
+    with Session(bind=bind) as db:
+        merged = merge_duplicate_patients(db)
+    create_missing_indexes(bind)
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args()
+    merged = migrate()
+    print(f"[INFO] ✅ Schéma à jour ({merged} patients en double fusionnés)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,13 @@
 # app/model.py
 from torchvision import models
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+import hashlib
+import json
+import os
+import threading
+import time
 import torch
 import torch.nn as nn
 
@@ -19,13 +27,247 @@ class ImprovedDenseNet121(nn.Module):
     def forward(self, x):
         return self.backbone(x)
 
-# Instancie le bon modèle
-model = ImprovedDenseNet121(num_classes=2, dropout_rate=0.5)
+# Chemin du state_dict
+model_path = os.getenv("MODEL_PATH", "app/api/ai/densenet121_improved93_pneumonia_detection.pth")
+# Charger le modèle au démarrage (lifespan) plutôt qu'à la première prédiction
+MODEL_PRELOAD = os.getenv("MODEL_PRELOAD", "1") == "1"
 
-# Charge le state_dict
-model_path = "app/api/ai/densenet121_improved93_pneumonia_detection.pth"
-state_dict = torch.load(model_path, map_location="cpu")
-model.load_state_dict(state_dict)
-model.eval()
+# Registre des modèles (JSON partagé par les processus API) : versions connues, modèle actif, candidat shadow
+MODEL_REGISTRY_FILE = os.getenv("MODEL_REGISTRY_FILE", "model_registry.json")
+# Intervalle (s) de relecture du registre et des fichiers de poids ; 0 = seulement à la demande
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", "5"))
+# Modèles gardés en mémoire par processus (le modèle actif n'est jamais évincé)
+MODEL_REGISTRY_SIZE = int(os.getenv("MODEL_REGISTRY_SIZE", "2"))
+DEFAULT_MODEL_NAME = "default"
+def load_model(path: str = model_path) -> ImprovedDenseNet121:
+    """
+    Construit ImprovedDenseNet121 et charge ses poids depuis `path`.
+
+    Le modèle est créé sur le device "meta" (aucune initialisation aléatoire), puis
+    ses paramètres sont assignés directement aux tenseurs du fichier mappé en mémoire :
+    les processus d'un même hôte partagent les pages du page cache au lieu de
+    garder chacun une copie privée des poids.
+    """
+    with torch.device("meta"):
+        model = ImprovedDenseNet121(num_classes=2, dropout_rate=0.5)
+    state_dict = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    model.load_state_dict(state_dict, assign=True)
+    model.eval()
+    return model
+
+
+def weights_version(path: str = model_path) -> str:
+    """Empreinte courte du fichier de poids (chemin, taille, date de modification)."""
+    stat = os.stat(path)
+    fingerprint = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha256(fingerprint.encode()).hexdigest()[:16]
+
+
+@dataclass(frozen=True)
+class ModelVersion:
+    """Version de modèle résolue : nom dans le registre, fichier de poids et empreinte."""
+
+    name: str
+    path: str
+    version: str
+
+
+class ModelRegistry:
+    """
+    Versions de modèle connues, modèle actif et candidat évalué en shadow.
+
+    L'état est un fichier JSON (MODEL_REGISTRY_FILE) :
+
+        {"models": {"default": "...pth", "v2": "...pth"}, "active": "v2",
+         "shadow": null, "shadow_rate": 0.0}
+
+    Il est relu toutes les MODEL_WATCH_INTERVAL secondes, comme l'empreinte des
+    fichiers de poids : éditer le fichier, remplacer des poids ou passer par
+    /models change le modèle actif sans redémarrage. Chaque requête résout sa
+    `ModelVersion` une fois puis la transmet jusqu'aux processus de calcul, qui
+    chargent ces poids à la demande (LRU de MODEL_REGISTRY_SIZE modèles) : les
+    requêtes en cours terminent sur l'ancien modèle.
+    """
+
+    def __init__(
+        self,
+        state_file: str,
+        default_path: str,
+        max_loaded: int = MODEL_REGISTRY_SIZE,
+        watch_interval: float = MODEL_WATCH_INTERVAL,
+    ):
+        self.state_file = state_file
+        self.default_path = default_path
+        self.max_loaded = max(1, max_loaded)
+        self.watch_interval = watch_interval
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._state: dict = {}
+        self._versions: dict[str, ModelVersion] = {}
+        self._checked_at = None
+        # Modèles chargés dans ce processus, et objets dérivés (backend, explainer)
+        self._loaded: OrderedDict = OrderedDict()
+        self.load_seconds: dict[str, float] = {}
+
+    # -- état partagé -------------------------------------------------------
+
+    def _read_state(self) -> dict:
+        state = {"models": {}, "active": DEFAULT_MODEL_NAME, "shadow": None, "shadow_rate": 0.0}
+        try:
+            with open(self.state_file) as f:
+                state.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            # Registre illisible (écriture manuelle en cours ?) : on garde l'état précédent
+            if self._state:
+                print(f"[WARN] Registre des modèles illisible, état précédent conservé: {e}")
+                return self._state
+            raise
+        state["models"] = {DEFAULT_MODEL_NAME: self.default_path, **state["models"]}
+        return state
+
+    def _write_state(self, state: dict):
+        folder = os.path.dirname(self.state_file)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = f"{self.state_file}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.state_file)
+
+    def refresh(self, force: bool = False):
+        """Relit le registre et les empreintes des poids (au plus toutes les `watch_interval` s)."""
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._checked_at is not None:
+                if self.watch_interval <= 0 or now - self._checked_at < self.watch_interval:
+                    return
+            self._checked_at = now
+            state = self._read_state()
+            versions = {}
+            for name, path in state["models"].items():
+                try:
+                    versions[name] = ModelVersion(name, path, weights_version(path))
+                except OSError:
+                    # Poids absents : version ignorée tant que le fichier n'existe pas
+                    continue
+            if state["active"] not in versions:
+                message = f"Modèle actif introuvable: {state['active']} ({state['models'].get(state['active'])})"
+                if not self._versions:
+                    raise RuntimeError(message)
+                print(f"[WARN] {message}, état précédent conservé")
+                return
+            previous = self._versions.get(self._state.get("active"))
+            self._state, self._versions = state, versions
+        if previous is not None and previous != versions[state["active"]]:
+            print(f"[INFO] 🔁 Modèle actif: {state['active']} ({versions[state['active']].version})")
+
+    def active(self) -> ModelVersion:
+        self.refresh()
+        with self._lock:
+            return self._versions[self._state["active"]]
+
+    def shadow(self) -> tuple[Optional[ModelVersion], float]:
+        """Candidat évalué en shadow et fraction du trafic qui lui est envoyée."""
+        self.refresh()
+        with self._lock:
+            candidate = self._versions.get(self._state.get("shadow"))
+            return candidate, float(self._state.get("shadow_rate") or 0.0) if candidate else 0.0
+
+    def resolve(self, name: str) -> ModelVersion:
+        self.refresh()
+        with self._lock:
+            if name not in self._versions:
+                raise KeyError(name)
+            return self._versions[name]
+
+    def find_version(self, version: str) -> Optional[ModelVersion]:
+        """Version enregistrée dont l'empreinte vaut `version`, s'il y en a une."""
+        self.refresh()
+        with self._lock:
+            return next((v for v in self._versions.values() if v.version == version), None)
+
+    def update(self, **changes):
+        """Modifie l'état partagé (register, activate, shadow) puis le recharge."""
+        with self._lock:
+            state = self._read_state()
+            models = changes.pop("models", {})
+            state["models"] = {**state["models"], **models}
+            state.update(changes)
+            state["models"].pop(DEFAULT_MODEL_NAME, None)
+            self._write_state(state)
+        self.refresh(force=True)
+
+    # -- modèles chargés dans ce processus ------------------------------------
+
+    def get(self, version: ModelVersion = None) -> ImprovedDenseNet121:
+        """Modèle de `version` (actif par défaut), chargé au premier appel."""
+        return self._entry(version or self.active())["model"]
+
+    def cached(self, version: Optional[ModelVersion], key: str, factory):
+        """Objet dérivé du modèle (`factory(modèle)`), créé une fois et évincé avec lui."""
+        version = version or self.active()
+        entry = self._entry(version)
+        if key not in entry:
+            with self._load_lock:
+                if key not in entry:
+                    entry[key] = factory(entry["model"])
+        return entry[key]
+
+    def _entry(self, version: ModelVersion) -> dict:
+        with self._lock:
+            entry = self._loaded.get(version)
+            if entry is not None:
+                self._loaded.move_to_end(version)
+                return entry
+        with self._load_lock:
+            with self._lock:
+                entry = self._loaded.get(version)
+            if entry is None:
+                start = time.perf_counter()
+                entry = {"model": load_model(version.path)}
+                self.load_seconds[version.version] = time.perf_counter() - start
+                print(
+                    f"[INFO] ✅ ImprovedDenseNet121 {version.name} ({version.version}) "
+                    f"chargé avec succès en {self.load_seconds[version.version]:.2f}s !"
+                )
+                with self._lock:
+                    self._loaded[version] = entry
+                    self._evict()
+        return entry
+
+    def _evict(self):
+        active = self._versions.get(self._state.get("active"))
+        for version in list(self._loaded):
+            if len(self._loaded) <= self.max_loaded:
+                break
+            if version != active:
+                del self._loaded[version]
+
+    def is_loaded(self, version: ModelVersion = None) -> bool:
+        version = version or self.active()
+        with self._lock:
+            return version in self._loaded
+
+    def status(self) -> dict:
+        self.refresh()
+        with self._lock:
+            return {
+                "active": self._state["active"],
+                "shadow": self._state.get("shadow"),
+                "shadow_rate": self._state.get("shadow_rate") or 0.0,
+                "models": {
+                    name: {
+                        "path": path,
+                        "version": self._versions[name].version if name in self._versions else None,
+                        "available": name in self._versions,
+                    }
+                    for name, path in self._state["models"].items()
+                },
+                "loaded": [version.name for version in self._loaded],
+            }
+
+
+registry = ModelRegistry(MODEL_REGISTRY_FILE, model_path)
 
-print("[INFO] ✅ ImprovedDenseNet121 chargé avec succès !")
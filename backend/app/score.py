@@ -0,0 +1,298 @@
+# app/score.py
+"""
+Rescoring hors ligne d'archives de radiographies.
+
+    python -m app.score ARCHIVE_DIR --output runs/rescore-2026 --format parquet
+
+Les images sont parcourues dans l'ordre lexicographique des chemins, décodées par un
+DataLoader multi-processus et classées par lots avec le backend d'inférence
+configuré (INFERENCE_BACKEND). Les résultats sont écrits par tranches
+(`part-<index>.csv|parquet`) dans le dossier de sortie ; `checkpoint.json`
+retient le dernier fichier traité, et relancer la même commande reprend là
+où le run précédent s'est arrêté.
+
+Avec `--to-db USERNAME --patients MANIFEST`, chaque tranche est aussi
+enregistrée dans `analysis_history` (une transaction par tranche). Le manifeste
+CSV associe chaque image à son patient (colonnes `file`, chemin relatif à
+ARCHIVE_DIR, puis `nom`, `prenom`, `age`, `sexe`) ; les images absentes du
+manifeste ne sont pas enregistrées. Les radios sont rangées dans le stockage
+comme celles de /predict, et une radio déjà enregistrée pour l'utilisateur avec
+la même version du modèle n'est pas insérée une seconde fois : une reprise après
+un arrêt entre le commit et le checkpoint ne crée pas de doublons.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+COLUMNS = [
+    "path",
+    "file_name",
+    "source_key",
+    "prob_normal",
+    "prob_pneumonia",
+    "verdict",
+    "probability",
+    "confidence",
+    "model_version",
+    "error",
+]
+
+
+def list_image_paths(root: str, after: str = None) -> list[str]:
+    """Chemins des images sous `root`, en ordre lexicographique, strictement après `after`."""
+    paths = sorted(
+        os.path.join(dirpath, name)
+        for dirpath, _, filenames in os.walk(root)
+        for name in filenames
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    return [path for path in paths if after is None or path > after]
+
+
+class ImageFolderDataset(Dataset):
+    def __init__(self, paths: list[str]):
+        self.paths = paths
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        from app.api.ai.pipeline import load_image
+        from app.storage import source_key
+
+        try:
+            with open(self.paths[index], "rb") as f:
+                data = f.read()
+            return index, load_image(data)[1], None, source_key(hashlib.sha256(data).hexdigest(), data)
+        except Exception as e:
+            return index, None, str(e), None
+
+
+def collate(items):
+    indices = [index for index, *_ in items]
+    tensors = [tensor for _, tensor, _, _ in items if tensor is not None]
+    errors = {index: error for index, _, error, _ in items if error is not None}
+    keys = {index: key for index, _, _, key in items}
+    return indices, torch.stack(tensors) if tensors else None, errors, keys
+
+
+def read_checkpoint(output_dir: str) -> dict:
+    try:
+        with open(os.path.join(output_dir, "checkpoint.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_checkpoint(output_dir: str, checkpoint: dict):
+    path = os.path.join(output_dir, "checkpoint.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def write_part(output_dir: str, part_index: int, rows: list[dict], fmt: str):
+    """Écrit une tranche de résultats ; réécrire une tranche existante est sans effet de bord."""
+    path = os.path.join(output_dir, f"part-{part_index:06d}.{fmt}")
+    if fmt == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise SystemExit("Le format parquet nécessite le paquet pyarrow") from e
+        # Schéma explicite : une tranche sans erreur (ou sans prédiction) garde les mêmes types
+        schema = pa.schema(
+            [
+                ("path", pa.string()),
+                ("file_name", pa.string()),
+                ("source_key", pa.string()),
+                ("prob_normal", pa.float64()),
+                ("prob_pneumonia", pa.float64()),
+                ("verdict", pa.string()),
+                ("probability", pa.float64()),
+                ("confidence", pa.string()),
+                ("model_version", pa.string()),
+                ("error", pa.string()),
+            ]
+        )
+        table = pa.Table.from_pylist(rows, schema=schema)
+        pq.write_table(table, path + ".tmp", compression="zstd")
+    else:
+        with open(path + ".tmp", "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+    os.replace(path + ".tmp", path)
+
+
+def read_manifest(path: str, root: str) -> dict:
+    """Manifeste des patients : chemin normalisé de l'image -> PatientCreate."""
+    from app.auth.schemas import PatientCreate
+
+    patients = {}
+    with open(path, newline="") as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                patients[os.path.normpath(os.path.join(root, row["file"]))] = PatientCreate(
+                    nom=row["nom"], prenom=row["prenom"], age=int(row["age"]), sexe=row["sexe"]
+                )
+            except (KeyError, TypeError, ValueError) as e:
+                raise SystemExit(f"Manifeste {path}, ligne {line} invalide: {e}")
+    return patients
+
+
+def save_to_db(username: str, rows: list[dict], patients: dict) -> int:
+    """Enregistre les lignes réussies dont le patient est connu ; renvoie le nombre d'analyses insérées."""
+    from app.auth import crud
+    from app.database import SessionLocal
+    from app.storage import store_source
+
+    rows = [row for row in rows if not row["error"] and os.path.normpath(row["path"]) in patients]
+    if not rows:
+        return 0
+    db = SessionLocal()
+    try:
+        user = crud.get_user_by_username(db, username)
+        if user is None:
+            raise SystemExit(f"Utilisateur inconnu: {username}")
+        # Reprise : radios déjà enregistrées par un run interrompu avant son checkpoint
+        done = crud.analysed_source_keys(db, user.id, [row["source_key"] for row in rows], rows[0]["model_version"])
+        entries = []
+        for row in rows:
+            if row["source_key"] in done:
+                continue
+            done.add(row["source_key"])
+            with open(row["path"], "rb") as f:
+                key = store_source(f.read())
+            entries.append(
+                (
+                    patients[os.path.normpath(row["path"])],
+                    row["file_name"],
+                    row["verdict"],
+                    row["probability"],
+                    row["confidence"],
+                    key,
+                    row["model_version"],
+                )
+            )
+        if entries:
+            crud.add_analyses_batch(db, user, entries)
+        return len(entries)
+    finally:
+        db.close()
+
+
+def score(args):
+    from app.api.ai.pipeline import classify, get_backend
+    from app.model import registry
+
+    os.makedirs(args.output, exist_ok=True)
+    patients = read_manifest(args.patients, args.root) if args.to_db else None
+    checkpoint = read_checkpoint(args.output)
+    model = registry.active()
+    version = model.version
+    if checkpoint and checkpoint.get("model_version") != version and not args.force:
+        raise SystemExit(
+            "Le checkpoint provient d'une autre version du modèle ; utilisez --force ou un autre --output"
+        )
+
+    paths = list_image_paths(args.root, after=checkpoint.get("last_path"))
+    if args.limit:
+        paths = paths[: args.limit]
+    done = checkpoint.get("done", 0)
+    part_index = checkpoint.get("parts", 0)
+    print(f"[INFO] {len(paths)} images à traiter ({done} déjà faites)")
+
+    loader = DataLoader(
+        ImageFolderDataset(paths),
+        batch_size=args.batch_size,
+        num_workers=args.loaders,
+        collate_fn=collate,
+        persistent_workers=args.loaders > 0,
+        prefetch_factor=4 if args.loaders > 0 else None,
+    )
+    backend = get_backend(model)
+
+    rows, start, processed = [], time.perf_counter(), 0
+    for indices, batch, errors, keys in loader:
+        probs = torch.softmax(backend(batch).float(), dim=1).tolist() if batch is not None else []
+        probs_iter = iter(probs)
+        for index in indices:
+            path = paths[index]
+            row = dict.fromkeys(COLUMNS, None)
+            row.update(path=path, file_name=os.path.basename(path), source_key=keys[index], model_version=version)
+            if index in errors:
+                row["error"] = errors[index]
+            else:
+                p = next(probs_iter)
+                result = classify(p)
+                row.update(
+                    prob_normal=p[0],
+                    prob_pneumonia=p[1],
+                    verdict=result["verdict"],
+                    probability=result["probability"],
+                    confidence=result["confidence"],
+                )
+            rows.append(row)
+
+        if len(rows) >= args.checkpoint_every:
+            processed += flush(args, rows, part_index, done + processed, version, patients)
+            part_index += 1
+            rows = []
+            elapsed = time.perf_counter() - start
+            print(f"[INFO] {done + processed} images — {processed / elapsed:.1f} img/s")
+
+    if rows:
+        processed += flush(args, rows, part_index, done + processed, version, patients)
+    elapsed = time.perf_counter() - start
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(f"[INFO] ✅ {processed} images en {elapsed:.1f}s — {rate:.1f} img/s")
+
+
+def flush(args, rows: list[dict], part_index: int, done_before: int, version: str, patients: dict = None) -> int:
+    write_part(args.output, part_index, rows, args.format)
+    if args.to_db:
+        saved = save_to_db(args.to_db, rows, patients)
+        missing = sum(1 for row in rows if not row["error"] and os.path.normpath(row["path"]) not in patients)
+        if missing:
+            print(f"[WARN] {missing} images sans patient dans le manifeste, non enregistrées")
+        print(f"[INFO] {saved} analyses enregistrées")
+    write_checkpoint(
+        args.output,
+        {
+            "model_version": version,
+            "last_path": rows[-1]["path"],
+            "done": done_before + len(rows),
+            "parts": part_index + 1,
+        },
+    )
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", help="dossier racine des radiographies")
+    parser.add_argument("--output", required=True, help="dossier des résultats et du checkpoint")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--loaders", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--checkpoint-every", type=int, default=2048, help="images par tranche écrite")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--to-db", metavar="USERNAME", help="enregistre aussi dans analysis_history")
+    parser.add_argument("--patients", metavar="MANIFEST", help="CSV file,nom,prenom,age,sexe (requis avec --to-db)")
+    parser.add_argument("--force", action="store_true", help="reprend malgré un changement de modèle")
+    args = parser.parse_args()
+    if args.to_db and not args.patients:
+        parser.error("--to-db nécessite --patients MANIFEST")
+    score(args)
+
+
+if __name__ == "__main__":
+    main()
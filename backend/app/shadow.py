@@ -0,0 +1,96 @@
+# app/shadow.py
+"""
+Évaluation shadow d'un modèle candidat.
+
+Une fraction `shadow_rate` des prédictions (voir le registre des modèles) est
+rejouée en tâche de fond avec le candidat, par le même moteur de micro-batchs.
+Seules des mesures en sortent (accord des verdicts, écart de probabilité) : la
+réponse et l'historique restent ceux du modèle actif.
+"""
+import asyncio
+import os
+import random
+import threading
+
+from app.inference import engine
+from app.metrics import Counter, Histogram, errors_total, register
+from app.model import ModelVersion, registry
+
+# Évaluations shadow en cours au plus ; au-delà, l'échantillon est abandonné
+SHADOW_MAX_PENDING = int(os.getenv("SHADOW_MAX_PENDING", "16"))
+
+shadow_predictions_total = register(
+    Counter(
+        "pneumonie_shadow_predictions_total",
+        "Prédictions rejouées par le candidat shadow, selon l'accord avec le modèle actif",
+        ("candidate", "agreement"),
+    )
+)
+shadow_probability_delta = register(
+    Histogram(
+        "pneumonie_shadow_probability_delta",
+        "Écart absolu de probabilité de pneumonie entre le candidat et le modèle actif",
+        ("candidate",),
+        (0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0),
+    )
+)
+
+
+class ShadowEvaluator:
+    def __init__(self, max_pending: int = SHADOW_MAX_PENDING):
+        self.max_pending = max_pending
+        self._tasks: set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+        self._results: dict[str, dict] = {}
+        self.dropped = 0
+
+    def maybe_submit(self, image_bytes: bytes, active: ModelVersion, probs: list[float]):
+        """Tire au sort la requête et, si elle est retenue, la rejoue avec le candidat en tâche de fond."""
+        candidate, rate = registry.shadow()
+        if candidate is None or candidate == active or random.random() >= rate:
+            return
+        if len(self._tasks) >= self.max_pending:
+            self.dropped += 1
+            return
+        task = asyncio.create_task(self._evaluate(candidate, image_bytes, probs))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _evaluate(self, candidate: ModelVersion, image_bytes: bytes, probs: list[float]):
+        try:
+            candidate_probs = await engine.submit((candidate, image_bytes))
+        except Exception:
+            errors_total.inc("shadow")
+            return
+        agree = candidate_probs.index(max(candidate_probs)) == probs.index(max(probs))
+        delta = abs(candidate_probs[1] - probs[1])
+        shadow_predictions_total.inc(candidate.name, "agree" if agree else "disagree")
+        shadow_probability_delta.observe(delta, candidate.name)
+        with self._lock:
+            result = self._results.setdefault(
+                candidate.version, {"name": candidate.name, "samples": 0, "agreements": 0, "delta_sum": 0.0}
+            )
+            result["samples"] += 1
+            result["agreements"] += agree
+            result["delta_sum"] += delta
+
+    def status(self) -> dict:
+        with self._lock:
+            candidates = {
+                version: {
+                    "name": result["name"],
+                    "samples": result["samples"],
+                    "agreement_rate": result["agreements"] / result["samples"],
+                    "mean_probability_delta": result["delta_sum"] / result["samples"],
+                }
+                for version, result in self._results.items()
+            }
+        return {"pending": len(self._tasks), "dropped": self.dropped, "candidates": candidates}
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+shadow_evaluator = ShadowEvaluator()
@@ -0,0 +1,226 @@
+# app/stats.py
+"""
+Statistiques de /history/stats, tenues à jour dans `analysis_stats_rollup` à
+chaque analyse enregistrée.
+
+Pour une base antérieure au rollup, le construire une fois à partir de
+l'historique, application arrêtée (étape de migration) :
+
+    python -m app.stats backfill
+"""
+import argparse
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.auth.models import AnalysisHistory, AnalysisStatsRollup, Patient
+
+# Durée de vie (s) des statistiques mises en cache par utilisateur (0 = pas de cache)
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "30"))
+
+
+def age_bucket(age) -> str:
+    if age is None:
+        return "inconnu"
+    if age >= 80:
+        return "80+"
+    low = max(0, age) // 10 * 10
+    return f"{low}-{low + 9}"
+
+
+def _bucket_key(user_id, timestamp, verdict, confidence, age, sexe) -> tuple:
+    day = (timestamp or datetime.utcnow()).date()
+    return (user_id, day, verdict, confidence, age_bucket(age), sexe or "inconnu")
+
+
+def _upsert(db: Session, buckets: dict):
+    """Ajoute les compteurs `buckets` ({clé: [count, probability_sum]}) à la table de rollup."""
+    table = AnalysisStatsRollup.__table__
+    key_columns = ["user_id", "day", "verdict", "confidence", "age_bucket", "sexe"]
+    dialect = db.get_bind().dialect.name
+    for key, (count, probability_sum) in buckets.items():
+        values = dict(zip(key_columns, key), count=count, probability_sum=probability_sum)
+        if dialect in ("sqlite", "postgresql"):
+            insert = sqlite_insert if dialect == "sqlite" else pg_insert
+            stmt = insert(table).values(**values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=key_columns,
+                set_={
+                    "count": table.c.count + stmt.excluded.count,
+                    "probability_sum": table.c.probability_sum + stmt.excluded.probability_sum,
+                },
+            )
+            db.execute(stmt)
+        else:
+            row = db.get(AnalysisStatsRollup, key)
+            if row is None:
+                db.add(AnalysisStatsRollup(**values))
+            else:
+                row.count += count
+                row.probability_sum += probability_sum
+
+
+def record_analyses(db: Session, analyses: list[tuple[AnalysisHistory, Patient]]):
+    """
+    Répercute de nouvelles analyses (déjà flushées) dans le rollup, dans la même
+    transaction que leur insertion. L'appelant invalide `stats_cache` après le commit.
+    """
+    buckets = defaultdict(lambda: [0, 0.0])
+    for history, patient in analyses:
+        age, sexe = (patient.age, patient.sexe) if patient is not None else (None, None)
+        key = _bucket_key(history.user_id, history.timestamp, history.verdict, history.confidence, age, sexe)
+        buckets[key][0] += 1
+        buckets[key][1] += history.probability or 0.0
+    _upsert(db, buckets)
+
+
+def backfill_rollup(db: Session, chunk_size: int = 1000) -> int:
+    """
+    Construit le rollup à partir de l'historique existant, en une transaction, si
+    la table est encore vide ; renvoie le nombre d'analyses comptées (0 si le rollup
+    existait déjà). Les analyses enregistrées pendant l'opération seraient comptées
+    deux fois : à lancer application arrêtée (`python -m app.stats backfill`).
+    """
+    if db.query(AnalysisStatsRollup).first() is not None:
+        return 0
+    rows = (
+        db.query(
+            AnalysisHistory.user_id,
+            AnalysisHistory.timestamp,
+            AnalysisHistory.verdict,
+            AnalysisHistory.confidence,
+            AnalysisHistory.probability,
+            Patient.age,
+            Patient.sexe,
+        )
+        .join(Patient, AnalysisHistory.patient_id == Patient.id)
+        .yield_per(chunk_size)
+    )
+    buckets = defaultdict(lambda: [0, 0.0])
+    counted = 0
+    for user_id, timestamp, verdict, confidence, probability, age, sexe in rows:
+        key = _bucket_key(user_id, timestamp, verdict, confidence, age, sexe)
+        buckets[key][0] += 1
+        buckets[key][1] += probability or 0.0
+        counted += 1
+    if buckets:
+        _upsert(db, buckets)
+        db.commit()
+    return counted
+
+
+def compute_stats(db: Session, user_id: int, date_from: date = None, date_to: date = None) -> dict:
+    """Statistiques de l'utilisateur, agrégées en SQL sur le rollup : coût O(buckets)."""
+    R = AnalysisStatsRollup
+    conditions = [R.user_id == user_id]
+    if date_from is not None:
+        conditions.append(R.day >= date_from)
+    if date_to is not None:
+        conditions.append(R.day < date_to)
+
+    def grouped(*columns):
+        return (
+            db.query(*columns, func.sum(R.count), func.sum(R.probability_sum))
+            .filter(*conditions)
+            .group_by(*columns)
+            .all()
+        )
+
+    total, probability_sum = 0, 0.0
+    by_verdict, by_confidence = {}, {}
+    for verdict, count, prob_sum in grouped(R.verdict):
+        by_verdict[verdict] = count
+        total += count
+        probability_sum += prob_sum or 0.0
+    for confidence, count, _ in grouped(R.confidence):
+        by_confidence[confidence] = count
+
+    daily = defaultdict(lambda: defaultdict(int))
+    for day, verdict, count, _ in grouped(R.day, R.verdict):
+        day = day if isinstance(day, date) else date.fromisoformat(day)
+        daily[day]["count"] += count
+        daily[day][verdict] += count
+    weekly = defaultdict(lambda: defaultdict(int))
+    for day, counts in daily.items():
+        year, week, _ = day.isocalendar()
+        for key, count in counts.items():
+            weekly[f"{year}-W{week:02d}"][key] += count
+
+    by_age = defaultdict(lambda: defaultdict(int))
+    for bucket, verdict, count, _ in grouped(R.age_bucket, R.verdict):
+        by_age[bucket]["count"] += count
+        by_age[bucket][verdict] += count
+    by_sexe = defaultdict(lambda: defaultdict(int))
+    for sexe, verdict, count, _ in grouped(R.sexe, R.verdict):
+        by_sexe[sexe]["count"] += count
+        by_sexe[sexe][verdict] += count
+
+    return {
+        "total": total,
+        "average_probability": round(probability_sum / total, 2) if total else None,
+        "by_verdict": by_verdict,
+        "by_confidence": by_confidence,
+        "daily": [{"day": day.isoformat(), **daily[day]} for day in sorted(daily)],
+        "weekly": [{"week": week, **weekly[week]} for week in sorted(weekly)],
+        "by_age": [{"age_bucket": bucket, **by_age[bucket]} for bucket in sorted(by_age)],
+        "by_sexe": [{"sexe": sexe, **by_sexe[sexe]} for sexe in sorted(by_sexe)],
+    }
+
+
+class StatsCache:
+    """Cache court (TTL) des statistiques, par utilisateur et par filtre."""
+
+    def __init__(self, ttl: float = STATS_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: dict[tuple, tuple[float, dict]] = {}
+
+    def get(self, key: tuple):
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                return None
+            return entry[1]
+
+    def put(self, key: tuple, value: dict):
+        if self.ttl > 0:
+            with self._lock:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+
+stats_cache = StatsCache()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["backfill"])
+    parser.parse_args()
+
+    from app.database import Base, SessionLocal, engine
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        counted = backfill_rollup(db)
+    if counted:
+        print(f"[INFO] ✅ Rollup construit à partir de {counted} analyses")
+    else:
+        print("[INFO] Rollup déjà construit (ou historique vide) : rien à faire")
+
+
+if __name__ == "__main__":
+    main()
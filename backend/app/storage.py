@@ -0,0 +1,261 @@
+# app/storage.py
+"""
+Stockage des radiographies, heatmaps et miniatures.
+
+Les objets sont adressés par leur contenu et donc immuables :
+    sources/<sha[:2]>/<sha>.<ext>                  radiographie d'origine (dédupliquée)
+    heatmaps/<sha[:2]>/<sha>-<modèle>.<format>     heatmap Grad-CAM (WebP/JPEG/PNG)
+    thumbs/<clé sans extension>.<format>           miniature d'une source ou d'une heatmap
+
+Deux backends : le système de fichiers local (STORAGE_BACKEND=local, sous
+STORAGE_ROOT) et un stockage compatible S3 (STORAGE_BACKEND=s3, paquet boto3).
+S3_ENDPOINT_URL permet de viser un équivalent local (MinIO, moto) en test.
+"""
+import hashlib
+import io
+import os
+import threading
+from typing import Optional
+
+from PIL import Image
+
+from app.dicom import is_dicom
+from app.metrics import timed
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+STORAGE_ROOT = os.getenv("STORAGE_ROOT", "storage")
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_PREFIX = os.getenv("S3_PREFIX", "")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+
+# Format et qualité des heatmaps et des miniatures (webp, jpg ou png)
+HEATMAP_FORMAT = os.getenv("HEATMAP_FORMAT", "webp")
+HEATMAP_QUALITY = int(os.getenv("HEATMAP_QUALITY", "80"))
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "160"))
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "70"))
+
+# Les clés changent avec le contenu : le client peut garder un objet indéfiniment,
+# mais seul le navigateur de l'utilisateur (données patient : jamais de cache partagé)
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+PIL_FORMATS = {"webp": "WEBP", "jpg": "JPEG", "png": "PNG"}
+CONTENT_TYPES = {
+    "webp": "image/webp",
+    "jpg": "image/jpeg",
+    "png": "image/png",
+    "bmp": "image/bmp",
+    "dcm": "application/dicom",
+    "bin": "application/octet-stream",
+}
+KEY_PREFIXES = ("sources/", "heatmaps/", "thumbs/")
+
+
+def content_type(key: str) -> str:
+    return CONTENT_TYPES.get(key.rsplit(".", 1)[-1], "application/octet-stream")
+
+
+def is_valid_key(key: str) -> bool:
+    return key.startswith(KEY_PREFIXES) and ".." not in key.split("/") and "\\" not in key
+
+
+class LocalStorage:
+    """Objets rangés sous `root`, écrits de façon atomique (fichier temporaire puis renommage)."""
+
+    def __init__(self, root: str = STORAGE_ROOT):
+        self.root = root
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.local_path(key))
+
+    def put(self, key: str, data: bytes, content_type: str):
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, key: str) -> bytes:
+        with open(self.local_path(key), "rb") as f:
+            return f.read()
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3Storage:
+    """Stockage compatible S3 ; le client boto3 est créé au premier usage, dans chaque processus."""
+
+    def __init__(self, bucket: str = S3_BUCKET, prefix: str = S3_PREFIX, endpoint_url: str = S3_ENDPOINT_URL):
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 nécessite S3_BUCKET")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            try:
+                import boto3
+            except ImportError as e:
+                raise RuntimeError("Le backend de stockage s3 nécessite le paquet boto3") from e
+            self._client = boto3.client("s3", endpoint_url=self.endpoint_url)
+        return self._client
+
+    def local_path(self, key: str) -> Optional[str]:
+        return None
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put(self, key: str, data: bytes, content_type: str):
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self.prefix + key,
+            Body=data,
+            ContentType=content_type,
+            CacheControl=IMMUTABLE_CACHE_CONTROL,
+        )
+
+    def get(self, key: str) -> bytes:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)["Body"].read()
+        except self.client.exceptions.NoSuchKey:
+            raise FileNotFoundError(key)
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+
+STORAGE_BACKENDS = {"local": LocalStorage, "s3": S3Storage}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """Backend de stockage configuré, créé une fois par processus."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if STORAGE_BACKEND not in STORAGE_BACKENDS:
+                    raise ValueError(
+                        f"STORAGE_BACKEND inconnu: {STORAGE_BACKEND} (attendu: {', '.join(STORAGE_BACKENDS)})"
+                    )
+                _storage = STORAGE_BACKENDS[STORAGE_BACKEND]()
+    return _storage
+
+
+SOURCE_EXTENSIONS = ("jpg", "png", "bmp", "dcm", "bin")
+
+
+def sniff_extension(data: bytes) -> str:
+    if data[:3] == b"\xff\xd8\xff":
+        return "jpg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if data[:2] == b"BM":
+        return "bmp"
+    if is_dicom(data):
+        return "dcm"
+    return "bin"
+
+
+def source_key(digest: str, image_bytes: bytes) -> str:
+    return f"sources/{digest[:2]}/{digest}.{sniff_extension(image_bytes)}"
+
+
+def source_key_candidates(digest: str) -> list[str]:
+    """Clés possibles de la radio d'empreinte `digest` (une par extension de sniff_extension)."""
+    return [f"sources/{digest[:2]}/{digest}.{ext}" for ext in SOURCE_EXTENSIONS]
+
+
+def key_digest(key: str) -> str:
+    """Empreinte de la radio d'origine d'un objet : source, heatmap ou miniature de l'une d'elles."""
+    return key.rsplit("/", 1)[-1].rsplit(".", 1)[0].split("-", 1)[0]
+
+
+def heatmap_key(digest: str, model_version: str) -> str:
+    # La heatmap dépend de l'image et du modèle : les deux entrent dans la clé
+    model_tag = hashlib.sha256(model_version.encode()).hexdigest()[:12]
+    return f"heatmaps/{digest[:2]}/{digest}-{model_tag}.{HEATMAP_FORMAT}"
+
+
+def thumbnail_key(key: str) -> str:
+    return f"thumbs/{key.rsplit('.', 1)[0]}.{HEATMAP_FORMAT}"
+
+
+def encode_image(image: Image.Image, quality: int = HEATMAP_QUALITY) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=PIL_FORMATS[HEATMAP_FORMAT], quality=quality)
+    return buffer.getvalue()
+
+
+def make_thumbnail(image: Image.Image) -> bytes:
+    thumb = image.convert("RGB") if image.mode not in ("L", "RGB") else image.copy()
+    thumb.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    return encode_image(thumb, THUMBNAIL_QUALITY)
+
+
+def store_source(image_bytes: bytes, digest: str = None) -> str:
+    """
+    Enregistre la radiographie (une seule fois par contenu) et sa miniature ; renvoie sa clé.
+
+    Les pixels d'un DICOM ne sont décodés que dans les processus de calcul : sa
+    miniature y est écrite lors de l'inférence (`store_source_thumbnail`).
+    """
+    digest = digest or hashlib.sha256(image_bytes).hexdigest()
+    key = source_key(digest, image_bytes)
+    storage = get_storage()
+    if not storage.exists(key):
+        if not is_dicom(image_bytes):
+            with timed("source_thumbnail"):
+                image = Image.open(io.BytesIO(image_bytes))
+                if image.format == "JPEG":
+                    image.draft("L" if image.mode == "L" else "RGB", (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+                thumbnail = make_thumbnail(image)
+            with timed("storage_write"):
+                storage.put(thumbnail_key(key), thumbnail, content_type(thumbnail_key(key)))
+        # La source en dernier : sa présence garantit celle de la miniature (écrite
+        # pendant l'inférence, qui précède, pour un DICOM)
+        with timed("storage_write"):
+            storage.put(key, image_bytes, content_type(key))
+    return key
+
+
+def store_source_thumbnail(image_bytes: bytes, image: Image.Image):
+    """Miniature d'une source DICOM, à partir de l'image déjà décodée par le processus de calcul."""
+    key = thumbnail_key(source_key(hashlib.sha256(image_bytes).hexdigest(), image_bytes))
+    storage = get_storage()
+    if not storage.exists(key):
+        with timed("source_thumbnail"):
+            thumbnail = make_thumbnail(image)
+        with timed("storage_write"):
+            storage.put(key, thumbnail, content_type(key))
+
+
+def store_heatmap(key: str, image: Image.Image):
+    """Encode la heatmap au format configuré et l'enregistre avec sa miniature."""
+    with timed("heatmap_encode"):
+        thumbnail, encoded = make_thumbnail(image), encode_image(image)
+    with timed("storage_write"):
+        storage = get_storage()
+        storage.put(thumbnail_key(key), thumbnail, content_type(thumbnail_key(key)))
+        storage.put(key, encoded, content_type(key))
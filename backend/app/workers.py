@@ -0,0 +1,211 @@
+# app/workers.py
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from typing import Optional
+from multiprocessing import shared_memory
+
+import torch
+
+from app import metrics
+from app.api.ai import pipeline
+from app.model import ModelVersion, registry
+
+# Nombre de processus de calcul (0 = exécution dans des threads du processus API)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "0"))
+# Threads intra-op torch par processus (par défaut : cœurs répartis entre les workers)
+TORCH_THREADS = int(
+    os.getenv("TORCH_THREADS", str(max(1, (os.cpu_count() or 1) // max(1, INFERENCE_WORKERS))))
+)
+
+_pool: Optional[ProcessPoolExecutor] = None
+# Durée de chargement du modèle par processus prêt (pid -> secondes)
+ready_workers: dict[int, float] = {}
+_ready = threading.Event()
+
+
+class SharedBytes:
+    """Copie des octets dans un segment de mémoire partagée, libéré en sortie de contexte."""
+
+    def __init__(self, data: bytes):
+        self.size = len(data)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, self.size))
+        self._shm.buf[: self.size] = data
+
+    @property
+    def ref(self) -> tuple[str, int]:
+        return self._shm.name, self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._shm.close()
+        self._shm.unlink()
+
+
+def _read_shared(name: str, size: int) -> bytes:
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(shm.buf[:size])
+    finally:
+        shm.close()
+
+
+def _init_worker(torch_threads: int):
+    # Les durées des étapes sont renvoyées au processus API avec chaque résultat
+    metrics.buffer_stages()
+    torch.set_num_threads(torch_threads)
+    torch.set_num_interop_threads(1)
+
+
+def _warmup(version: ModelVersion) -> tuple[int, float]:
+    # Le modèle est chargé une seule fois par processus (mémoire mappée partagée)
+    return os.getpid(), pipeline.warmup(version)
+
+
+def _predict_shared(refs: list[tuple[str, int]], version: ModelVersion):
+    probs = pipeline.predict_images([_read_shared(*ref) for ref in refs], version)
+    return probs, metrics.drain_stages()
+
+
+def _explain_shared(refs: list[tuple[str, int]], heatmap_keys: list[str], version: ModelVersion):
+    probs = pipeline.predict_and_explain_images([_read_shared(*ref) for ref in refs], heatmap_keys, version)
+    return probs, metrics.drain_stages()
+
+
+def _tta_shared(refs: list[tuple[str, int]], versions: tuple[ModelVersion, ...]):
+    probs = pipeline.predict_tta_images([_read_shared(*ref) for ref in refs], versions)
+    return probs, metrics.drain_stages()
+
+
+def _heatmap_shared(ref: tuple[str, int], class_id: int, heatmap_key: str, version: ModelVersion):
+    pipeline.render_heatmap(_read_shared(*ref), class_id, heatmap_key, version)
+    return None, metrics.drain_stages()
+
+
+def _unpack(result_and_stages):
+    result, stages = result_and_stages
+    metrics.replay_stages(stages)
+    return result
+
+
+def start_pool():
+    """Démarre le pool de processus, si configuré."""
+    global _pool
+    if INFERENCE_WORKERS <= 0:
+        if "TORCH_THREADS" in os.environ:
+            torch.set_num_threads(TORCH_THREADS)
+        return
+    if _pool is not None:
+        return
+    # "spawn" : pas de fork d'un processus où OpenMP est déjà initialisé
+    _pool = ProcessPoolExecutor(
+        max_workers=INFERENCE_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(TORCH_THREADS,),
+    )
+
+
+def preload(version: ModelVersion) -> dict[int, float]:
+    """Charge `version` dans chaque processus de calcul (ou dans le processus API) ; pid -> secondes."""
+    if _pool is None:
+        return {os.getpid(): pipeline.warmup(version)}
+    loaded = {}
+    for future in [_pool.submit(_warmup, version) for _ in range(INFERENCE_WORKERS)]:
+        pid, seconds = future.result()
+        loaded[pid] = seconds
+    return loaded
+
+
+def warmup():
+    """Charge le modèle actif dans chaque processus de calcul (ou dans le processus API)."""
+    ready_workers.update(preload(registry.active()))
+    _ready.set()
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+    ready_workers.clear()
+    _ready.clear()
+
+
+def _by_version(items: list[tuple], run) -> list:
+    """
+    Exécute `run(version, lot)` par version de modèle, ou par ensemble de versions
+    (un lot peut chevaucher un changement de modèle).
+    """
+    groups: dict = {}
+    for i, item in enumerate(items):
+        groups.setdefault(item[0], []).append(i)
+    results = [None] * len(items)
+    for version, indices in groups.items():
+        for i, result in zip(indices, run(version, [items[i][1:] for i in indices])):
+            results[i] = result
+    return results
+
+
+def _predict_batch(version: ModelVersion, items: list[tuple[bytes]]) -> list[list[float]]:
+    images = [data for data, in items]
+    if _pool is None:
+        return pipeline.predict_images(images, version)
+    with ExitStack() as stack:
+        refs = [stack.enter_context(SharedBytes(data)).ref for data in images]
+        return _unpack(_pool.submit(_predict_shared, refs, version).result())
+
+
+def _explain_batch(version: ModelVersion, items: list[tuple[bytes, str]]) -> list[list[float]]:
+    images = [data for data, _ in items]
+    heatmap_keys = [heatmap_key for _, heatmap_key in items]
+    if _pool is None:
+        return pipeline.predict_and_explain_images(images, heatmap_keys, version)
+    with ExitStack() as stack:
+        refs = [stack.enter_context(SharedBytes(data)).ref for data in images]
+        return _unpack(_pool.submit(_explain_shared, refs, heatmap_keys, version).result())
+
+
+def _tta_batch(versions: tuple[ModelVersion, ...], items: list[tuple[bytes]]) -> list[list[float]]:
+    images = [data for data, in items]
+    if _pool is None:
+        return pipeline.predict_tta_images(images, versions)
+    with ExitStack() as stack:
+        refs = [stack.enter_context(SharedBytes(data)).ref for data in images]
+        return _unpack(_pool.submit(_tta_shared, refs, versions).result())
+
+
+def run_predict_batch(items: list[tuple[ModelVersion, bytes]]) -> list[list[float]]:
+    """Classe un lot de `(version, image)`, dans le pool si disponible, sinon dans le thread appelant."""
+    return _by_version(items, _predict_batch)
+
+
+def run_explain_batch(items: list[tuple[ModelVersion, bytes, str]]) -> list[list[float]]:
+    """Classe un lot de `(version, image, clé_heatmap)` et écrit les heatmaps en une seule passe."""
+    return _by_version(items, _explain_batch)
+
+
+def run_tta_batch(items: list[tuple[tuple[ModelVersion, ...], bytes]]) -> list[list[float]]:
+    """Second passage d'un lot de `(versions, image)` : vues augmentées et ensemble, moyennés."""
+    return _by_version(items, _tta_batch)
+
+
+async def run_heatmap(image_bytes: bytes, class_id: int, heatmap_key: str, version: ModelVersion = None):
+    """Génère la heatmap Grad-CAM hors de la boucle asyncio (modèle actif par défaut)."""
+    version = version or registry.active()
+    if _pool is None:
+        # to_thread copie le contexte : les étapes rejoignent le Server-Timing de la requête
+        await asyncio.to_thread(pipeline.render_heatmap, image_bytes, class_id, heatmap_key, version)
+        return
+    loop = asyncio.get_running_loop()
+    with SharedBytes(image_bytes) as shm:
+        _unpack(await loop.run_in_executor(_pool, _heatmap_shared, shm.ref, class_id, heatmap_key, version))
@@ -0,0 +1,10 @@
+"""
+Benchmarks du pipeline de prédiction (à lancer depuis `backend/`).
+
+    python -m bench.pipeline --output bench/results/pipeline.json
+    python -m bench.load --requests 200 --concurrency 8
+    python -m bench.compare bench/results/avant.json bench/results/apres.json
+
+Les images sont synthétiques (taille d'une radiographie) et, sans `--weights`,
+le modèle est initialisé aléatoirement : aucun fichier .pth n'est nécessaire.
+"""
@@ -0,0 +1,140 @@
+# bench/common.py
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from PIL import Image
+
+RESULTS_FOLDER = os.path.join("bench", "results")
+
+
+def parse_size(value: str) -> tuple[int, int]:
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def parse_ints(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def synthetic_xray(size: tuple[int, int] = (2048, 2500), seed: int = 0) -> Image.Image:
+    """Image en niveaux de gris ressemblant grossièrement à une radio thoracique (gradients, côtes, bruit)."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    cx, cy = width / 2, height / 2
+    lungs = np.exp(-(((x - cx) / (0.45 * width)) ** 2 + ((y - cy) / (0.5 * height)) ** 2))
+    ribs = 0.15 * np.sin(y / height * 40 + rng.uniform(0, np.pi)) * (np.abs(x - cx) > 0.08 * width)
+    noise = rng.normal(0, 0.05, size=(height, width)).astype(np.float32)
+    pixels = np.clip((0.3 + 0.5 * lungs + ribs + noise) * 255, 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels, mode="L")
+
+
+def encode_image(image: Image.Image, fmt: str = "jpeg", quality: int = 90) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt.upper(), quality=quality)
+    return buffer.getvalue()
+
+
+def synthetic_images(count: int, size: tuple[int, int], fmt: str = "jpeg") -> list[bytes]:
+    """`count` images distinctes (octets différents : pas de succès du cache de prédictions)."""
+    return [encode_image(synthetic_xray(size, seed=i), fmt) for i in range(count)]
+
+
+def prepare_environment(weights: str = None) -> str:
+    """
+    Isole le run dans un dossier temporaire (base SQLite, stockage) et, sans
+    `weights`, écrit des poids aléatoires. À appeler avant tout import de `app`,
+    dont la configuration est lue à l'import.
+    """
+    workdir = tempfile.mkdtemp(prefix="pneumonie-bench-")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    os.environ.setdefault("STORAGE_ROOT", os.path.join(workdir, "storage"))
+    os.environ["MODEL_PATH"] = weights or os.path.join(workdir, "random_weights.pth")
+    if weights is None:
+        # MODEL_PATH est déjà positionné : app.model le lit à l'import
+        import torch
+        from app.model import ImprovedDenseNet121
+
+        torch.manual_seed(0)
+        model = ImprovedDenseNet121(num_classes=2, dropout_rate=0.5)
+        torch.save(model.state_dict(), os.environ["MODEL_PATH"])
+    return workdir
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(durations: list[float], items: int = 1) -> dict:
+    """Statistiques (ms) d'une série de durées en secondes ; `items` = images traitées par appel."""
+    ms = [d * 1000 for d in durations]
+    p50 = statistics.median(ms)
+    return {
+        "runs": len(ms),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "p50_ms": round(p50, 3),
+        "p90_ms": round(percentile(ms, 90), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "min_ms": round(min(ms), 3),
+        "max_ms": round(max(ms), 3),
+        "per_item_ms": round(p50 / items, 3),
+        "items_per_s": round(items * 1000 / p50, 2) if p50 else None,
+    }
+
+
+def measure(fn, repeat: int, warmup: int = 1) -> list[float]:
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    info = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+    try:
+        import torch
+
+        info["torch"] = torch.__version__
+        info["torch_threads"] = torch.get_num_threads()
+    except ImportError:
+        pass
+    return info
+
+
+def default_output(name: str) -> str:
+    commit = environment()["commit"] or "workdir"
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    return os.path.join(RESULTS_FOLDER, f"{name}-{commit}-{stamp}.json")
+
+
+def save_results(path: str, payload: dict):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2)
+    print(f"[INFO] Résultats enregistrés dans {path}")
@@ -0,0 +1,56 @@
+# bench/compare.py
+"""
+Compare deux fichiers de résultats (bench.pipeline ou bench.load).
+
+    python -m bench.compare bench/results/avant.json bench/results/apres.json --threshold 10
+
+Les mesures sont appariées par étape, taille de lot et nombre de threads ; le
+code de sortie vaut 1 si une médiane se dégrade de plus de `--threshold` %.
+"""
+import argparse
+import json
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def metrics(payload: dict) -> dict:
+    """{identifiant de mesure: valeur en ms (plus bas = mieux)}."""
+    values = {}
+    for row in payload["results"]:
+        if payload.get("kind") == "load":
+            for name, value in (row.get("latency_ms") or {}).items():
+                values[f"latence {name} (c={row['concurrency']})"] = value
+            continue
+        label = " ".join(
+            f"{key}={row[key]}" for key in ("backend", "mode", "batch_size", "threads") if key in row
+        )
+        values[f"{row['stage']} {label}"] = row["p50_ms"]
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="dégradation tolérée (%%)")
+    args = parser.parse_args()
+
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    print(f"référence : {baseline['environment'].get('commit')}  candidat : {candidate['environment'].get('commit')}")
+    before, after = metrics(baseline), metrics(candidate)
+    regressions = 0
+    for name in sorted(before.keys() & after.keys()):
+        delta = (after[name] - before[name]) / before[name] * 100 if before[name] else 0.0
+        flag = ""
+        if delta > args.threshold:
+            flag = "  ⚠️ régression"
+            regressions += 1
+        print(f"{name:<45}{before[name]:>10.2f}{after[name]:>10.2f} ms{delta:>+9.1f}%{flag}")
+    raise SystemExit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# bench/load.py
+"""
+Générateur de charge HTTP pour /predictions/predict.
+
+Sans `--url`, l'application FastAPI est démarrée dans le processus (lifespan
+compris) avec une base, un stockage et des poids aléatoires temporaires ; avec
+`--url http://127.0.0.1:8000`, la charge vise un uvicorn déjà lancé.
+
+    python -m bench.load --requests 200 --concurrency 8
+    python -m bench.load --url http://127.0.0.1:8000 --requests 500 --concurrency 32
+
+Nécessite le paquet httpx.
+"""
+import argparse
+import asyncio
+import importlib.util
+import time
+import uuid
+from collections import Counter
+
+from bench.common import (
+    default_output,
+    environment,
+    parse_size,
+    percentile,
+    prepare_environment,
+    save_results,
+    synthetic_images,
+)
+
+READY_TIMEOUT = 300
+
+
+async def authenticate(client) -> dict:
+    """Crée un utilisateur jetable et renvoie l'en-tête d'authentification."""
+    username = f"bench-{uuid.uuid4().hex[:8]}"
+    response = await client.post(
+        "/auth/register",
+        json={
+            "username": username,
+            "password": uuid.uuid4().hex,
+            "first_name": "Bench",
+            "last_name": "Load",
+            "email": f"{username}@example.com",
+        },
+    )
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def wait_ready(client):
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline:
+        if (await client.get("/ready")).status_code == 200:
+            return
+        await asyncio.sleep(0.5)
+    raise SystemExit("L'API n'est pas prête (GET /ready)")
+
+
+async def run_load(client, args, images: list[bytes]) -> dict:
+    headers = await authenticate(client)
+    queue = asyncio.Queue()
+    for i in range(args.requests):
+        queue.put_nowait(i)
+    latencies, statuses = [], Counter()
+
+    async def worker():
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            files = {"file": (f"bench_{i}.jpg", images[i % len(images)], "image/jpeg")}
+            data = {"nom": "BENCH", "prenom": f"p{i}", "age": "50", "sexe": "M"}
+            start = time.perf_counter()
+            try:
+                response = await client.post("/predictions/predict", files=files, data=data, headers=headers)
+                statuses[str(response.status_code)] += 1
+            except Exception as e:
+                statuses[type(e).__name__] += 1
+                continue
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    ms = [latency * 1000 for latency in latencies]
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "succeeded": len(latencies),
+        "statuses": dict(statuses),
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": round(percentile(ms, 50), 2),
+            "p90": round(percentile(ms, 90), 2),
+            "p99": round(percentile(ms, 99), 2),
+            "max": round(max(ms), 2),
+        }
+        if ms
+        else None,
+    }
+
+
+async def main_async(args, images: list[bytes]) -> dict:
+    import httpx
+
+    timeout = httpx.Timeout(args.timeout)
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=timeout) as client:
+            await wait_ready(client)
+            return await run_load(client, args, images)
+
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=timeout) as client:
+            await wait_ready(client)
+            return await run_load(client, args, images)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="API déjà lancée (sinon application dans le processus)")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--images", type=int, default=None, help="images distinctes (défaut: une par requête)")
+    parser.add_argument("--size", type=parse_size, default=(2048, 2500), help="LARGEURxHAUTEUR")
+    parser.add_argument("--weights", help="fichier .pth pour l'application dans le processus")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="fichier JSON des résultats")
+    args = parser.parse_args()
+
+    if importlib.util.find_spec("httpx") is None:
+        raise SystemExit("bench.load nécessite le paquet httpx")
+    if not args.url:
+        prepare_environment(args.weights)
+
+    # Par défaut une image par requête : le cache de prédictions ne fausse pas la mesure
+    images = synthetic_images(args.images or args.requests, args.size)
+    summary = asyncio.run(main_async(args, images))
+    print(
+        f"[INFO] {summary['succeeded']}/{summary['requests']} requêtes réussies "
+        f"en {summary['duration_s']}s — {summary['throughput_rps']} req/s, latences {summary['latency_ms']}"
+    )
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    config["target"] = args.url or "in-process"
+    save_results(
+        args.output or default_output("load"),
+        {"kind": "load", "environment": environment(), "config": config, "results": [summary]},
+    )
+
+
+if __name__ == "__main__":
+    main()
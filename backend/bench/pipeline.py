@@ -0,0 +1,154 @@
+# bench/pipeline.py
+"""
+Micro-benchmarks des étapes de /predictions/predict, mesurées séparément :
+
+    decode        app.api.ai.pipeline.load_image, chemin exact de l'API (mode draft
+                  JPEG, redimensionnement et tenseur d'entrée)
+    preprocess    préparation du tenseur à partir de l'image déjà décodée
+    forward       passe avant ImprovedDenseNet121 (backend INFERENCE_BACKEND ou --backend)
+    gradcam       prédiction + Grad-CAM (GradCAMExplainer)
+    heatmap       superposition, encodage WebP/JPEG, miniature et écriture dans le stockage
+    db            insertion patient + analyse (une par transaction, puis par lot)
+
+    python -m bench.pipeline --batch-sizes 1,4,16 --threads 1,4 --output bench/results/pipeline.json
+"""
+import argparse
+import os
+
+from bench.common import (
+    default_output,
+    environment,
+    measure,
+    parse_ints,
+    parse_size,
+    prepare_environment,
+    save_results,
+    summarize,
+    synthetic_images,
+)
+
+STAGES = ["decode", "preprocess", "forward", "gradcam", "heatmap", "db"]
+
+
+def bench_decode(args, images, rows):
+    from app.api.ai.pipeline import load_image, preprocess
+
+    if "decode" in args.stages:
+        durations = measure(lambda: [load_image(data) for data in images], args.repeat, args.warmup)
+        rows.append({"stage": "decode", "batch_size": len(images), **summarize(durations, len(images))})
+    decoded = [load_image(data)[0] for data in images]
+    if "preprocess" in args.stages:
+        durations = measure(lambda: [preprocess(image) for image in decoded], args.repeat, args.warmup)
+        rows.append({"stage": "preprocess", "batch_size": len(images), **summarize(durations, len(images))})
+
+
+def bench_model(args, images, rows):
+    import torch
+
+    from app.api.ai.generate_gradcam import GradCAMExplainer, save_heatmap
+    from app.api.ai.pipeline import load_image
+    from app.backends import load_backend
+    from app.model import load_model, model_path
+
+    model = load_model(model_path)
+    backend = load_backend(args.backend, model)
+    explainer = GradCAMExplainer(model)
+    decoded = [load_image(data) for data in images]
+
+    for threads in args.threads:
+        torch.set_num_threads(threads)
+        for batch_size in args.batch_sizes:
+            tensors = [decoded[i % len(decoded)][1] for i in range(batch_size)]
+            batch = torch.stack(tensors)
+            config = {"batch_size": batch_size, "threads": threads}
+            if "forward" in args.stages:
+                durations = measure(lambda: backend(batch), args.repeat, args.warmup)
+                rows.append({"stage": "forward", "backend": args.backend, **config, **summarize(durations, batch_size)})
+            if "gradcam" in args.stages:
+                durations = measure(lambda: explainer(batch), args.repeat, args.warmup)
+                rows.append({"stage": "gradcam", **config, **summarize(durations, batch_size)})
+
+    if "heatmap" in args.stages:
+        _, cams = explainer(torch.stack([decoded[0][1]]))
+        image = decoded[0][0]
+        keys = iter(f"heatmaps/bench/{i}.webp" for i in range(10**9))
+        durations = measure(lambda: save_heatmap(image, cams[0], next(keys)), args.repeat, args.warmup)
+        rows.append({"stage": "heatmap", "batch_size": 1, **summarize(durations)})
+
+
+def bench_db(args, rows):
+    from app.auth import crud
+    from app.auth.schemas import PatientCreate
+    from app.database import Base, SessionLocal, engine
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        user = crud.get_user_by_username(db, "bench") or crud.create_user(
+            db, "bench", "x" * 60, "Bench", "Mark", "bench@example.com"
+        )
+        patient = PatientCreate(nom="BENCH", prenom="patient", age=50, sexe="M")
+        durations = measure(
+            lambda: crud.add_patient_analysis(db, user.id, patient, "bench.jpg", "negative", 91.2, "high"),
+            args.repeat,
+            args.warmup,
+        )
+        rows.append({"stage": "db", "mode": "single", "batch_size": 1, **summarize(durations)})
+        for batch_size in args.batch_sizes:
+            entries = [(patient, "bench.jpg", "negative", 91.2, "high", None, None)] * batch_size
+            durations = measure(lambda: crud.add_analyses_batch(db, user, entries), args.repeat, args.warmup)
+            rows.append({"stage": "db", "mode": "batch", "batch_size": batch_size, **summarize(durations, batch_size)})
+    finally:
+        db.close()
+
+
+def print_rows(rows: list[dict]):
+    print(f"{'étape':<11}{'lot':>5}{'threads':>9}{'p50 ms':>10}{'p90 ms':>10}{'ms/image':>10}{'img/s':>9}")
+    for row in rows:
+        print(
+            f"{row['stage']:<11}{row.get('batch_size', ''):>5}{row.get('threads', ''):>9}"
+            f"{row['p50_ms']:>10.2f}{row['p90_ms']:>10.2f}{row['per_item_ms']:>10.2f}{row['items_per_s'] or 0:>9.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=8, help="images synthétiques distinctes")
+    parser.add_argument("--size", type=parse_size, default=(2048, 2500), help="LARGEURxHAUTEUR")
+    parser.add_argument("--format", choices=["jpeg", "png"], default="jpeg")
+    parser.add_argument("--batch-sizes", type=parse_ints, default=[1, 4, 8, 16])
+    parser.add_argument("--threads", type=parse_ints, default=sorted({1, os.cpu_count() or 1}))
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--backend", default=None, help="backend d'inférence (défaut: INFERENCE_BACKEND)")
+    parser.add_argument("--weights", help="fichier .pth (défaut: poids aléatoires)")
+    parser.add_argument("--stages", type=lambda v: v.split(","), default=STAGES)
+    parser.add_argument("--output", help="fichier JSON des résultats")
+    args = parser.parse_args()
+
+    workdir = prepare_environment(args.weights)
+    from app.backends import INFERENCE_BACKEND
+
+    args.backend = args.backend or INFERENCE_BACKEND
+    images = synthetic_images(args.images, args.size, args.format)
+    print(f"[INFO] {len(images)} images {args.size[0]}x{args.size[1]} ({args.format}), dossier de travail {workdir}")
+
+    rows = []
+    if {"decode", "preprocess"} & set(args.stages):
+        bench_decode(args, images, rows)
+    if {"forward", "gradcam", "heatmap"} & set(args.stages):
+        bench_model(args, images, rows)
+    if "db" in args.stages:
+        bench_db(args, rows)
+
+    print_rows(rows)
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    config["image_bytes_mean"] = sum(map(len, images)) // len(images)
+    save_results(
+        args.output or default_output("pipeline"),
+        {"kind": "pipeline", "environment": environment(), "config": config, "results": rows},
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# tests/conftest.py
+"""
+Configuration commune des tests : base SQLite, stockage et registre des modèles
+dans un dossier temporaire, renseignés avant le premier import de `app`.
+
+Lancer depuis backend/ : python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_ROOT = tempfile.mkdtemp(prefix="pneumonie-tests-")
+
+os.environ.update(
+    {
+        "DATABASE_URL": f"sqlite:///{TEST_ROOT}/test.db",
+        "STORAGE_ROOT": f"{TEST_ROOT}/storage",
+        "MODEL_PATH": f"{TEST_ROOT}/weights.pth",
+        "MODEL_REGISTRY_FILE": f"{TEST_ROOT}/model_registry.json",
+        "MODEL_PRELOAD": "0",
+        "MODEL_WATCH_INTERVAL": "0",
+        "INFERENCE_WORKERS": "0",
+        "BCRYPT_ROUNDS": "4",
+        "STATS_CACHE_TTL": "0",
+    }
+)
+# Poids factices : le registre n'a besoin que de leur empreinte tant qu'aucun modèle n'est chargé
+open(os.environ["MODEL_PATH"], "wb").close()
+
+sys.path.insert(0, BACKEND_DIR)
+# L'application monte uploads/ relativement au dossier courant
+os.chdir(BACKEND_DIR)
+
+import itertools  # noqa: E402
+
+import pytest  # noqa: E402
+
+_usernames = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def app():
+    from app.main import app
+
+    return app
+
+
+@pytest.fixture()
+def client(app):
+    from fastapi.testclient import TestClient
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture()
+def db():
+    from app.database import SessionLocal
+
+    with SessionLocal() as session:
+        yield session
+
+
+@pytest.fixture()
+def make_user(app, db):
+    """Crée un utilisateur neuf (historique vide) ; renvoie (Principal, en-têtes d'authentification)."""
+    from app.auth import crud
+    from app.auth.security import Principal, create_access_token
+
+    def make():
+        username = f"user{next(_usernames)}"
+        created = crud.create_user(db, username, "x", "Jean", "Test", f"{username}@example.org")
+        token = create_access_token({"sub": username, "uid": created.id})
+        return Principal.from_user(created), {"Authorization": f"Bearer {token}"}
+
+    return make
+
+
+@pytest.fixture()
+def user(make_user):
+    return make_user()
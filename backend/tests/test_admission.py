@@ -0,0 +1,153 @@
+# tests/test_admission.py
+import asyncio
+import io
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+from app import admission as admission_module
+from app.admission import AdmissionController, resolve_lane
+from app.api import prediction
+
+ALICE = {"nom": "Martin", "prenom": "Alice", "age": "40", "sexe": "feminin"}
+
+
+async def hold(controller, lane, release, order, shed=True):
+    async with controller.slot(lane, shed=shed):
+        order.append(lane)
+        await release.wait()
+
+
+def test_freed_slots_go_to_the_most_urgent_lane_first():
+    async def scenario():
+        controller = AdmissionController(concurrency=1, queue_limit=10, timeout=5)
+        release, order = asyncio.Event(), []
+        first = asyncio.create_task(hold(controller, "routine", release, order))
+        await asyncio.sleep(0)
+        waiting = [asyncio.create_task(hold(controller, lane, release, order)) for lane in ("batch", "routine", "urgent")]
+        await asyncio.sleep(0)
+        assert controller.active == 1
+        assert controller.queued() == 3
+        release.set()
+        await asyncio.gather(first, *waiting)
+        return controller, order
+
+    controller, order = asyncio.run(scenario())
+    assert order == ["routine", "urgent", "routine", "batch"]
+    assert controller.active == 0
+    assert controller.stats()["lanes"]["routine"]["admitted"] == 2
+
+
+def test_full_lane_is_shed_with_retry_after():
+    async def scenario():
+        controller = AdmissionController(concurrency=1, queue_limit=1, timeout=5)
+        release, order = asyncio.Event(), []
+        tasks = [asyncio.create_task(hold(controller, "routine", release, order)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as shed:
+            async with controller.slot("routine"):
+                pass
+        # Une autre voie a encore de la place dans sa file
+        urgent = asyncio.create_task(hold(controller, "urgent", release, order))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(*tasks, urgent)
+        return controller, shed.value
+
+    controller, error = asyncio.run(scenario())
+    assert error.status_code == 429
+    # Retry-After : durée moyenne (1 s) × (1 en attente + 1) / 1 place
+    assert error.headers["Retry-After"] == "2"
+    assert controller.rejected["routine"] == 1
+    assert controller.admitted["urgent"] == 1
+
+
+def test_accepted_batches_are_never_shed():
+    async def scenario():
+        controller = AdmissionController(concurrency=1, queue_limit=0, timeout=0.01)
+        release, order = asyncio.Event(), []
+        tasks = [asyncio.create_task(hold(controller, "batch", release, order, shed=False)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        release.set()
+        await asyncio.gather(*tasks)
+        return controller
+
+    assert asyncio.run(scenario()).admitted["batch"] == 3
+
+
+def test_waiting_too_long_returns_503_and_frees_the_queue():
+    async def scenario():
+        controller = AdmissionController(concurrency=1, queue_limit=5, timeout=0.01)
+        release, order = asyncio.Event(), []
+        busy = asyncio.create_task(hold(controller, "routine", release, order))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as timeout:
+            async with controller.slot("urgent"):
+                pass
+        queued = controller.queued()
+        release.set()
+        await busy
+        return controller, timeout.value, queued
+
+    controller, error, queued = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert "Retry-After" in error.headers
+    assert queued == 0
+    assert controller.active == 0
+
+
+def test_cancelled_waiter_gives_its_slot_back():
+    async def scenario():
+        controller = AdmissionController(concurrency=1, queue_limit=5, timeout=5)
+        release, order = asyncio.Event(), []
+        busy = asyncio.create_task(hold(controller, "routine", release, order))
+        await asyncio.sleep(0)
+        gone = asyncio.create_task(hold(controller, "routine", release, order))
+        await asyncio.sleep(0)
+        gone.cancel()
+        release.set()
+        await asyncio.gather(busy, gone, return_exceptions=True)
+        return controller, order
+
+    controller, order = asyncio.run(scenario())
+    assert order == ["routine"]
+    assert (controller.active, controller.queued()) == (0, 0)
+
+
+def test_resolve_lane(monkeypatch):
+    assert resolve_lane("routine", "jean") == "routine"
+    assert resolve_lane("urgent", "jean") == "urgent"
+    monkeypatch.setattr(admission_module, "ADMISSION_URGENT_USERS", {"urgences"})
+    assert resolve_lane("urgent", "jean") == "routine"
+    assert resolve_lane("urgent", "urgences") == "urgent"
+    for requested in ("batch", "inconnue"):
+        with pytest.raises(HTTPException) as error:
+            resolve_lane(requested, "jean")
+        assert error.value.status_code == 422
+
+
+def png_bytes() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("L", (32, 32), 128).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_predict_is_shed_when_the_lane_is_full(client, user, monkeypatch):
+    _, headers = user
+    saturated = AdmissionController(concurrency=1, queue_limit=0)
+    saturated.active = 1
+    monkeypatch.setattr(prediction, "admission", saturated)
+    files = {"file": ("radio.png", png_bytes(), "image/png")}
+    response = client.post("/predictions/predict", data=ALICE, files=files, headers=headers)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+    response = client.post("/predictions/predict", data={**ALICE, "priority": "batch"}, files=files, headers=headers)
+    assert response.status_code == 422
+
+
+def test_admission_stats_route(client, user):
+    _, headers = user
+    body = client.get("/predictions/admission/stats", headers=headers).json()
+    assert set(body["lanes"]) == {"urgent", "routine", "batch"}
@@ -0,0 +1,74 @@
+# tests/test_auth.py
+import pytest
+
+from app.auth import security
+from app.auth.security import Principal, UserCache, user_cache
+
+
+def principal(name: str) -> Principal:
+    return Principal(1, name)
+
+
+def test_user_cache_is_a_bounded_lru():
+    cache = UserCache(max_entries=2, ttl=60)
+    cache.put(principal("a"))
+    cache.put(principal("b"))
+    cache.get("a")
+    cache.put(principal("c"))
+    assert cache.get("b") is None
+    assert cache.get("a") == principal("a")
+    assert cache.get("c") == principal("c")
+
+
+def test_user_cache_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(security.time, "monotonic", lambda: now[0])
+    cache = UserCache(ttl=5)
+    cache.put(principal("a"))
+    now[0] += 6
+    assert cache.get("a") is None
+
+
+def test_disabled_user_cache_stores_nothing():
+    cache = UserCache(ttl=0)
+    cache.put(principal("a"))
+    assert cache.get("a") is None
+
+
+def test_authenticated_user_is_cached(client, user):
+    me, headers = user
+    user_cache.invalidate(me.username)
+    assert client.get("/auth/me", headers=headers).json()["username"] == me.username
+    assert user_cache.get(me.username) == me
+
+
+def test_cached_user_skips_the_database(client, user, monkeypatch):
+    me, headers = user
+    client.get("/auth/me", headers=headers)
+
+    def no_query(*args, **kwargs):
+        pytest.fail("requête en base malgré le cache")
+
+    monkeypatch.setattr(security.Session, "query", no_query)
+    assert client.get("/auth/me", headers=headers).status_code == 200
+
+
+def test_profile_update_invalidates_the_cache(client, user):
+    me, headers = user
+    client.get("/auth/me", headers=headers)
+    payload = {"first_name": "Jeanne", "last_name": "Test", "email": f"{me.username}@example.com"}
+    assert client.put("/auth/update-profile", json=payload, headers=headers).status_code == 200
+    assert client.get("/auth/me", headers=headers).json()["first_name"] == "Jeanne"
+
+
+def test_claims_only_principal_comes_from_the_token(monkeypatch, user):
+    me, headers = user
+    monkeypatch.setattr(security, "AUTH_CLAIMS_ONLY", True)
+    token = headers["Authorization"].removeprefix("Bearer ")
+    assert security.get_current_principal(token, db=None) == Principal(me.id, me.username)
+
+
+def test_invalid_token_is_rejected(client):
+    response = client.get("/auth/me", headers={"Authorization": "Bearer pas-un-jeton"})
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"] == "Bearer"
@@ -0,0 +1,86 @@
+# tests/test_backends.py
+import os
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from app import backends
+from app.api.ai import pipeline
+from app.model import ImprovedDenseNet121
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    return ImprovedDenseNet121().eval()
+
+
+def test_unknown_backend_is_rejected(model):
+    with pytest.raises(ValueError):
+        backends.load_backend("tensorrt", model)
+
+
+def test_artifact_path_follows_the_weights_file(monkeypatch, tmp_path):
+    monkeypatch.delenv("INFERENCE_ARTIFACTS_DIR", raising=False)
+    weights = str(tmp_path / "densenet.pth")
+    assert backends.artifact_path("onnx", weights) == os.path.join(str(tmp_path), "densenet.onnx")
+    assert backends.artifact_path("torchscript", weights).endswith("densenet.torchscript.pt")
+    monkeypatch.setenv("INFERENCE_ARTIFACTS_DIR", "/artefacts")
+    assert backends.artifact_path("int8_static", weights) == "/artefacts/densenet.int8.pt"
+
+
+@pytest.mark.parametrize("name", ["int8_dynamic", "bf16"])
+def test_in_process_backends_stay_close_to_fp32(model, name):
+    batch = torch.randn(2, *backends.INPUT_SHAPE[1:])
+    expected = torch.softmax(backends.load_backend("eager", model)(batch), dim=1)
+    probs = torch.softmax(backends.load_backend(name, model)(batch).float(), dim=1)
+    assert torch.allclose(probs, expected, atol=0.1)
+
+
+class FakeExplainer:
+    def __init__(self):
+        self.class_ids = "unset"
+
+    def __call__(self, batch, class_ids=None):
+        self.class_ids = class_ids
+        probs = torch.tensor([[0.9, 0.1]] * len(batch))
+        return probs, np.zeros((len(batch), 8, 8), dtype=np.float32)
+
+
+def fake_decoded(images):
+    return [(Image.new("L", (8, 8)), torch.zeros(3, 8, 8)) for _ in images]
+
+
+@pytest.fixture()
+def explain_stubs(monkeypatch):
+    explainer = FakeExplainer()
+    saved = []
+    monkeypatch.setattr(pipeline, "decode_batch", fake_decoded)
+    monkeypatch.setattr(pipeline, "explainer_for", lambda version=None: explainer)
+    monkeypatch.setattr(pipeline, "save_heatmap", lambda image, cam, key: saved.append(key))
+    # Backend factice : toujours PNEUMONIA, là où l'explainer dit NORMAL
+    monkeypatch.setattr(
+        pipeline, "get_backend", lambda version=None: lambda batch: torch.tensor([[0.0, 5.0]] * len(batch))
+    )
+    return explainer, saved
+
+
+def test_sync_explain_uses_the_configured_backend_for_verdicts(monkeypatch, explain_stubs):
+    explainer, saved = explain_stubs
+    monkeypatch.setattr(pipeline, "INFERENCE_BACKEND", "int8_dynamic")
+    probs = pipeline.predict_and_explain_images([b"a", b"b"], ["k1", "k2"])
+    assert all(p[1] > 0.99 for p in probs)
+    # Grad-CAM cible la classe prédite par le backend
+    assert explainer.class_ids == [1, 1]
+    assert saved == ["k1", "k2"]
+
+
+def test_sync_explain_with_eager_backend_is_a_single_pass(monkeypatch, explain_stubs):
+    explainer, _ = explain_stubs
+    monkeypatch.setattr(pipeline, "INFERENCE_BACKEND", "eager")
+    monkeypatch.setattr(pipeline, "get_backend", lambda version=None: pytest.fail("backend appelé"))
+    probs = pipeline.predict_and_explain_images([b"a"], ["k1"])
+    assert probs == [pytest.approx([0.9, 0.1])]
+    assert explainer.class_ids is None
@@ -0,0 +1,191 @@
+# tests/test_batch.py
+import asyncio
+import io
+import json
+import zipfile
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+from starlette.datastructures import UploadFile
+
+from app.admission import AdmissionController
+from app.api import prediction
+from app.auth.models import AnalysisHistory
+from app.auth.schemas import PatientCreate
+from app.model import ModelVersion
+
+MODEL = ModelVersion("default", "w.pth", "v-test")
+ALICE = {"nom": "Martin", "prenom": "Alice", "age": 40, "sexe": "feminin"}
+
+
+def png_bytes(color: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("L", (32, 32), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def zip_bytes(members: dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+@pytest.fixture()
+def fake_inference(monkeypatch):
+    """Verdict factice : PNEUMONIA pour les images claires ; une image noire fait échouer l'inférence."""
+
+    async def run_inference(image_bytes):
+        shade = Image.open(io.BytesIO(image_bytes)).getpixel((0, 0))
+        if shade == 0:
+            raise RuntimeError("image illisible")
+        probs = [0.1, 0.9] if shade > 128 else [0.9, 0.1]
+        key = prediction.prediction_cache.key(image_bytes)
+        return {
+            "probs": probs,
+            "cache_key": key,
+            "heatmap_key": f"heatmaps/{key[:2]}/{key}-test.webp",
+            "model": MODEL,
+            **prediction.classify(probs),
+        }
+
+    monkeypatch.setattr(prediction, "run_inference", run_inference)
+    # Pas de file de heatmaps pendant les tests : jobs laissés en attente
+    monkeypatch.setattr(prediction, "HEATMAP_MODE", "on_demand")
+
+
+def lines(response) -> list[dict]:
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+
+def test_batch_streams_results_then_a_summary(client, user, fake_inference, db):
+    principal, headers = user
+    files = [("files", (f"r{i}.png", png_bytes(shade), "image/png")) for i, shade in enumerate([200, 50, 0])]
+    response = client.post("/predictions/batch", files=files, data=ALICE, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    events = lines(response)
+    summary = events[-1]
+    assert summary["type"] == "summary"
+    assert (summary["count"], summary["succeeded"], summary["failed"]) == (3, 2, 1)
+    by_index = {event["index"]: event for event in events[:-1]}
+    assert by_index[0]["type"] == "result"
+    assert by_index[2] == {"type": "error", "index": 2, "file_name": "r2.png", "detail": "image illisible"}
+    assert [analysis["index"] for analysis in summary["analyses"]] == [0, 1]
+    assert all(analysis["heatmap_status"] == "pending" for analysis in summary["analyses"])
+
+    stored = db.query(AnalysisHistory).filter(AnalysisHistory.user_id == principal.id).count()
+    assert stored == 2
+
+
+def test_batch_can_stream_server_sent_events(client, user, fake_inference):
+    _, headers = user
+    files = [("files", ("r.png", png_bytes(200), "image/png"))]
+    response = client.post("/predictions/batch", files=files, data={**ALICE, "format": "sse"}, headers=headers)
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text.startswith("data: ")
+    assert json.loads(response.text.split("\n\n")[-2][len("data: ") :])["type"] == "summary"
+
+
+def test_batch_takes_a_single_admission_slot(client, user, fake_inference, monkeypatch):
+    _, headers = user
+    controller = AdmissionController(concurrency=4, queue_limit=1)
+    monkeypatch.setattr(prediction, "admission", controller)
+    monkeypatch.setattr(prediction, "BATCH_CONCURRENCY", 2)
+    seen, running = [], [0]
+    fake = prediction.run_inference
+
+    async def run_inference(image_bytes):
+        running[0] += 1
+        seen.append((controller.active, controller.queued(), running[0]))
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+        return await fake(image_bytes)
+
+    monkeypatch.setattr(prediction, "run_inference", run_inference)
+    files = [("files", (f"r{i}.png", png_bytes(200 + i), "image/png")) for i in range(6)]
+    response = client.post("/predictions/batch", files=files, data=ALICE, headers=headers)
+    assert lines(response)[-1]["succeeded"] == 6
+    # Une seule place pour tout le lot, deux images à la fois au plus
+    assert {(active, queued) for active, queued, _ in seen} == {(1, 0)}
+    assert max(concurrent for _, _, concurrent in seen) == 2
+    assert controller.admitted["batch"] == 1
+    # La durée du lot ne fausse pas l'estimation de Retry-After
+    assert controller.service_seconds == 1.0
+
+
+def test_batch_without_patient_is_rejected(client, user, fake_inference):
+    _, headers = user
+    files = [("files", ("r.png", png_bytes(200), "image/png"))]
+    response = client.post("/predictions/batch", files=files, headers=headers)
+    assert response.status_code == 422
+
+
+def test_read_batch_images_expands_zip_archives(monkeypatch):
+    archive = zip_bytes({"a/1.png": b"un", "notes.txt": b"ignore", "2.jpg": b"deux"})
+    uploads = [
+        UploadFile(io.BytesIO(archive), filename="lot.zip"),
+        UploadFile(io.BytesIO(b"trois"), filename="3.png"),
+    ]
+    images = asyncio.run(prediction.read_batch_images(uploads))
+    assert images == [("1.png", b"un"), ("2.jpg", b"deux"), ("3.png", b"trois")]
+
+    monkeypatch.setattr(prediction, "BATCH_MAX_FILES", 1)
+    uploads = [UploadFile(io.BytesIO(archive), filename="lot.zip")]
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(prediction.read_batch_images(uploads))
+    assert exc.value.status_code == 413
+
+
+def test_batch_total_size_is_capped_before_decompression(monkeypatch):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for i in range(3):
+            archive.writestr(f"{i}.png", b"x" * 1000)
+    # L'archive tient sous le plafond, les images décompressées non
+    archive = buffer.getvalue()
+    assert len(archive) < 1500
+    monkeypatch.setattr(prediction, "MAX_BATCH_TOTAL_BYTES", 1500)
+    read = []
+    real_read = zipfile.ZipFile.read
+    monkeypatch.setattr(zipfile.ZipFile, "read", lambda self, member: read.append(member) or real_read(self, member))
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(prediction.read_batch_images([UploadFile(io.BytesIO(archive), filename="lot.zip")]))
+    assert exc.value.status_code == 413
+    # Seule la première image a été décompressée
+    assert len(read) == 1
+
+    uploads = [UploadFile(io.BytesIO(b"a" * 1000), filename=f"{i}.png") for i in range(2)]
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(prediction.read_batch_images(uploads))
+    assert exc.value.status_code == 413
+
+
+def test_invalid_zip_is_a_bad_request():
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(prediction.read_batch_images([UploadFile(io.BytesIO(b"pas un zip"), filename="x.zip")]))
+    assert exc.value.status_code == 400
+
+
+def test_resolve_patients_by_position_name_or_default():
+    default = PatientCreate(**ALICE)
+    bob = {**ALICE, "prenom": "Bob"}
+    names = ["a.png", "b.png"]
+    assert [p.prenom for p in prediction.resolve_patients(names, json.dumps([bob]), default)] == ["Bob", "Alice"]
+    assert [p.prenom for p in prediction.resolve_patients(names, json.dumps({"b.png": bob}), default)] == [
+        "Alice",
+        "Bob",
+    ]
+    with pytest.raises(HTTPException) as exc:
+        prediction.resolve_patients(names, json.dumps({"a.png": bob}), None)
+    assert exc.value.status_code == 422
+
+
+def test_resolve_patients_uses_dicom_headers_and_skips_rejected_images():
+    header = {0: {**ALICE, "prenom": "Dicom"}}
+    resolved = prediction.resolve_patients(["a.dcm", "b.dcm"], None, None, header, {1: "refusée"})
+    assert resolved[0].prenom == "Dicom"
+    assert resolved[1] is None
@@ -0,0 +1,43 @@
+# tests/test_bench.py
+from argparse import Namespace
+
+import pytest
+
+from app.api.ai import pipeline
+from bench import common
+from bench.pipeline import bench_decode
+
+
+def test_parse_helpers():
+    assert common.parse_ints("1,4,16,") == [1, 4, 16]
+    assert common.parse_size("512x640") == (512, 640)
+
+
+def test_summarize_reports_milliseconds_and_throughput():
+    summary = common.summarize([0.01, 0.02, 0.03], items=4)
+    assert summary["p50_ms"] == pytest.approx(20.0)
+    assert summary["per_item_ms"] == pytest.approx(5.0)
+    assert summary["items_per_s"] == pytest.approx(200.0)
+
+
+def test_synthetic_images_are_distinct_jpegs():
+    images = common.synthetic_images(2, (64, 80))
+    assert all(data[:3] == b"\xff\xd8\xff" for data in images)
+    assert images[0] != images[1]
+
+
+def test_bench_decode_goes_through_load_image(monkeypatch):
+    calls = []
+    load_image = pipeline.load_image
+
+    def counting_load_image(data):
+        calls.append(len(data))
+        return load_image(data)
+
+    monkeypatch.setattr(pipeline, "load_image", counting_load_image)
+    images = common.synthetic_images(2, (300, 300))
+    rows = []
+    bench_decode(Namespace(stages=["decode", "preprocess"], repeat=1, warmup=0), images, rows)
+    assert [row["stage"] for row in rows] == ["decode", "preprocess"]
+    # Une passe mesurée + les images décodées pour l'étape preprocess
+    assert len(calls) == 4
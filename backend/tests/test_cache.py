@@ -0,0 +1,126 @@
+# tests/test_cache.py
+import asyncio
+import hashlib
+
+import pytest
+
+from app.api import prediction
+from app.cache import PredictionCache
+from app.model import ModelVersion
+
+V1 = ModelVersion("default", "a.pth", "v1")
+V2 = ModelVersion("v2", "b.pth", "v2")
+
+
+class FakeRegistry:
+    def __init__(self, version: ModelVersion = V1):
+        self.current = version
+
+    def active(self) -> ModelVersion:
+        return self.current
+
+
+@pytest.fixture()
+def registry():
+    return FakeRegistry()
+
+
+def test_key_is_the_sha256_of_the_image():
+    assert PredictionCache.key(b"radio") == hashlib.sha256(b"radio").hexdigest()
+
+
+def test_miss_then_hit(registry):
+    cache = PredictionCache(registry, max_entries=4)
+    assert cache.get("k") is None
+    cache.put("k", [0.2, 0.8])
+    assert cache.get("k") == {"probs": [0.2, 0.8]}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_returned_entries_are_copies(registry):
+    cache = PredictionCache(registry)
+    cache.put("k", [0.2, 0.8])
+    cache.get("k")["probs"] = "abîmé"
+    assert cache.get("k")["probs"] == [0.2, 0.8]
+
+
+def test_least_recently_used_entry_is_evicted(registry):
+    cache = PredictionCache(registry, max_entries=2)
+    cache.put("a", [1.0, 0.0])
+    cache.put("b", [1.0, 0.0])
+    cache.get("a")
+    cache.put("c", [1.0, 0.0])
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_entries_are_scoped_to_the_model_version(registry):
+    cache = PredictionCache(registry)
+    cache.put("k", [0.1, 0.9])
+    registry.current = V2
+    assert cache.get("k") is None
+    # Les entrées de V1 restent valables (retour arrière) : seul le LRU les fait sortir
+    assert cache.get("k", V1) == {"probs": [0.1, 0.9]}
+    registry.current = V1
+    assert cache.get("k") == {"probs": [0.1, 0.9]}
+
+
+def test_versions_share_the_lru(registry):
+    cache = PredictionCache(registry, max_entries=2)
+    cache.put("a", [1.0, 0.0])
+    registry.current = V2
+    cache.put("b", [1.0, 0.0])
+    cache.put("c", [1.0, 0.0])
+    assert cache.get("a", V1) is None
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["model_version"].startswith("v2-")
+
+
+def test_disk_tier_survives_a_new_process(registry, tmp_path):
+    PredictionCache(registry, cache_dir=str(tmp_path)).put("k", [0.3, 0.7])
+    fresh = PredictionCache(registry, cache_dir=str(tmp_path))
+    assert fresh.get("k") == {"probs": [0.3, 0.7]}
+    assert fresh.stats()["disk_hits"] == 1
+    registry.current = V2
+    assert fresh.get("k") is None
+
+
+def test_async_access_uses_the_disk_tier_off_the_loop(registry, tmp_path, monkeypatch):
+    cache = PredictionCache(registry, cache_dir=str(tmp_path))
+    threads = []
+    real_to_thread = asyncio.to_thread
+
+    async def to_thread(fn, *args):
+        threads.append(fn.__name__)
+        return await real_to_thread(fn, *args)
+
+    monkeypatch.setattr(asyncio, "to_thread", to_thread)
+    asyncio.run(cache.put_async("k", [0.3, 0.7]))
+    assert asyncio.run(PredictionCache(registry, cache_dir=str(tmp_path)).get_async("k")) == {"probs": [0.3, 0.7]}
+    # Entrée en mémoire : pas d'accès disque
+    assert asyncio.run(cache.get_async("k")) == {"probs": [0.3, 0.7]}
+    assert threads == ["_write_disk", "_read_disk"]
+
+
+def test_cache_hits_are_not_written_again(app, monkeypatch):
+    cache = PredictionCache(FakeRegistry())
+    writes = []
+    real_put = cache.put_async
+
+    async def put_async(key, probs, model=None):
+        writes.append(key)
+        await real_put(key, probs, model=model)
+
+    async def submit(item):
+        return [0.9, 0.1]
+
+    monkeypatch.setattr(cache, "put_async", put_async)
+    monkeypatch.setattr(prediction, "prediction_cache", cache)
+    monkeypatch.setattr(prediction, "HEATMAP_MODE", "deferred")
+    monkeypatch.setattr(prediction, "TTA_ENABLED", False)
+    monkeypatch.setattr(prediction.engine, "submit", submit)
+    for _ in range(3):
+        assert asyncio.run(prediction.run_inference(b"radio"))["verdict"] == "negative"
+    assert len(writes) == 1
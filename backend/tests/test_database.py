@@ -0,0 +1,52 @@
+# tests/test_database.py
+import asyncio
+
+import pytest
+from sqlalchemy import text
+
+from app import database
+
+
+def test_sqlite_engine_is_shared_across_threads():
+    assert database.engine_options("sqlite:///x.db") == {"connect_args": {"check_same_thread": False}}
+
+
+def test_postgres_engine_is_pooled():
+    options = database.engine_options("postgresql://db/pneumonie")
+    assert options["pool_size"] == database.DB_POOL_SIZE
+    assert options["pool_pre_ping"] is True
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("sqlite:///./app.db", "sqlite+aiosqlite:///./app.db"),
+        ("postgresql://u@db/p", "postgresql+asyncpg://u@db/p"),
+        ("postgresql+psycopg2://u@db/p", "postgresql+asyncpg://u@db/p"),
+    ],
+)
+def test_async_url_is_derived_from_the_sync_url(monkeypatch, url, expected):
+    monkeypatch.setattr(database, "DATABASE_URL", url)
+    monkeypatch.setattr(database, "ASYNC_DATABASE_URL", None)
+    assert database.async_database_url() == expected
+
+
+def test_sqlite_runs_in_wal_mode():
+    with database.engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert connection.exec_driver_sql("PRAGMA busy_timeout").scalar() == database.SQLITE_BUSY_TIMEOUT_MS
+
+
+def test_async_sessions_share_the_database(app, user):
+    principal, _ = user
+
+    async def read_username():
+        agen = database.get_async_db()
+        db = await agen.__anext__()
+        try:
+            result = await db.execute(text("SELECT username FROM users WHERE id = :id"), {"id": principal.id})
+            return result.scalar()
+        finally:
+            await agen.aclose()
+
+    assert asyncio.run(read_username()) == principal.username
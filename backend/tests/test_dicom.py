@@ -0,0 +1,210 @@
+# tests/test_dicom.py
+import asyncio
+import io
+import warnings
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+from app import dicom, storage
+from app.api import prediction
+from app.api.ai import pipeline
+
+
+class Header(dict):
+    """En-tête factice : accès par `get`, `in` et attribut, comme un Dataset pydicom."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+CHEST = Header(Modality="DX", BodyPartExamined="CHEST", ViewPosition="PA", Rows=512, Columns=512)
+
+
+def dicom_prefix() -> bytes:
+    return b"\0" * 128 + b"DICM"
+
+
+def test_is_dicom():
+    assert dicom.is_dicom(dicom_prefix() + b"\x02\x00")
+    assert not dicom.is_dicom(b"\xff\xd8\xff" + b"\0" * 200)
+    assert not dicom.is_dicom(b"DICM")
+
+
+def test_chest_radiograph_is_accepted():
+    dicom.check_header(CHEST)
+    # Région et incidence absentes : acceptées
+    dicom.check_header(Header(Modality="CR", Rows=1, Columns=1))
+
+
+@pytest.mark.parametrize(
+    "change, reason",
+    [
+        ({"Modality": "CT"}, "modalité CT"),
+        ({"Modality": ""}, "modalité absente"),
+        ({"BodyPartExamined": "KNEE"}, "région KNEE"),
+        ({"ViewPosition": "LL"}, "incidence LL"),
+        ({"Rows": 0}, "aucune image"),
+    ],
+)
+def test_other_studies_are_rejected(change, reason):
+    with pytest.raises(dicom.DicomRejected, match=reason):
+        dicom.check_header(Header(CHEST, **change))
+
+
+def test_patient_fields_from_the_header():
+    name = SimpleNamespace(family_name="Martin", given_name="Alice")
+    header = Header(PatientName=name, PatientAge="045Y", PatientSex="F")
+    assert dicom.patient_fields(header) == {"nom": "Martin", "prenom": "Alice", "age": 45, "sexe": "feminin"}
+
+
+def test_age_from_the_birth_date_at_the_study_date():
+    header = Header(PatientBirthDate="19800615", StudyDate="20200614", PatientSex="O")
+    assert dicom.patient_fields(header) == {"age": 39}
+    assert dicom.patient_fields(Header(PatientAge="006M")) == {"age": 0}
+    assert dicom.patient_fields(Header(PatientBirthDate="inconnue")) == {}
+
+
+def test_linear_window_maps_the_window_to_0_1():
+    pixels = np.array([0.0, 1000.0, 1500.0, 2000.0, 4000.0], dtype=np.float32)
+    windowed = dicom._window(pixels, Header(WindowCenter=1500, WindowWidth=1001))
+    assert windowed[0] == 0.0
+    assert windowed[-1] == 1.0
+    assert windowed[2] == pytest.approx(0.5, abs=1e-3)
+    assert np.all(np.diff(windowed) >= 0)
+
+
+def test_multivalued_window_uses_the_first_one():
+    pixels = np.array([0.0, 100.0, 200.0], dtype=np.float32)
+    windowed = dicom._window(pixels, Header(WindowCenter=[100, 1000], WindowWidth=["200", "10"], VOILUTFunction="LINEAR_EXACT"))
+    assert windowed.tolist() == pytest.approx([0.0, 0.5, 1.0])
+
+
+def test_sigmoid_window():
+    pixels = np.array([-1e4, 50.0, 1e4], dtype=np.float32)
+    with warnings.catch_warnings():
+        # Pixels loin de la fenêtre : pas de dépassement dans np.exp
+        warnings.simplefilter("error")
+        windowed = dicom._window(pixels, Header(WindowCenter=50, WindowWidth=1, VOILUTFunction="SIGMOID"))
+    assert windowed.tolist() == pytest.approx([0.0, 0.5, 1.0])
+
+
+def test_without_window_the_range_is_stretched():
+    pixels = np.array([[1000.0, 3000.0], [2000.0, 3000.0]], dtype=np.float32)
+    assert dicom._window(pixels, Header()).tolist() == [[0.0, 1.0], [0.5, 1.0]]
+    assert not dicom._window(np.full((2, 2), 7.0), Header()).any()
+
+
+def test_downsample_averages_whole_blocks():
+    pixels = np.arange(64, dtype=np.float32).reshape(8, 8)
+    reduced = dicom._downsample(pixels, (4, 4))
+    assert reduced.shape == (4, 4)
+    assert reduced[0, 0] == pytest.approx(pixels[:2, :2].mean())
+    # Jamais plus petite que la taille demandée
+    assert dicom._downsample(pixels, (5, 5)) is pixels
+    assert dicom._downsample(np.zeros((10, 7)), (3, 3)).shape == (5, 3)
+
+
+def test_rejected_study_is_unprocessable(monkeypatch):
+    def inspect_dicom(data):
+        raise dicom.DicomRejected("modalité CT")
+
+    monkeypatch.setattr(prediction, "inspect_dicom", inspect_dicom)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(prediction.dicom_patient_fields(dicom_prefix()))
+    assert error.value.status_code == 422
+    assert asyncio.run(prediction.dicom_patient_fields(b"\xff\xd8\xff")) == {}
+
+
+def test_missing_pydicom_is_not_implemented(monkeypatch):
+    def inspect_dicom(data):
+        raise RuntimeError("La lecture des fichiers DICOM nécessite le paquet pydicom")
+
+    monkeypatch.setattr(prediction, "inspect_dicom", inspect_dicom)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(prediction.dicom_patient_fields(dicom_prefix()))
+    assert error.value.status_code == 501
+
+
+def test_form_fields_override_the_header():
+    patient = prediction.merge_patient({"nom": "Martin", "prenom": "Alice", "age": 45, "sexe": "feminin"}, age=46)
+    assert (patient.nom, patient.age) == ("Martin", 46)
+    with pytest.raises(HTTPException) as error:
+        prediction.merge_patient({"nom": "Martin"}, prenom="Alice")
+    assert error.value.status_code == 422
+
+
+def test_dicom_source_thumbnail_comes_from_the_compute_decode(app, monkeypatch):
+    data = dicom_prefix() + b"etude"
+    decoded = []
+
+    def decode_pixels(image_bytes, size):
+        decoded.append(size)
+        return np.linspace(0, 1, 512 * 384, dtype=np.float32).reshape(384, 512)
+
+    monkeypatch.setattr(pipeline, "decode_pixels", decode_pixels)
+    # Le processus API ne fait qu'écrire la source
+    key = storage.store_source(data)
+    assert decoded == []
+    assert not storage.get_storage().exists(storage.thumbnail_key(key))
+
+    image, tensor = pipeline.decode_batch([data])[0]
+    assert tensor.shape == (3, *pipeline.INPUT_SIZE[::-1])
+    thumbnail = Image.open(io.BytesIO(storage.get_storage().get(storage.thumbnail_key(key))))
+    # Proportions de l'image d'origine, pas celles de l'entrée du modèle
+    assert thumbnail.size == (storage.THUMBNAIL_SIZE, storage.THUMBNAIL_SIZE * 3 // 4)
+    assert len(decoded) == 1
+
+
+def dicom_file(pixels: np.ndarray, photometric: str, **elements) -> bytes:
+    """Fichier DICOM minimal (non compressé) construit avec pydicom."""
+    from pydicom.dataset import FileDataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.1.1"
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    dataset = FileDataset(None, {}, file_meta=meta, preamble=b"\0" * 128)
+    dataset.is_little_endian, dataset.is_implicit_VR = True, False
+    dataset.SOPClassUID = meta.MediaStorageSOPClassUID
+    dataset.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    dataset.Modality = "DX"
+    dataset.Rows, dataset.Columns = pixels.shape
+    dataset.SamplesPerPixel = 1
+    dataset.PhotometricInterpretation = photometric
+    dataset.BitsAllocated = 16
+    dataset.BitsStored = 12
+    dataset.HighBit = 11
+    dataset.PixelRepresentation = 0
+    dataset.PixelData = pixels.astype(np.uint16).tobytes()
+    for keyword, value in elements.items():
+        setattr(dataset, keyword, value)
+    buffer = io.BytesIO()
+    dataset.save_as(buffer)
+    return buffer.getvalue()
+
+
+def test_decoded_pixels_keep_the_orientation_of_monochrome1():
+    pytest.importorskip("pydicom")
+    pixels = np.tile(np.linspace(0, 4095, 16), (16, 1))
+    monochrome2 = dicom.decode_pixels(dicom_file(pixels, "MONOCHROME2"), (8, 8))
+    monochrome1 = dicom.decode_pixels(dicom_file(pixels, "MONOCHROME1"), (8, 8))
+    assert monochrome2.shape == (8, 8)
+    assert monochrome2.dtype == np.float32
+    assert monochrome2[0, 0] < monochrome2[0, -1]
+    assert np.allclose(monochrome1, 1.0 - monochrome2)
+
+
+def test_header_is_read_without_pixels():
+    pytest.importorskip("pydicom")
+    data = dicom_file(np.zeros((4, 4)), "MONOCHROME2", BodyPartExamined="CHEST", PatientSex="M")
+    assert dicom.is_dicom(data)
+    assert dicom.inspect_dicom(data) == {"sexe": "masculin"}
+    assert "PixelData" not in dicom.read_header(data)
@@ -0,0 +1,102 @@
+# tests/test_export.py
+import csv
+import gzip
+import io
+import json
+import zlib
+
+import pytest
+
+from app import export
+from app.api import history
+from app.auth import crud
+from app.auth.schemas import PatientCreate
+
+ALICE = PatientCreate(nom="Martin", prenom="Alice", age=40, sexe="feminin")
+
+
+@pytest.fixture()
+def analyses(db, user):
+    """Cinq analyses de l'utilisateur ; renvoie (Principal, ids du plus récent au plus ancien, en-têtes)."""
+    principal, headers = user
+    ids = [
+        crud.add_patient_analysis(
+            db, principal.id, ALICE, f"radio{i}.png", "positive" if i < 2 else "negative", 70.0 + i, "high"
+        )
+        for i in range(5)
+    ]
+    return principal, ids[::-1], headers
+
+
+def test_rows_are_read_in_chunks(analyses):
+    principal, ids, _ = analyses
+    chunks = list(export.export_rows(lambda db: crud.user_history_query(db, principal), chunk_rows=2))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert [record["id"] for chunk in chunks for record in chunk] == ids
+    assert list(chunks[0][0]) == export.COLUMNS
+    assert isinstance(chunks[0][0]["timestamp"], str)
+
+
+def test_serializers_emit_one_piece_per_chunk():
+    chunks = [[dict.fromkeys(export.COLUMNS, "a")], [dict.fromkeys(export.COLUMNS, "b")] * 2]
+    pieces = list(export.to_csv(chunks))
+    assert len(pieces) == 2
+    rows = list(csv.DictReader(io.StringIO(b"".join(pieces).decode())))
+    assert [row["id"] for row in rows] == ["a", "b", "b"]
+
+    lines = b"".join(export.to_ndjson(chunks)).decode().splitlines()
+    assert [json.loads(line)["nom"] for line in lines] == ["a", "b", "b"]
+
+
+def test_csv_of_an_empty_export_is_its_header():
+    assert b"".join(export.to_csv([])).decode().strip() == ",".join(export.COLUMNS)
+
+
+def test_gzipped_stream_is_a_valid_gzip_file():
+    pieces = [b"ligne %d\n" % i for i in range(1000)]
+    assert gzip.decompress(b"".join(export.gzipped(iter(pieces)))) == b"".join(pieces)
+
+
+@pytest.mark.parametrize("format", ["csv", "ndjson"])
+def test_export_route_streams_the_filtered_history(client, analyses, format):
+    _, ids, headers = analyses
+    response = client.get("/history/export", params={"format": format, "verdict": "positive"}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith(export.EXPORT_FORMATS[format].split(";")[0])
+    assert f'.{format}"' in response.headers["content-disposition"]
+    if format == "csv":
+        exported = [int(row["id"]) for row in csv.DictReader(io.StringIO(response.text))]
+    else:
+        exported = [json.loads(line)["id"] for line in response.text.splitlines()]
+    # Les deux plus anciennes analyses sont positives
+    assert exported == ids[-2:]
+
+
+def test_gzip_export(client, analyses):
+    _, ids, headers = analyses
+    response = client.get("/history/export", params={"format": "ndjson", "gzip": "true"}, headers=headers)
+    assert response.headers["content-type"] == "application/gzip"
+    assert response.headers["content-disposition"].endswith('.ndjson.gz"')
+    # httpx ne décompresse pas : le gzip est le contenu, pas un Content-Encoding
+    body = zlib.decompress(response.content, 31)
+    assert [json.loads(line)["id"] for line in body.decode().splitlines()] == ids
+
+
+def test_unknown_format_is_rejected(client, user):
+    _, headers = user
+    assert client.get("/history/export", params={"format": "xml"}, headers=headers).status_code == 422
+
+
+def test_parquet_export_has_one_row_group_per_chunk(analyses):
+    pq = pytest.importorskip("pyarrow.parquet")
+    principal, ids, _ = analyses
+    rows = export.export_rows(lambda db: crud.user_history_query(db, principal), chunk_rows=2)
+    table = pq.ParquetFile(io.BytesIO(b"".join(export.to_parquet(rows))))
+    assert table.num_row_groups == 3
+    assert table.read().column("id").to_pylist() == ids
+
+
+def test_parquet_without_pyarrow_is_not_implemented(client, user, monkeypatch):
+    _, headers = user
+    monkeypatch.setattr(history.importlib.util, "find_spec", lambda name: None)
+    assert client.get("/history/export", params={"format": "parquet"}, headers=headers).status_code == 501
@@ -0,0 +1,87 @@
+# tests/test_files.py
+import hashlib
+import io
+
+import pytest
+from PIL import Image
+
+from app.auth import crud
+from app.auth.schemas import PatientCreate
+from app.storage import (
+    get_storage,
+    heatmap_key,
+    key_digest,
+    source_key_candidates,
+    store_source,
+    thumbnail_key,
+)
+
+
+def png_bytes(color: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("L", (32, 32), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture()
+def stored(db, user):
+    """Radio analysée par l'utilisateur, avec sa heatmap ; renvoie (clés, en-têtes)."""
+    principal, headers = user
+    data = png_bytes(200 + principal.id % 50)
+    digest = hashlib.sha256(data).hexdigest()
+    source = store_source(data, digest)
+    heatmap = heatmap_key(digest, "v-test")
+    get_storage().put(heatmap, b"heatmap", "image/webp")
+    crud.add_patient_analysis(
+        db,
+        principal.id,
+        PatientCreate(nom="Martin", prenom="Alice", age=40, sexe="feminin"),
+        "radio.png",
+        "positive",
+        91.0,
+        "high",
+        source,
+    )
+    return {"source": source, "heatmap": heatmap, "thumbnail": thumbnail_key(source)}, headers
+
+
+def test_key_digest_of_every_object_kind():
+    digest = "ab" + "0" * 62
+    source = f"sources/ab/{digest}.png"
+    heatmap = heatmap_key(digest, "v1")
+    for key in (source, heatmap, thumbnail_key(source), thumbnail_key(heatmap)):
+        assert key_digest(key) == digest
+    assert source in source_key_candidates(digest)
+
+
+@pytest.mark.parametrize("kind", ["source", "heatmap", "thumbnail"])
+def test_owner_gets_the_file_with_private_cache_headers(client, stored, kind):
+    keys, headers = stored
+    response = client.get(f"/files/{keys[kind]}", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "private, max-age=31536000, immutable"
+
+
+def test_files_require_authentication(client, stored):
+    keys, _ = stored
+    assert client.get(f"/files/{keys['source']}").status_code == 401
+
+
+def test_files_of_another_user_are_not_found(client, stored, make_user):
+    keys, _ = stored
+    _, other_headers = make_user()
+    for key in keys.values():
+        assert client.get(f"/files/{key}", headers=other_headers).status_code == 404
+
+
+def test_etag_revalidation_returns_304(client, stored):
+    keys, headers = stored
+    etag = client.get(f"/files/{keys['source']}", headers=headers).headers["ETag"]
+    response = client.get(f"/files/{keys['source']}", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_invalid_keys_are_not_found(client, user):
+    _, headers = user
+    assert client.get("/files/sources/../secret.png", headers=headers).status_code == 404
+    assert client.get("/files/autre/ab/x.png", headers=headers).status_code == 404
@@ -0,0 +1,42 @@
+# tests/test_gradcam.py
+import pytest
+import torch
+
+from app.api.ai.generate_gradcam import GradCAMExplainer
+from app.model import ImprovedDenseNet121
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    return ImprovedDenseNet121().eval()
+
+
+def test_single_pass_probabilities_match_the_model(model):
+    batch = torch.randn(2, 3, 64, 64)
+    probs, cams = GradCAMExplainer(model)(batch)
+    with torch.no_grad():
+        expected = torch.softmax(model(batch), dim=1)
+    assert torch.allclose(probs, expected, atol=1e-5)
+    assert cams.shape == (2, 64, 64)
+
+
+def test_cams_are_normalised_per_image(model):
+    _, cams = GradCAMExplainer(model)(torch.randn(3, 3, 64, 64))
+    for cam in cams:
+        assert cam.min() == pytest.approx(0.0, abs=1e-6)
+        # Max ramené à 1, sauf carte entièrement nulle (ReLU)
+        assert cam.max() == pytest.approx(1.0, abs=1e-3) or cam.max() == 0.0
+
+
+def test_explicit_target_classes_change_the_cam(model):
+    batch = torch.randn(1, 3, 64, 64)
+    explainer = GradCAMExplainer(model)
+    _, cam_normal = explainer(batch, [0])
+    _, cam_pneumonia = explainer(batch, [1])
+    assert not (cam_normal == cam_pneumonia).all()
+
+
+def test_explainer_does_not_leave_gradients_on_the_model(model):
+    GradCAMExplainer(model)(torch.randn(1, 3, 64, 64))
+    assert all(parameter.grad is None for parameter in model.parameters())
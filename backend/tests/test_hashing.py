@@ -0,0 +1,104 @@
+# tests/test_hashing.py
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from app.auth import crud
+from app.auth.hashing import HASH_RETRY_AFTER, HashingPool
+from app.auth.models import User
+
+
+def test_hash_then_verify():
+    pool = HashingPool(workers=1, max_pending=4)
+    pool.start()
+
+    async def run():
+        hashed = await pool.hash("secret")
+        return await pool.verify_and_update("secret", hashed), await pool.verify_and_update("faux", hashed)
+
+    (valid, new_hash), (invalid, _) = asyncio.run(run())
+    assert (valid, new_hash, invalid) == (True, None, False)
+    stats = pool.stats()
+    assert (stats["completed"], stats["pending"]) == (3, 0)
+    assert stats["hash_ms"]["max"] > 0
+    pool.shutdown()
+
+
+def test_pool_must_be_started():
+    with pytest.raises(RuntimeError):
+        asyncio.run(HashingPool().hash("secret"))
+
+
+def test_full_pool_is_refused_with_retry_after(monkeypatch):
+    pool = HashingPool(workers=1, max_pending=1)
+    pool.start()
+    release = threading.Event()
+    monkeypatch.setattr("app.auth.hashing.get_password_hash", lambda password: release.wait(5) and "hash")
+
+    async def run():
+        first = asyncio.ensure_future(pool.hash("a"))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as exc:
+            await pool.hash("b")
+        release.set()
+        await first
+        return exc.value
+
+    error = asyncio.run(run())
+    assert error.status_code == 503
+    assert error.headers == {"Retry-After": str(HASH_RETRY_AFTER)}
+    assert pool.stats()["rejected"] == 1
+    pool.shutdown()
+
+
+def test_login_rehashes_a_password_of_another_cost(client, db):
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=5).hash("secret")
+    user = crud.create_user(db, "rehash", old_hash, "Jean", "Test", "rehash@example.org")
+    response = client.post("/auth/login", json={"username": "rehash", "password": "secret"})
+    assert response.status_code == 200
+    db.expire_all()
+    new_hash = db.get(User, user.id).hashed_password
+    assert new_hash != old_hash
+    assert new_hash.split("$")[2] == "04"
+
+
+def test_register_then_login(client):
+    payload = {
+        "username": "nouveau",
+        "password": "secret",
+        "first_name": "Jean",
+        "last_name": "Test",
+        "email": "nouveau@example.org",
+    }
+    assert client.post("/auth/register", json=payload).status_code == 200
+    assert client.post("/auth/register", json=payload).status_code == 400
+    assert client.post("/auth/login", json={"username": "nouveau", "password": "faux"}).status_code == 401
+    assert client.post("/auth/login", json={"username": "nouveau", "password": "secret"}).status_code == 200
+
+
+def test_cancelled_hashes_are_not_counted_after_a_restart(monkeypatch):
+    pool = HashingPool(workers=1, max_pending=2)
+    pool.start()
+    release = threading.Event()
+    monkeypatch.setattr("app.auth.hashing.get_password_hash", lambda password: release.wait(5) and "hash")
+
+    async def run():
+        tasks = [asyncio.ensure_future(pool.hash(p)) for p in ("a", "b")]
+        await asyncio.sleep(0.05)
+        # Le second hachage, en file, est annulé par l'arrêt
+        pool.shutdown()
+        release.set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    first, second = asyncio.run(run())
+    assert first == "hash"
+    assert isinstance(second, asyncio.CancelledError)
+    assert pool.stats()["pending"] == 0
+
+    pool.start()
+    monkeypatch.setattr("app.auth.hashing.get_password_hash", lambda password: "hash")
+    assert asyncio.run(pool.hash("c")) == "hash"
+    pool.shutdown()
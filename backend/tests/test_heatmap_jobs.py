@@ -0,0 +1,103 @@
+# tests/test_heatmap_jobs.py
+import io
+
+import pytest
+from PIL import Image
+from sqlalchemy.exc import IntegrityError
+
+from app.api import prediction
+from app.api.ai import heatmap_jobs
+from app.auth import crud
+from app.auth.models import AnalysisHistory
+from app.auth.schemas import PatientCreate
+from app.storage import get_storage, store_source
+
+
+def png_bytes(color: int = 128) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("L", (32, 32), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture()
+def pending_analysis(db, user):
+    principal, headers = user
+    source = store_source(png_bytes(principal.id % 256))
+    analysis_id = crud.add_patient_analysis(
+        db,
+        principal.id,
+        PatientCreate(nom="Martin", prenom="Alice", age=40, sexe="feminin"),
+        "radio.png",
+        "positive",
+        91.0,
+        "high",
+        source,
+        heatmap_job={"class_id": 1, "status": "pending", "source_path": source},
+    )
+    return analysis_id, headers
+
+
+def test_pending_heatmap_reports_its_status(client, pending_analysis, monkeypatch):
+    analysis_id, headers = pending_analysis
+    monkeypatch.setattr(prediction, "HEATMAP_MODE", "deferred")
+    response = client.get(f"/predictions/{analysis_id}/heatmap", headers=headers)
+    assert response.status_code == 202
+    assert response.json() == {"id": analysis_id, "status": "pending"}
+
+
+def test_heatmap_of_another_user_is_not_found(client, pending_analysis, make_user):
+    analysis_id, _ = pending_analysis
+    _, other_headers = make_user()
+    response = client.get(f"/predictions/{analysis_id}/heatmap", headers=other_headers)
+    assert response.status_code == 404
+
+
+def test_on_demand_heatmap_is_computed_then_served(client, pending_analysis, monkeypatch, db):
+    analysis_id, headers = pending_analysis
+    rendered = []
+
+    async def fake_run_heatmap(image_bytes, class_id, key, model):
+        rendered.append(key)
+        get_storage().put(key, png_bytes(255), "image/png")
+
+    monkeypatch.setattr(prediction, "HEATMAP_MODE", "on_demand")
+    monkeypatch.setattr(heatmap_jobs, "run_heatmap", fake_run_heatmap)
+    response = client.get(f"/predictions/{analysis_id}/heatmap", headers=headers)
+    assert response.status_code == 200
+    assert len(rendered) == 1
+
+    job = crud.get_heatmap_job(db, analysis_id)
+    assert job.status == "ready"
+    assert job.heatmap_file == rendered[0]
+
+
+def test_on_demand_failure_is_recorded_and_reported(client, pending_analysis, monkeypatch, db):
+    analysis_id, headers = pending_analysis
+
+    async def failing_run_heatmap(*args):
+        raise RuntimeError("gradcam cassé")
+
+    monkeypatch.setattr(prediction, "HEATMAP_MODE", "on_demand")
+    monkeypatch.setattr(heatmap_jobs, "run_heatmap", failing_run_heatmap)
+    response = client.get(f"/predictions/{analysis_id}/heatmap", headers=headers)
+    assert response.status_code == 500
+    assert "gradcam cassé" in response.json()["detail"]
+    assert crud.get_heatmap_job(db, analysis_id).status == "failed"
+
+
+def test_analysis_and_heatmap_job_are_committed_together(db, user):
+    principal, _ = user
+    patient = PatientCreate(nom="Atomique", prenom="Test", age=50, sexe="masculin")
+    before = db.query(AnalysisHistory).filter(AnalysisHistory.user_id == principal.id).count()
+    # Job invalide (class_id obligatoire) : l'analyse n'est pas enregistrée non plus
+    with pytest.raises(IntegrityError):
+        crud.add_patient_analysis(
+            db, principal.id, patient, "radio.png", "negative", 12.0, "high", heatmap_job={"status": "pending"}
+        )
+    db.rollback()
+    assert db.query(AnalysisHistory).filter(AnalysisHistory.user_id == principal.id).count() == before
+
+    analysis_id = crud.add_patient_analysis(
+        db, principal.id, patient, "radio.png", "negative", 12.0, "high", heatmap_job={"class_id": 0}
+    )
+    assert crud.get_heatmap_job(db, analysis_id).status == "pending"
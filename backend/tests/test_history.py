@@ -0,0 +1,186 @@
+# tests/test_history.py
+import asyncio
+import threading
+from datetime import timedelta
+from email.utils import format_datetime, parsedate_to_datetime
+
+import pytest
+
+from app.api.history import decode_cursor, encode_cursor
+from app.auth import crud
+from app.auth.models import AnalysisHistory
+from app.auth.schemas import PatientCreate
+from app.events import HistoryEvents, history_events
+
+PATIENTS = [
+    PatientCreate(nom="Martin", prenom="Alice", age=40, sexe="feminin"),
+    PatientCreate(nom="Durand", prenom="Bruno", age=62, sexe="masculin"),
+]
+
+
+@pytest.fixture()
+def history(db, user):
+    """Cinq analyses, alternativement positives et négatives ; renvoie (ids du plus récent au plus ancien, en-têtes)."""
+    principal, headers = user
+    ids = [
+        crud.add_patient_analysis(
+            db,
+            principal.id,
+            PATIENTS[i % 2],
+            f"radio{i}.png",
+            "positive" if i % 2 == 0 else "negative",
+            50.0 + 10 * i,
+            "high",
+        )
+        for i in range(5)
+    ]
+    return ids[::-1], headers
+
+
+def test_cursor_round_trip(history, db):
+    ids, _ = history
+    row = db.get(AnalysisHistory, ids[0])
+    assert decode_cursor(encode_cursor(row.timestamp, row.id)) == (row.timestamp, row.id)
+
+
+def test_invalid_cursor_is_a_bad_request(client, history):
+    _, headers = history
+    assert client.get("/history/", params={"limit": 2, "cursor": "pas-un-curseur"}, headers=headers).status_code == 400
+
+
+def test_keyset_pages_cover_the_history_once(client, history):
+    ids, headers = history
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/history/", params=params, headers=headers)
+        assert response.status_code == 200
+        seen += [item["id"] for item in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert seen == ids
+
+
+def test_full_history_without_limit(client, history):
+    ids, headers = history
+    response = client.get("/history/", headers=headers)
+    assert [item["id"] for item in response.json()] == ids
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_filters_are_applied_server_side(client, history):
+    ids, headers = history
+    positives = client.get("/history/", params={"verdict": "positive"}, headers=headers).json()
+    assert [item["id"] for item in positives] == [ids[0], ids[2], ids[4]]
+
+    confident = client.get("/history/", params={"min_probability": 80}, headers=headers).json()
+    assert [item["probability"] for item in confident] == [90.0, 80.0]
+
+    bruno = client.get("/history/", params={"patient": "Dur"}, headers=headers).json()
+    assert {item["patient"]["prenom"] for item in bruno} == {"Bruno"}
+    assert len(bruno) == 2
+
+
+def test_history_is_private(client, history, make_user):
+    _, other_headers = make_user()
+    assert client.get("/history/", headers=other_headers).json() == []
+
+
+def add_analyses(db, principal, count: int) -> list[int]:
+    return [
+        crud.add_patient_analysis(db, principal.id, PATIENTS[0], "nouvelle.png", "negative", 20.0, "high")
+        for _ in range(count)
+    ]
+
+
+def test_unchanged_history_is_not_modified(client, history):
+    _, headers = history
+    first = client.get("/history/", headers=headers)
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "private, no-cache"
+    response = client.get("/history/", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert client.get("/history/", headers={**headers, "If-None-Match": f'"autre", {etag}'}).status_code == 304
+
+
+def test_new_analysis_changes_the_etag(client, db, history, user):
+    principal, headers = user
+    etag = client.get("/history/", headers=headers).headers["ETag"]
+    add_analyses(db, principal, 1)
+    response = client.get("/history/", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_if_modified_since(client, history):
+    _, headers = history
+    last_modified = client.get("/history/", headers=headers).headers["Last-Modified"]
+    assert client.get("/history/", headers={**headers, "If-Modified-Since": last_modified}).status_code == 304
+    earlier = format_datetime(parsedate_to_datetime(last_modified) - timedelta(seconds=1), usegmt=True)
+    assert client.get("/history/", headers={**headers, "If-Modified-Since": earlier}).status_code == 200
+    assert client.get("/history/", headers={**headers, "If-Modified-Since": "pas une date"}).status_code == 200
+
+
+def test_empty_history_has_an_etag_but_no_sync_cursor(client, user):
+    _, headers = user
+    response = client.get("/history/", headers=headers)
+    assert response.headers["ETag"].endswith('-0"')
+    assert "X-Sync-Cursor" not in response.headers
+
+
+def test_since_returns_only_newer_analyses_oldest_first(client, db, history, user):
+    principal, headers = user
+    cursor = client.get("/history/", headers=headers).headers["X-Sync-Cursor"]
+    new_ids = add_analyses(db, principal, 3)
+
+    page = client.get("/history/", params={"since": cursor, "limit": 2}, headers=headers)
+    assert [item["id"] for item in page.json()] == new_ids[:2]
+    rest = client.get("/history/", params={"since": page.headers["X-Sync-Cursor"]}, headers=headers)
+    assert [item["id"] for item in rest.json()] == new_ids[2:]
+
+    # Déjà à jour : liste vide, curseur inchangé
+    cursor = rest.headers["X-Sync-Cursor"]
+    response = client.get("/history/", params={"since": cursor}, headers=headers)
+    assert response.json() == []
+    assert response.headers["X-Sync-Cursor"] == cursor
+
+
+def test_published_events_reach_the_subscribers_of_the_user():
+    events = HistoryEvents(queue_size=2)
+
+    async def scenario():
+        mine, other = events.subscribe(1), events.subscribe(2)
+        # Publication depuis un autre thread, comme après un commit via run_sync
+        thread = threading.Thread(target=lambda: [events.publish(1, {"ids": [i]}) for i in range(3)])
+        thread.start()
+        thread.join()
+        await asyncio.sleep(0)
+        received = [mine.get_nowait() for _ in range(mine.qsize())]
+        count = events.subscriber_count()
+        events.unsubscribe(1, mine)
+        events.unsubscribe(2, other)
+        return received, other.empty(), count
+
+    received, other_empty, count = asyncio.run(scenario())
+    # File pleine (client trop lent) : les événements suivants sont perdus
+    assert received == [{"ids": [0]}, {"ids": [1]}]
+    assert other_empty
+    assert count == 2
+    assert events.subscriber_count() == 0
+
+
+def test_committed_analyses_are_published(db, user):
+    principal, _ = user
+
+    async def scenario():
+        queue = history_events.subscribe(principal.id)
+        try:
+            analysis_ids = await asyncio.to_thread(add_analyses, db, principal, 1)
+            return analysis_ids, await asyncio.wait_for(queue.get(), 1)
+        finally:
+            history_events.unsubscribe(principal.id, queue)
+
+    analysis_ids, event = asyncio.run(scenario())
+    assert event == {"type": "analyses", "ids": analysis_ids}
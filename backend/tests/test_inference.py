@@ -0,0 +1,100 @@
+# tests/test_inference.py
+import asyncio
+import threading
+
+import pytest
+
+from app.inference import InferenceEngine
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_submit_requires_started_engine():
+    engine = InferenceEngine(lambda items: items)
+    with pytest.raises(RuntimeError):
+        run(engine.submit(1))
+
+
+def test_concurrent_submits_are_batched_and_answered_in_order():
+    batches = []
+
+    def run_batch(items):
+        batches.append(list(items))
+        return [item * 10 for item in items]
+
+    engine = InferenceEngine(run_batch, max_batch_size=4, max_wait_ms=200)
+    engine.start()
+    try:
+
+        async def main():
+            return await asyncio.gather(*(engine.submit(i) for i in range(6)))
+
+        results = run(main())
+    finally:
+        engine.stop()
+
+    assert results == [i * 10 for i in range(6)]
+    assert [len(batch) for batch in batches] == [4, 2]
+    assert sorted(item for batch in batches for item in batch) == list(range(6))
+
+
+def test_batch_error_is_raised_for_every_item_of_the_batch():
+    def run_batch(items):
+        raise ValueError("boom")
+
+    engine = InferenceEngine(run_batch, max_batch_size=8, max_wait_ms=100)
+    engine.start()
+    try:
+
+        async def main():
+            return await asyncio.gather(*(engine.submit(i) for i in range(3)), return_exceptions=True)
+
+        results = run(main())
+    finally:
+        engine.stop()
+
+    assert len(results) == 3
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_engine_keeps_serving_after_a_failed_batch():
+    calls = []
+
+    def run_batch(items):
+        calls.append(items)
+        if len(calls) == 1:
+            raise RuntimeError("first batch fails")
+        return items
+
+    engine = InferenceEngine(run_batch, max_batch_size=1, max_wait_ms=0)
+    engine.start()
+    try:
+        with pytest.raises(RuntimeError):
+            run(engine.submit("a"))
+        assert run(engine.submit("b")) == "b"
+    finally:
+        engine.stop()
+
+
+def test_stop_processes_pending_batch_then_joins_threads():
+    release = threading.Event()
+
+    def run_batch(items):
+        release.wait(5)
+        return items
+
+    engine = InferenceEngine(run_batch, max_batch_size=2, max_wait_ms=50)
+    engine.start()
+
+    async def main():
+        task = asyncio.ensure_future(engine.submit("x"))
+        await asyncio.sleep(0.01)
+        release.set()
+        return await task
+
+    assert run(main()) == "x"
+    engine.stop()
+    assert engine._threads == []
+    assert engine.queue_depth() == 0
@@ -0,0 +1,85 @@
+# tests/test_limits.py
+import asyncio
+import io
+
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+from PIL import Image
+from starlette.datastructures import UploadFile
+
+from app import limits
+from app.api.ai.pipeline import INPUT_SIZE, load_image
+
+
+@pytest.fixture()
+def limited():
+    inner = FastAPI()
+
+    @inner.post("/{path:path}")
+    async def echo(request: Request):
+        return {"size": len(await request.body())}
+
+    app = limits.BodySizeLimitMiddleware(inner, max_bytes=10, limits={"/predictions/predict": 100})
+    return TestClient(app)
+
+
+def test_body_under_the_route_cap_is_accepted(limited):
+    assert limited.post("/predictions/predict", content=b"x" * 50).json() == {"size": 50}
+
+
+def test_default_cap_applies_to_other_routes(limited):
+    response = limited.post("/login", content=b"x" * 50)
+    assert response.status_code == 413
+    assert "10 octets" in response.json()["detail"]
+
+
+def test_route_cap_is_enforced(limited):
+    assert limited.post("/predictions/predict", content=b"x" * 101).status_code == 413
+
+
+def test_chunked_body_is_cut_at_the_cap(limited):
+    def chunks():
+        for _ in range(20):
+            yield b"x" * 10
+
+    assert limited.post("/predictions/predict", content=chunks()).status_code == 413
+
+
+@pytest.mark.parametrize("value", [b"abc", b"-1", b"1e3"])
+def test_invalid_content_length_is_a_bad_request(value):
+    sent = []
+
+    async def inner(scope, receive, send):
+        pytest.fail("requête transmise à l'application")
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "path": "/predictions/predict", "headers": [(b"content-length", value)]}
+    asyncio.run(limits.BodySizeLimitMiddleware(inner)(scope, receive, send))
+    assert sent[0]["status"] == 400
+
+
+def test_route_caps_follow_the_upload_limit():
+    assert limits.ROUTE_LIMITS["/predictions/predict"] == limits.MAX_UPLOAD_BYTES + limits.FORM_OVERHEAD_BYTES
+    assert limits.ROUTE_LIMITS["/predictions/batch"] == limits.MAX_BATCH_TOTAL_BYTES + limits.FORM_OVERHEAD_BYTES
+
+
+def test_read_upload_stops_past_the_limit():
+    upload = UploadFile(io.BytesIO(b"x" * (3 * limits.UPLOAD_CHUNK_BYTES)), filename="gros.png")
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(limits.read_upload(upload, limits.UPLOAD_CHUNK_BYTES))
+    assert exc.value.status_code == 413
+    assert upload.file.tell() == 2 * limits.UPLOAD_CHUNK_BYTES
+
+
+def test_jpeg_is_decoded_near_the_model_input_size():
+    buffer = io.BytesIO()
+    Image.new("RGB", (2048, 2048), (90, 90, 90)).save(buffer, format="JPEG")
+    image, tensor = load_image(buffer.getvalue())
+    assert tensor.shape == (3, *INPUT_SIZE[::-1])
+    assert image.size == INPUT_SIZE
@@ -0,0 +1,108 @@
+# tests/test_metrics.py
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import metrics
+from app.inference import InferenceEngine
+
+
+def test_counter_and_gauge_render_with_labels():
+    counter = metrics.Counter("t_total", "Compteur", ("op",))
+    counter.inc("a")
+    counter.inc("a", amount=2)
+    gauge = metrics.Gauge("t_gauge", "Jauge")
+    gauge.inc()
+    gauge.dec()
+    assert counter.collect()[-1] == 't_total{op="a"} 3.0'
+    assert gauge.collect()[-1] == "t_gauge 0.0"
+    assert counter.collect()[:2] == ["# HELP t_total Compteur", "# TYPE t_total counter"]
+
+
+def test_label_values_are_escaped():
+    counter = metrics.Counter("t_escaped_total", "Échappement", ("path",))
+    counter.inc('C:\\radio "a"\nb')
+    assert counter.collect()[-1] == 't_escaped_total{path="C:\\\\radio \\"a\\"\\nb"} 1.0'
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("t_seconds", "Durées", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, "decode")
+    lines = histogram.collect()[2:]
+    assert lines == [
+        't_seconds_bucket{stage="decode",le="0.1"} 1',
+        't_seconds_bucket{stage="decode",le="1.0"} 2',
+        't_seconds_bucket{stage="decode",le="+Inf"} 3',
+        't_seconds_sum{stage="decode"} 5.55',
+        't_seconds_count{stage="decode"} 3',
+    ]
+
+
+def test_failing_callback_does_not_break_the_export(monkeypatch):
+    monkeypatch.setattr(metrics, "_registry", [metrics.CallbackMetric("t_broken", "Cassée", lambda: 1 / 0)])
+    assert metrics.render().startswith("# t_broken indisponible")
+
+
+def test_worker_stages_are_buffered_then_replayed(monkeypatch):
+    monkeypatch.setattr(metrics, "_buffer", None)
+    metrics.buffer_stages()
+    with metrics.timed("t_worker_stage"):
+        pass
+    samples = metrics.drain_stages()
+    assert [stage for stage, _ in samples] == ["t_worker_stage"]
+    assert metrics.drain_stages() == []
+
+    monkeypatch.setattr(metrics, "_buffer", None)
+    metrics.replay_stages(samples)
+    assert any('stage="t_worker_stage"' in line for line in metrics.stage_seconds.collect())
+
+
+def test_server_timing_lists_the_request_stages():
+    inner = FastAPI()
+
+    @inner.get("/work")
+    def work():
+        with metrics.timed("decode"):
+            pass
+        return {}
+
+    client = TestClient(metrics.MetricsMiddleware(inner, server_timing=True))
+    header = client.get("/work").headers["server-timing"]
+    assert header.startswith("decode;dur=")
+    assert ", app;dur=" in header
+
+
+def test_server_timing_includes_the_stages_of_the_inference_threads():
+    def run_batch(items):
+        with metrics.timed("forward"):
+            pass
+        return items
+
+    engine = InferenceEngine(run_batch, max_wait_ms=0)
+    inner = FastAPI()
+
+    @inner.get("/predict")
+    async def predict():
+        return {"result": await engine.submit(1)}
+
+    engine.start()
+    try:
+        client = TestClient(metrics.MetricsMiddleware(inner, server_timing=True))
+        response = client.get("/predict")
+    finally:
+        engine.stop()
+    assert response.json() == {"result": 1}
+    assert response.headers["server-timing"].startswith("forward;dur=")
+
+
+def test_metrics_endpoint(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'pneumonie_queue_depth{queue="predict"}' in response.text
+    assert "# TYPE pneumonie_http_request_seconds histogram" in response.text
+
+
+def test_profiler_routes_are_hidden_by_default(client, user):
+    _, headers = user
+    assert client.get("/metrics/profiler", headers=headers).status_code == 404
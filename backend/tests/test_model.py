@@ -0,0 +1,47 @@
+# tests/test_model.py
+import os
+
+import pytest
+import torch
+
+from app.model import ImprovedDenseNet121, load_model, weights_version
+
+
+@pytest.fixture(scope="module")
+def weights(tmp_path_factory):
+    torch.manual_seed(0)
+    model = ImprovedDenseNet121().eval()
+    path = tmp_path_factory.mktemp("weights") / "model.pth"
+    torch.save(model.state_dict(), path)
+    return model, str(path)
+
+
+def test_load_model_restores_the_saved_weights(weights):
+    reference, path = weights
+    loaded = load_model(path)
+    assert not loaded.training
+    batch = torch.randn(1, 3, 64, 64)
+    with torch.no_grad():
+        assert torch.allclose(loaded(batch), reference(batch), atol=1e-6)
+
+
+def test_loaded_parameters_are_materialised(weights):
+    _, path = weights
+    loaded = load_model(path)
+    assert all(parameter.device.type == "cpu" for parameter in loaded.parameters())
+
+
+def test_weights_version_changes_with_the_file(tmp_path):
+    path = tmp_path / "w.pth"
+    path.write_bytes(b"a")
+    first = weights_version(str(path))
+    assert weights_version(str(path)) == first
+    path.write_bytes(b"ab")
+    os.utime(path, ns=(1, 1))
+    assert weights_version(str(path)) != first
+
+
+def test_ready_without_preload(client):
+    body = client.get("/ready").json()
+    assert body["ready"] is True
+    assert body["model_loaded"] is False
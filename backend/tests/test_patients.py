@@ -0,0 +1,134 @@
+# tests/test_patients.py
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+
+from app.auth import crud
+from app.auth.models import PATIENT_IDENTITY_INDEX, AnalysisHistory, Patient
+from app.auth.schemas import PatientCreate
+from app.database import Base
+from app.migrate import migrate
+
+
+def patient(nom="Durand", prenom="Paul", age=52, sexe="masculin") -> PatientCreate:
+    return PatientCreate(nom=nom, prenom=prenom, age=age, sexe=sexe)
+
+
+def test_same_identity_gets_the_same_patient(app, db):
+    first = crud.get_or_create_patients(db, [patient(), patient(nom="Moreau")])
+    db.commit()
+    again = crud.get_or_create_patients(db, [patient(), patient(), patient(age=53)])
+    db.commit()
+    assert again[crud.patient_key(patient())] == first[crud.patient_key(patient())]
+    assert len(set(again.values())) == 2
+    assert crud.create_patient(db, patient()).id == first[crud.patient_key(patient())]
+
+
+def test_lookups_are_chunked(app, db, monkeypatch):
+    monkeypatch.setattr(crud, "PATIENT_LOOKUP_CHUNK", 2)
+    patients = [patient(prenom=f"Enfant{i}", age=i) for i in range(5)]
+    ids = crud.get_or_create_patients(db, patients)
+    db.commit()
+    assert crud.get_or_create_patients(db, patients) == ids
+    assert len(set(ids.values())) == 5
+
+
+@pytest.fixture()
+def legacy_db():
+    """Base en mémoire d'avant l'index unique : les doublons y sont possibles."""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP INDEX {PATIENT_IDENTITY_INDEX}"))
+    with sessionmaker(bind=engine)() as session:
+        yield session
+    engine.dispose()
+
+
+def add_analysis(db, patient_id):
+    db.add(
+        AnalysisHistory(
+            user_id=1,
+            patient_id=patient_id,
+            file_name="radio.png",
+            verdict="negative",
+            probability=10,
+            confidence="high",
+        )
+    )
+
+
+def test_duplicates_are_merged_on_the_oldest_patient(legacy_db):
+    rows = [Patient(**patient().dict()) for _ in range(3)]
+    rows.append(Patient(**patient(nom="Moreau").dict()))
+    # NULL n'entre pas en conflit dans l'index : ces patients sont gardés
+    rows += [Patient(nom="Anonyme", prenom="X", age=None, sexe="feminin") for _ in range(2)]
+    legacy_db.add_all(rows)
+    legacy_db.flush()
+    for row in rows:
+        add_analysis(legacy_db, row.id)
+    legacy_db.commit()
+
+    assert crud.merge_duplicate_patients(legacy_db, chunk_size=1) == 2
+    remaining = {row.id for row in legacy_db.query(Patient.id)}
+    assert remaining == {rows[0].id, rows[3].id, rows[4].id, rows[5].id}
+    patient_ids = [row.patient_id for row in legacy_db.query(AnalysisHistory.patient_id)]
+    assert patient_ids.count(rows[0].id) == 3
+    assert len(patient_ids) == 6
+
+
+def test_migration_merges_duplicates_then_creates_the_index(legacy_db):
+    bind = legacy_db.get_bind()
+    with bind.begin() as connection:
+        connection.execute(text("DROP INDEX ix_analysis_history_source_key"))
+        connection.execute(text("ALTER TABLE analysis_history DROP COLUMN source_key"))
+    legacy_db.add_all([Patient(**patient().dict()) for _ in range(2)])
+    legacy_db.commit()
+
+    assert migrate(bind) == 1
+    assert PATIENT_IDENTITY_INDEX in {index["name"] for index in inspect(bind).get_indexes("patients")}
+    assert "source_key" in {column["name"] for column in inspect(bind).get_columns("analysis_history")}
+    # Base à jour : rien à refaire
+    assert migrate(bind) == 0
+
+
+def test_merge_is_skipped_once_the_index_exists(app, db):
+    assert crud.merge_duplicate_patients(db) == 0
+
+
+@pytest.fixture()
+def timeline(db, user):
+    """Trois analyses d'un même patient ; renvoie (id du patient, ids du plus récent au plus ancien, en-têtes)."""
+    principal, headers = user
+    identity = patient(prenom=f"Suivi{principal.id}")
+    ids = [
+        crud.add_patient_analysis(db, principal.id, identity, f"radio{i}.png", "negative", 12.0, "high")
+        for i in range(3)
+    ]
+    patient_id = crud.get_or_create_patients(db, [identity])[crud.patient_key(identity)]
+    return patient_id, ids[::-1], headers
+
+
+def test_patient_timeline_is_paginated(client, timeline):
+    patient_id, ids, headers = timeline
+    first = client.get(f"/patients/{patient_id}/analyses", params={"limit": 2}, headers=headers)
+    assert first.status_code == 200
+    assert [item["id"] for item in first.json()] == ids[:2]
+    cursor = first.headers["X-Next-Cursor"]
+    rest = client.get(f"/patients/{patient_id}/analyses", params={"limit": 2, "cursor": cursor}, headers=headers)
+    assert [item["id"] for item in rest.json()] == ids[2:]
+    assert "X-Next-Cursor" not in rest.headers
+
+
+def test_patient_timeline_is_scoped_to_the_user(client, timeline, make_user):
+    patient_id, _, _ = timeline
+    _, other_headers = make_user()
+    response = client.get(f"/patients/{patient_id}/analyses", headers=other_headers)
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+def test_unknown_patient_is_not_found(client, user):
+    _, headers = user
+    assert client.get("/patients/999999/analyses", headers=headers).status_code == 404
+    assert client.get("/patients/1/analyses").status_code == 401
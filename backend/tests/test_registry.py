@@ -0,0 +1,76 @@
+# tests/test_registry.py
+import json
+import os
+
+import pytest
+
+from app import model as model_module
+from app.model import DEFAULT_MODEL_NAME, ModelRegistry
+
+
+@pytest.fixture()
+def weights(tmp_path):
+    paths = {}
+    for name, content in (("a", b"a"), ("b", b"bb")):
+        path = tmp_path / f"{name}.pth"
+        path.write_bytes(content)
+        paths[name] = str(path)
+    return paths
+
+
+@pytest.fixture()
+def registry(tmp_path, weights):
+    return ModelRegistry(str(tmp_path / "registry.json"), weights["a"], max_loaded=1, watch_interval=0)
+
+
+def test_default_model_is_active_without_a_state_file(registry, weights):
+    active = registry.active()
+    assert (active.name, active.path) == (DEFAULT_MODEL_NAME, weights["a"])
+
+
+def test_activate_and_shadow_are_persisted(registry, weights):
+    registry.update(models={"v2": weights["b"]}, active="v2", shadow=DEFAULT_MODEL_NAME, shadow_rate=0.25)
+    assert registry.active().name == "v2"
+    candidate, rate = registry.shadow()
+    assert (candidate.name, rate) == (DEFAULT_MODEL_NAME, 0.25)
+    with open(registry.state_file) as f:
+        # Le modèle par défaut vient de MODEL_PATH, jamais du fichier
+        assert json.load(f)["models"] == {"v2": weights["b"]}
+    assert registry.find_version(registry.active().version).name == "v2"
+
+
+def test_unknown_active_model_keeps_the_previous_state(registry, tmp_path):
+    registry.active()
+    with open(registry.state_file, "w") as f:
+        json.dump({"models": {"v3": str(tmp_path / "absent.pth")}, "active": "v3"}, f)
+    registry.refresh(force=True)
+    assert registry.active().name == DEFAULT_MODEL_NAME
+
+
+def test_replaced_weights_change_the_version(registry, weights):
+    before = registry.active().version
+    with open(weights["a"], "wb") as f:
+        f.write(b"nouveaux poids")
+    os.utime(weights["a"], ns=(1, 1))
+    registry.refresh(force=True)
+    assert registry.active().version != before
+
+
+def test_loaded_models_are_bounded_and_keep_the_active_one(registry, weights, monkeypatch):
+    monkeypatch.setattr(model_module, "load_model", lambda path: object())
+    registry.update(models={"v2": weights["b"]})
+    active, other = registry.active(), registry.resolve("v2")
+    registry.get(active)
+    registry.get(other)
+    # Un seul modèle gardé (max_loaded=1) : le modèle actif n'est jamais évincé
+    assert registry.is_loaded(active)
+    assert not registry.is_loaded(other)
+
+    # Objets dérivés créés une fois par modèle chargé
+    built = []
+
+    def factory(loaded):
+        built.append(loaded)
+        return len(built)
+
+    assert registry.cached(active, "backend", factory) == registry.cached(active, "backend", factory) == 1
@@ -0,0 +1,122 @@
+# tests/test_score.py
+import io
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+from app import score
+from app.auth.models import AnalysisHistory
+
+
+def png(shade: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("L", (16, 16), shade).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture()
+def archive(tmp_path):
+    root = tmp_path / "archive"
+    (root / "b").mkdir(parents=True)
+    (root / "a.png").write_bytes(png(10))
+    (root / "b" / "c.png").write_bytes(png(20))
+    (root / "notes.txt").write_text("ignoré")
+    return str(root)
+
+
+def test_image_paths_are_sorted_and_resume_after_the_cursor(archive):
+    paths = score.list_image_paths(archive)
+    assert [os.path.relpath(path, archive) for path in paths] == ["a.png", os.path.join("b", "c.png")]
+    assert score.list_image_paths(archive, after=paths[0]) == paths[1:]
+
+
+def test_dataset_returns_the_content_addressed_source_key(archive):
+    paths = score.list_image_paths(archive)
+    index, tensor, error, key = score.ImageFolderDataset(paths)[0]
+    assert (index, error) == (0, None)
+    assert tensor is not None
+    assert key.startswith("sources/") and key.endswith(".png")
+
+
+def write_manifest(tmp_path, lines: list[str]) -> str:
+    path = tmp_path / "patients.csv"
+    path.write_text("\n".join(["file,nom,prenom,age,sexe", *lines]) + "\n")
+    return str(path)
+
+
+def test_manifest_maps_images_to_patients(archive, tmp_path):
+    manifest = write_manifest(tmp_path, ["b/c.png,Martin,Paul,54,M"])
+    patients = score.read_manifest(manifest, archive)
+    patient = patients[os.path.join(archive, "b", "c.png")]
+    assert (patient.nom, patient.age) == ("Martin", 54)
+
+
+def test_invalid_manifest_line_is_reported(archive, tmp_path):
+    manifest = write_manifest(tmp_path, ["a.png,Martin,Paul,inconnu,M"])
+    with pytest.raises(SystemExit, match="ligne 2"):
+        score.read_manifest(manifest, archive)
+
+
+def test_to_db_requires_a_manifest(monkeypatch, archive, tmp_path):
+    monkeypatch.setattr(sys, "argv", ["score", archive, "--output", str(tmp_path / "out"), "--to-db", "x"])
+    with pytest.raises(SystemExit) as exc:
+        score.main()
+    assert exc.value.code == 2
+
+
+def rows_for(paths: list[str]) -> list[dict]:
+    rows = []
+    for path in paths:
+        _, _, _, key = score.ImageFolderDataset([path])[0]
+        row = dict.fromkeys(score.COLUMNS, None)
+        row.update(
+            path=path,
+            file_name=os.path.basename(path),
+            source_key=key,
+            verdict="NORMAL",
+            probability=0.9,
+            confidence="Haute",
+            model_version="v-test",
+        )
+        rows.append(row)
+    return rows
+
+
+def test_save_to_db_is_idempotent_on_resume(archive, tmp_path, user, db):
+    principal, _ = user
+    manifest = write_manifest(tmp_path, ["a.png,Martin,Paul,54,M"])
+    patients = score.read_manifest(manifest, archive)
+    rows = rows_for(score.list_image_paths(archive))
+
+    # Seule l'image présente dans le manifeste est enregistrée
+    assert score.save_to_db(principal.username, rows, patients) == 1
+    # Reprise après un arrêt avant le checkpoint : rien n'est inséré deux fois
+    assert score.save_to_db(principal.username, rows, patients) == 0
+
+    histories = db.query(AnalysisHistory).filter(AnalysisHistory.user_id == principal.id).all()
+    assert len(histories) == 1
+    assert histories[0].source_key == rows[0]["source_key"]
+    assert histories[0].patient.nom == "Martin"
+
+
+def test_parquet_parts_share_one_schema(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    failed = dict.fromkeys(score.COLUMNS, None) | {"path": "a.png", "file_name": "a.png", "error": "illisible"}
+    scored = dict.fromkeys(score.COLUMNS, None) | {
+        "path": "b.png",
+        "file_name": "b.png",
+        "source_key": "sources/ab/ab.png",
+        "prob_normal": 0.2,
+        "prob_pneumonia": 0.8,
+        "verdict": "positive",
+        "probability": 80.0,
+        "confidence": "high",
+        "model_version": "v1",
+    }
+    score.write_part(str(tmp_path), 0, [failed], "parquet")
+    score.write_part(str(tmp_path), 1, [scored], "parquet")
+    schemas = [pq.read_schema(str(tmp_path / f"part-00000{i}.parquet")) for i in range(2)]
+    assert schemas[0] == schemas[1]
+    assert pq.ParquetDataset(str(tmp_path)).read().num_rows == 2
@@ -0,0 +1,99 @@
+# tests/test_stats.py
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import stats
+from app.auth import crud
+from app.auth.models import AnalysisHistory, AnalysisStatsRollup, Patient, User
+from app.auth.schemas import PatientCreate
+from app.database import Base, SessionLocal
+
+ALICE = PatientCreate(nom="Martin", prenom="Alice", age=42, sexe="feminin")
+BRUNO = PatientCreate(nom="Durand", prenom="Bruno", age=85, sexe="masculin")
+
+
+@pytest.mark.parametrize(
+    "age, bucket", [(None, "inconnu"), (0, "0-9"), (42, "40-49"), (79, "70-79"), (80, "80+"), (-3, "0-9")]
+)
+def test_age_buckets(age, bucket):
+    assert stats.age_bucket(age) == bucket
+
+
+def test_rollup_is_upserted_per_bucket(db, user):
+    principal, _ = user
+    crud.add_patient_analysis(db, principal.id, ALICE, "a.png", "positive", 80.0, "high")
+    crud.add_patient_analysis(db, principal.id, ALICE, "b.png", "positive", 90.0, "high")
+    crud.add_patient_analysis(db, principal.id, BRUNO, "c.png", "negative", 60.0, "medium")
+
+    rows = db.query(AnalysisStatsRollup).filter(AnalysisStatsRollup.user_id == principal.id).all()
+    by_bucket = {(row.verdict, row.age_bucket): (row.count, row.probability_sum) for row in rows}
+    assert by_bucket == {("positive", "40-49"): (2, 170.0), ("negative", "80+"): (1, 60.0)}
+
+
+def test_stats_endpoint_aggregates_the_rollup(client, db, user):
+    principal, headers = user
+    crud.add_patient_analysis(db, principal.id, ALICE, "a.png", "positive", 80.0, "high")
+    crud.add_patient_analysis(db, principal.id, BRUNO, "c.png", "negative", 60.0, "medium")
+
+    body = client.get("/history/stats", headers=headers).json()
+    assert body["total"] == 2
+    assert body["average_probability"] == 70.0
+    assert body["by_verdict"] == {"positive": 1, "negative": 1}
+    assert body["daily"] == [{"day": datetime.utcnow().date().isoformat(), "count": 2, "positive": 1, "negative": 1}]
+    assert [entry["sexe"] for entry in body["by_sexe"]] == ["feminin", "masculin"]
+
+
+def test_stats_cache_is_invalidated_after_the_commit(db, user, monkeypatch):
+    principal, _ = user
+    monkeypatch.setattr(stats.stats_cache, "ttl", 60)
+    stats.stats_cache.put((principal.id, None, None), {"total": 0})
+    visible_at_invalidation = []
+    invalidate = stats.stats_cache.invalidate
+
+    def spying_invalidate(user_id):
+        # Une autre session doit déjà voir l'analyse : sinon elle remettrait en cache des chiffres périmés
+        with SessionLocal() as other:
+            visible_at_invalidation.append(other.query(AnalysisHistory).filter_by(user_id=user_id).count())
+        invalidate(user_id)
+
+    monkeypatch.setattr(stats.stats_cache, "invalidate", spying_invalidate)
+    crud.add_patient_analysis(db, principal.id, ALICE, "a.png", "positive", 80.0, "high")
+    assert visible_at_invalidation == [1]
+    assert stats.stats_cache.get((principal.id, None, None)) is None
+
+
+@pytest.fixture()
+def fresh_db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as session:
+        yield session
+
+
+def test_backfill_builds_the_rollup_once(fresh_db):
+    user = User(username="u", hashed_password="x")
+    patient = Patient(**ALICE.dict())
+    fresh_db.add_all([user, patient])
+    fresh_db.flush()
+    fresh_db.add_all(
+        AnalysisHistory(
+            user_id=user.id,
+            patient_id=patient.id,
+            file_name=f"{i}.png",
+            verdict="positive",
+            probability=50.0,
+            confidence="high",
+            timestamp=datetime(2026, 1, 5),
+        )
+        for i in range(3)
+    )
+    fresh_db.commit()
+
+    assert stats.backfill_rollup(fresh_db) == 3
+    assert stats.compute_stats(fresh_db, user.id)["by_verdict"] == {"positive": 3}
+    # Rollup déjà construit : une seconde exécution ne compte rien deux fois
+    assert stats.backfill_rollup(fresh_db) == 0
+    assert stats.compute_stats(fresh_db, user.id)["total"] == 3
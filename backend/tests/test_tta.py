@@ -0,0 +1,132 @@
+# tests/test_tta.py
+import asyncio
+import os
+
+import pytest
+import torch
+
+from app.api import prediction
+from app.api.ai import pipeline
+from app.model import ModelVersion
+
+V1 = ModelVersion("default", "a.pth", "v1")
+V2 = ModelVersion("v2", "b.pth", "v2")
+
+
+def test_augmented_views_keep_the_input_shape():
+    tensor = torch.arange(3 * 8 * 8, dtype=torch.float32).view(3, 8, 8)
+    views = pipeline.augment_views(tensor, ["identity", "hflip", "crop50"])
+    assert views.shape == (3, 3, 8, 8)
+    assert torch.equal(views[0], tensor)
+    assert torch.equal(views[1], tensor.flip(-1))
+
+
+def test_crop_of_a_uniform_image_is_unchanged():
+    tensor = torch.full((3, 16, 16), 0.5)
+    assert torch.allclose(pipeline.augment_views(tensor, ["crop80"])[0], tensor)
+
+
+def test_unknown_view_is_rejected():
+    with pytest.raises(ValueError):
+        pipeline.augment_views(torch.zeros(3, 8, 8), ["rotate90"])
+
+
+def test_tta_variant_follows_the_configuration(monkeypatch):
+    monkeypatch.setattr(pipeline, "TTA_ENABLED", False)
+    assert pipeline.tta_variant(V1) == ""
+    monkeypatch.setattr(pipeline, "TTA_ENABLED", True)
+    first = pipeline.tta_variant(V1)
+    assert first.startswith("-tta")
+    monkeypatch.setattr(pipeline, "TTA_THRESHOLD", 0.9)
+    assert pipeline.tta_variant(V1) != first
+
+
+def test_ensemble_skips_unknown_versions(monkeypatch):
+    def resolve(name):
+        if name != "v2":
+            raise KeyError(name)
+        return V2
+
+    monkeypatch.setattr(pipeline, "TTA_ENSEMBLE", ["absent", "v2", "default"])
+    monkeypatch.setattr(pipeline.registry, "resolve", resolve)
+    assert pipeline.tta_versions(V1) == (V1, V2)
+
+
+def test_tta_averages_views_and_models_in_one_pass_per_model(monkeypatch):
+    monkeypatch.setattr(pipeline, "TTA_VIEWS", ["identity", "hflip"])
+    monkeypatch.setattr(pipeline, "decode_batch", lambda images: [(None, torch.zeros(3, 8, 8)) for _ in images])
+    calls = []
+
+    def get_backend(version):
+        def backend(views):
+            calls.append((version, len(views)))
+            # Logits opposés selon le modèle : la moyenne vaut 0,5 / 0,5
+            logit = 2.0 if version == V1 else -2.0
+            return torch.tensor([[logit, 0.0]] * len(views))
+
+        return backend
+
+    monkeypatch.setattr(pipeline, "get_backend", get_backend)
+    probs = pipeline.predict_tta_images([b"a", b"b", b"c"], (V1, V2))
+    assert calls == [(V1, 6), (V2, 6)]
+    assert probs == [pytest.approx([0.5, 0.5])] * 3
+
+
+@pytest.fixture()
+def engines(monkeypatch):
+    """Premier passage et second passage factices ; renvoie la liste des appels TTA."""
+    tta_calls = []
+    first_pass = {"probs": [0.6, 0.4]}
+
+    async def submit(item):
+        return first_pass["probs"]
+
+    async def tta_submit(item):
+        tta_calls.append(item[0])
+        return [0.2, 0.8]
+
+    monkeypatch.setattr(prediction, "HEATMAP_MODE", "deferred")
+    monkeypatch.setattr(prediction, "TTA_ENABLED", True)
+    monkeypatch.setattr(prediction, "TTA_THRESHOLD", 0.7)
+    monkeypatch.setattr(prediction.engine, "submit", submit)
+    monkeypatch.setattr(prediction.tta_engine, "submit", tta_submit)
+    return first_pass, tta_calls
+
+
+def test_low_confidence_prediction_gets_a_second_pass(app, engines):
+    _, tta_calls = engines
+    result = asyncio.run(prediction.run_inference(os.urandom(64)))
+    assert len(tta_calls) == 1
+    assert result["probs"] == [0.2, 0.8]
+    assert result["verdict"] == "positive"
+
+
+def test_confident_prediction_skips_the_second_pass(app, engines):
+    first_pass, tta_calls = engines
+    first_pass["probs"] = [0.95, 0.05]
+    result = asyncio.run(prediction.run_inference(os.urandom(64)))
+    assert tta_calls == []
+    assert result["verdict"] == "negative"
+
+
+def test_sync_heatmap_is_redrawn_when_the_second_pass_changes_the_class(app, engines, monkeypatch):
+    first_pass, _ = engines
+    drawn = []
+
+    async def explain_submit(item):
+        return first_pass["probs"]
+
+    async def run_heatmap(image_bytes, class_id, heatmap_key, version=None):
+        drawn.append((class_id, heatmap_key))
+
+    monkeypatch.setattr(prediction, "HEATMAP_MODE", "sync")
+    monkeypatch.setattr(prediction.explain_engine, "submit", explain_submit)
+    monkeypatch.setattr(prediction, "run_heatmap", run_heatmap)
+    result = asyncio.run(prediction.run_inference(os.urandom(64)))
+    assert drawn == [(1, result["heatmap_key"])]
+
+    # Même classe après le second passage : la heatmap du premier passage est gardée
+    drawn.clear()
+    first_pass["probs"] = [0.4, 0.6]
+    asyncio.run(prediction.run_inference(os.urandom(64)))
+    assert drawn == []
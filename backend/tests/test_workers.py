@@ -0,0 +1,51 @@
+# tests/test_workers.py
+from multiprocessing import shared_memory
+
+import pytest
+
+from app import workers
+from app.model import ModelVersion
+
+V1 = ModelVersion("default", "a.pth", "v1")
+V2 = ModelVersion("v2", "b.pth", "v2")
+
+
+def test_shared_bytes_round_trip_and_unlink():
+    data = b"\x00radio\xff" * 100
+    with workers.SharedBytes(data) as shm:
+        name, size = shm.ref
+        assert size == len(data)
+        assert workers._read_shared(name, size) == data
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+
+
+def test_shared_bytes_accepts_empty_payload():
+    with workers.SharedBytes(b"") as shm:
+        assert workers._read_shared(*shm.ref) == b""
+
+
+def test_by_version_groups_items_and_keeps_request_order():
+    calls = []
+
+    def run(version, items):
+        calls.append((version, items))
+        return [f"{version.version}:{data}" for data, in items]
+
+    items = [(V1, "a"), (V2, "b"), (V1, "c")]
+    assert workers._by_version(items, run) == ["v1:a", "v2:b", "v1:c"]
+    assert calls == [(V1, [("a",), ("c",)]), (V2, [("b",)])]
+
+
+def test_run_predict_batch_without_pool_runs_in_process(monkeypatch):
+    seen = []
+
+    def predict_images(images, version):
+        seen.append((images, version))
+        return [[0.9, 0.1] for _ in images]
+
+    monkeypatch.setattr(workers, "_pool", None)
+    monkeypatch.setattr(workers.pipeline, "predict_images", predict_images)
+    assert workers.run_predict_batch([(V1, b"x"), (V1, b"y")]) == [[0.9, 0.1], [0.9, 0.1]]
+    assert seen == [([b"x", b"y"], V1)]
+
@@ -42,6 +42,7 @@ export default function DashboardPage() {
   const [previewUrl, setPreviewUrl] = useState<string | null>(null)
   const [isAnalyzing, setIsAnalyzing] = useState(false)
   const [analysisResult, setAnalysisResult] = useState<AnalysisResult | null>(null)
+  const [heatmapSrc, setHeatmapSrc] = useState<string | null>(null)
   const [isDragActive, setIsDragActive] = useState(false)
   const [showCorrectionModal, setShowCorrectionModal] = useState(false)
   const [correctionValue, setCorrectionValue] = useState<string>("")
@@ -58,6 +59,7 @@ export default function DashboardPage() {
       const url = URL.createObjectURL(file)
       setPreviewUrl(url)
       setAnalysisResult(null)
+      setHeatmapSrc(null)
     }
   }
 
@@ -159,6 +161,16 @@ formData.append('sexe', patientInfo.sexe);
 
     setAnalysisResult(result);
 
+    // /files exige le jeton : la heatmap est chargée avec l'en-tête puis affichée en blob
+    if (data.heatmap_url) {
+      const heatmapResponse = await fetch(data.heatmap_url, {
+        headers: { Authorization: `Bearer ${token}` },
+      })
+      if (heatmapResponse.ok) {
+        setHeatmapSrc(URL.createObjectURL(await heatmapResponse.blob()))
+      }
+    }
+
     // On sauvegarde dans l’historique local
     const history = JSON.parse(localStorage.getItem('analysisHistory') || '[]')
     history.unshift(result)
@@ -180,6 +192,10 @@ formData.append('sexe', patientInfo.sexe);
     setUploadedFile(null)
     setPreviewUrl(null)
     setAnalysisResult(null)
+    if (heatmapSrc) {
+      URL.revokeObjectURL(heatmapSrc)
+    }
+    setHeatmapSrc(null)
     setPatientInfo({
       nom: "",
       prenom: "",
@@ -415,7 +431,7 @@ formData.append('sexe', patientInfo.sexe);
 
                        <div className="flex justify-center mb-6">
                          <img
-                            src={analysisResult?.heatmapUrl || previewUrl || "/placeholder.svg?height=300&width=500"}
+                            src={heatmapSrc || previewUrl || "/placeholder.svg?height=300&width=500"}
                             alt="Résultat IA"
                             style={{ maxHeight: "400px", width: "100%", objectFit: "contain" }}
                             className="rounded border"